@@ -0,0 +1,28 @@
+# Generated by Django 4.2.10 on 2026-10-17 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("jobs", "0010_job_limit_job_shuffle"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="job",
+            name="shard_size",
+            field=models.IntegerField(
+                blank=True,
+                default=None,
+                help_text="Split the images into shards of this size and process each shard in a separate task",
+                null=True,
+                verbose_name="Shard size",
+            ),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="shard_task_ids",
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
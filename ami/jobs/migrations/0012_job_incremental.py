@@ -0,0 +1,21 @@
+# Generated by Django 4.2.10 on 2026-10-17 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("jobs", "0011_job_shard_size_job_shard_task_ids"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="job",
+            name="incremental",
+            field=models.BooleanField(
+                default=False,
+                help_text="Only sync the files added to the data source since the last sync of the deployment",
+                verbose_name="Incremental",
+            ),
+        ),
+    ]
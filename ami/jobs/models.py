@@ -6,7 +6,7 @@ import typing
 from dataclasses import dataclass
 
 import pydantic
-from celery import uuid
+from celery import chord, group, uuid
 from celery.result import AsyncResult
 from django.db import models, transaction
 from django.utils.text import slugify
@@ -14,9 +14,10 @@ from django_pydantic_field import SchemaField
 
 from ami.base.models import BaseModel
 from ami.base.schemas import ConfigurableStage, ConfigurableStageParam
-from ami.jobs.tasks import run_job
+from ami.jobs.tasks import fail_sharded_job, finish_sharded_job, run_job
 from ami.main.models import Deployment, Project, SourceImage, SourceImageCollection
 from ami.ml.models import Pipeline
+from ami.ml.tasks import process_source_images_async
 from ami.utils.schemas import OrderedEnum
 
 logger = logging.getLogger(__name__)
@@ -243,6 +244,18 @@ class JobLogHandler(logging.Handler):
         self.job = job
         super().__init__(*args, **kwargs)
 
+    def add_record(self, progress: "JobProgress", msg: str, record: logging.LogRecord):
+        if msg not in progress.logs:
+            progress.logs.insert(0, msg)
+
+        # Write a simpler copy of any errors to the errors field
+        if record.levelno >= logging.ERROR:
+            if record.message not in progress.errors:
+                progress.errors.insert(0, record.message)
+
+        if len(progress.logs) > self.max_log_length:
+            progress.logs = progress.logs[: self.max_log_length]
+
     def emit(self, record):
         # Log to the current app logger
         logger.log(record.levelno, self.format(record))
@@ -250,17 +263,17 @@ class JobLogHandler(logging.Handler):
         # Write to the logs field on the job instance
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         msg = f"[{timestamp}] {record.levelname} {self.format(record)}"
-        if msg not in self.job.progress.logs:
-            self.job.progress.logs.insert(0, msg)
-
-        # Write a simpler copy of any errors to the errors field
-        if record.levelno >= logging.ERROR:
-            if record.message not in self.job.progress.errors:
-                self.job.progress.errors.insert(0, record.message)
+        self.add_record(self.job.progress, msg, record)
+        if not self.job.pk:
+            return
 
-        if len(self.job.progress.logs) > self.max_log_length:
-            self.job.progress.logs = self.job.progress.logs[: self.max_log_length]
-        self.job.save()
+        # Other tasks may be updating the same job (e.g. the shards of a job), so the log is added
+        # to the latest progress while the row of the job is locked, instead of saving this copy of the job
+        with transaction.atomic():
+            job = Job.objects.select_for_update().filter(pk=self.job.pk).first()
+            if job:
+                self.add_record(job.progress, msg, record)
+                job.save(update_fields=["progress"])
 
 
 @dataclass
@@ -358,40 +371,65 @@ class MLJob(JobType):
                 progress=1,
             )
 
+            if job.shard_size and image_count > job.shard_size:
+                # The shards finish the job when the last one is done, see `finish_sharded`
+                cls.run_sharded(job, images)
+                return
+
             total_detections = 0
             total_classifications = 0
+            processed_images = 0
+            failed_images = 0
+            request_seconds = 0.0
+            request_bytes_sent = 0
+            request_bytes_received = 0
+
+            batch_size = job.pipeline.batch_size
+            num_batches = -(-image_count // batch_size)
+            job.logger.info(
+                f"Sending {image_count} images in {num_batches} batches of {batch_size}, "
+                f"{job.pipeline.max_concurrent_requests} at a time"
+            )
 
-            CHUNK_SIZE = 2  # Keep it low to see more progress updates
-            chunks = [images[i : i + CHUNK_SIZE] for i in range(0, image_count, CHUNK_SIZE)]  # noqa
-
-            for i, chunk in enumerate(chunks):
-                try:
-                    results = job.pipeline.process_images(
-                        images=chunk,
-                        job_id=job.pk,
-                    )
-                except Exception as e:
+            # The images were already filtered when they were collected.
+            # Batches are processed concurrently, but their results arrive in order.
+            for batch in job.pipeline.process_images_in_batches(images):
+                if batch.results is None:
                     # Log error about image batch and continue
-                    job.logger.error(f"Failed to process image batch {i} of {len(chunks)}: {e}")
-                    continue
+                    job.logger.error(f"Failed to process image batch {batch.index} of {num_batches}: {batch.error}")
+                    failed_images += len(batch.images)
+                else:
+                    results = batch.results
+                    processed_images += len(batch.images)
+                    total_detections += len(results.detections)
+                    total_classifications += len([c for d in results.detections for c in d.classifications])
+                    if results.detections:
+                        job.logger.info(f"Found {len(results.detections)} detections in batch {batch.index}")
+                if batch.request:
+                    request_seconds += batch.request.seconds
+                    request_bytes_sent += batch.request.bytes_sent
+                    request_bytes_received += batch.request.bytes_received
 
-                total_detections += len(results.detections)
-                total_classifications += len([c for d in results.detections for c in d.classifications])
                 job.progress.update_stage(
                     "process",
                     status=JobState.STARTED,
-                    progress=(i + 1) / len(chunks),
-                    processed=(i + 1) * CHUNK_SIZE,
-                    remaining=image_count - (i + 1) * CHUNK_SIZE,
+                    progress=(batch.index + 1) / num_batches,
+                    processed=processed_images,
+                    failed=failed_images,
+                    remaining=image_count - processed_images - failed_images,
                     detections=total_detections,
                     classifications=total_classifications,
                 )
                 job.save()
 
-                if results.source_images or results.detections:
-                    save_results_task = job.pipeline.save_results_async(results=results, job_id=job.pk)
+                if batch.results and (batch.results.source_images or batch.results.detections):
+                    save_results_task = job.pipeline.save_results_async(results=batch.results, job_id=job.pk)
                     job.logger.info(f"Saving results in sub-task {save_results_task.id}")
 
+            job.logger.info(
+                f"Waited {request_seconds:.1f} seconds in total for the ML backend, "
+                f"sent {request_bytes_sent / 1e6:.1f} MB and received {request_bytes_received / 1e6:.1f} MB"
+            )
             job.progress.update_stage(
                 "process",
                 status=JobState.SUCCESS,
@@ -406,6 +444,146 @@ class MLJob(JobType):
         job.finished_at = datetime.datetime.now()
         job.save()
 
+    @classmethod
+    def run_sharded(cls, job: "Job", images: list[SourceImage]):
+        """
+        Split the images into shards of `job.shard_size` and process each shard in its own task.
+
+        The shard tasks run on any available worker. A chord calls `finish_sharded` once all of them are done,
+        or `fail_sharded` if one of them raised an exception.
+        """
+        assert job.pipeline and job.shard_size
+        if not job.pipeline.endpoint_url:
+            raise ValueError("No endpoint URL configured for this pipeline")
+
+        image_ids = [image.pk for image in images]
+        shards = [
+            image_ids[start : start + job.shard_size]  # noqa: E203
+            for start in range(0, len(image_ids), job.shard_size)
+        ]
+        job.logger.info(f"Processing {len(image_ids)} images in {len(shards)} shards of up to {job.shard_size}")
+
+        job.shard_task_ids = [uuid() for _ in shards]
+        job.progress.update_stage(
+            "process",
+            status=JobState.STARTED,
+            progress=0,
+            processed=0,
+            failed=0,
+            remaining=len(image_ids),
+            detections=0,
+            classifications=0,
+        )
+        job.progress.add_or_update_stage_param("process", "Shards", len(shards))
+        job.save()
+
+        shard_tasks = group(
+            process_source_images_async.s(
+                pipeline_choice=job.pipeline.slug,
+                endpoint_url=job.pipeline.endpoint_url,
+                image_ids=shard,
+                job_id=job.pk,
+            ).set(task_id=task_id)
+            for shard, task_id in zip(shards, job.shard_task_ids)
+        )
+        chord(shard_tasks)(finish_sharded_job.s(job_id=job.pk).on_error(fail_sharded_job.s(job_id=job.pk)))
+
+    @classmethod
+    def update_shard_progress(
+        cls,
+        job_id: int,
+        processed: int = 0,
+        failed: int = 0,
+        detections: int = 0,
+        classifications: int = 0,
+        error: str | None = None,
+    ):
+        """
+        Add the counts of a batch from one of the shards to the "Process" stage of the job.
+
+        The shards run at the same time, so the counts are added to the latest progress
+        while the row of the job is locked, instead of saving a copy of the job that may be stale.
+        """
+        with transaction.atomic():
+            job = Job.objects.select_for_update().get(pk=job_id)
+            counts = {
+                "processed": processed,
+                "failed": failed,
+                "detections": detections,
+                "classifications": classifications,
+            }
+            for key, value in counts.items():
+                counts[key] = (job.progress.get_stage_param("process", key).value or 0) + value
+            remaining = max((job.progress.get_stage_param("process", "remaining").value or 0) - processed - failed, 0)
+            done = counts["processed"] + counts["failed"]
+            job.progress.update_stage(
+                "process",
+                status=JobState.STARTED,
+                progress=done / (done + remaining) if done + remaining else 1,
+                remaining=remaining,
+                **counts,
+            )
+            if error and error not in job.progress.errors:
+                job.progress.errors.insert(0, error)
+            job.save()
+
+    @classmethod
+    def finish_sharded(cls, job_id: int, shard_results: list[dict]):
+        """
+        Mark a sharded job as finished once all of its shards are done.
+
+        A job that was canceled in the meantime is left as it is.
+        """
+        with transaction.atomic():
+            job = Job.objects.select_for_update().get(pk=job_id)
+            if job.status in [JobState.CANCELING, JobState.REVOKED]:
+                return
+            job.progress.update_stage("process", status=JobState.SUCCESS, progress=1)
+            job.progress.update_stage("results", status=JobState.SUCCESS, progress=1)
+            job.update_status(JobState.SUCCESS, save=False)
+            job.update_progress(save=False)
+            job.finished_at = datetime.datetime.now()
+            job.save()
+
+        failed = sum(result["failed"] for result in shard_results)
+        logger.info(f"Finished {len(shard_results)} shards of job {job_id}, {failed} images failed")
+
+    @classmethod
+    def add_created_objects(cls, job_id: int, count: int):
+        """
+        Add to the number of objects created by saving the results of a job.
+
+        The results of a job are saved by several tasks at the same time, see `update_shard_progress`.
+        """
+        with transaction.atomic():
+            job = Job.objects.select_for_update().get(pk=job_id)
+            try:
+                previously_created = int(job.progress.get_stage_param("results", "objects_created").value or 0)
+            except ValueError:
+                return
+            job.progress.update_stage("results", objects_created=previously_created + count)
+            job.save(update_fields=["progress"])
+
+    @classmethod
+    def fail_sharded(cls, job_id: int, error: str):
+        """
+        Mark a sharded job as failed because one of its shards raised an exception, with the error of that shard.
+
+        A job that was canceled in the meantime is left as it is.
+        """
+        with transaction.atomic():
+            job = Job.objects.select_for_update().get(pk=job_id)
+            if job.status in [JobState.CANCELING, JobState.REVOKED]:
+                return
+            job.progress.update_stage("process", status=JobState.FAILURE)
+            if error not in job.progress.errors:
+                job.progress.errors.insert(0, error)
+            job.update_status(JobState.FAILURE, save=False)
+            job.finished_at = datetime.datetime.now()
+            job.save()
+
+        job.logger.error(f'Job #{job.pk} "{job.name}" failed: {error}')
+
 
 class DataStorageSyncJob(JobType):
     name = "Data storage sync"
@@ -428,6 +606,8 @@ class DataStorageSyncJob(JobType):
         """
 
         job.progress.add_stage_param(cls.key, "Total Files", "")
+        job.progress.add_stage_param(cls.key, "Shards", "")
+        job.progress.add_stage_param(cls.key, "Stale captures", "")
         job.update_status(JobState.STARTED)
         job.started_at = datetime.datetime.now()
         job.finished_at = None
@@ -443,7 +623,7 @@ class DataStorageSyncJob(JobType):
             )
             job.save()
 
-            job.deployment.sync_captures(job=job)
+            job.deployment.sync_captures(job=job, sharded=True, incremental=job.incremental)
 
             job.logger.info(f"Finished syncing captures for deployment {job.deployment}")
             job.progress.update_stage(
@@ -493,6 +673,19 @@ class Job(BaseModel):
         "Limit", null=True, blank=True, default=None, help_text="Limit the number of images to process"
     )
     shuffle = models.BooleanField("Shuffle", default=True, help_text="Process images in a random order")
+    shard_size = models.IntegerField(
+        "Shard size",
+        null=True,
+        blank=True,
+        default=None,
+        help_text="Split the images into shards of this size and process each shard in a separate task",
+    )
+    shard_task_ids = models.JSONField(default=list, blank=True)
+    incremental = models.BooleanField(
+        "Incremental",
+        default=False,
+        help_text="Only sync the files added to the data source since the last sync of the deployment",
+    )
 
     project = models.ForeignKey(
         Project,
@@ -559,6 +752,7 @@ class Job(BaseModel):
 
         transaction.on_commit(send_task)
         self.task_id = task_id
+        self.shard_task_ids = []
         self.started_at = None
         self.finished_at = None
         self.scheduled_at = datetime.datetime.now()
@@ -584,6 +778,7 @@ class Job(BaseModel):
             pipeline_stage = self.progress.add_stage("Process")
             self.progress.add_stage_param(pipeline_stage.key, "Processed", "")
             self.progress.add_stage_param(pipeline_stage.key, "Remaining", "")
+            self.progress.add_stage_param(pipeline_stage.key, "Failed", "")
             self.progress.add_stage_param(pipeline_stage.key, "Detections", "")
             self.progress.add_stage_param(pipeline_stage.key, "Classifications", "")
 
@@ -605,15 +800,19 @@ class Job(BaseModel):
 
     def cancel(self):
         """
-        Terminate the celery task.
+        Terminate the celery task, and the tasks of its shards if the images were split into shards.
         """
         self.status = JobState.CANCELING
         self.save()
+        if self.shard_task_ids:
+            # The chord will not call `finish_sharded` without all of its shards
+            run_job.app.control.revoke(self.shard_task_ids, terminate=True)
         if self.task_id:
             task = run_job.AsyncResult(self.task_id)
             if task:
                 task.revoke(terminate=True)
-                self.status = task.status
+                # The main task of a sharded job has already finished after sending the shards
+                self.status = JobState.REVOKED if self.shard_task_ids else task.status
                 self.save()
         else:
             self.status = JobState.REVOKED
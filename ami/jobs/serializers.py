@@ -92,6 +92,8 @@ class JobListSerializer(DefaultSerializer):
             "delay",
             "limit",
             "shuffle",
+            "shard_size",
+            "incremental",
             "project",
             "project_id",
             "deployment",
@@ -30,6 +30,23 @@ def run_job(self, job_id: int) -> None:
             job.logger.info(f"Finished job {job}")
 
 
+@celery_app.task(soft_time_limit=default_soft_time_limit, time_limit=default_time_limit)
+def finish_sharded_job(shard_results: list[dict], job_id: int) -> None:
+    from ami.jobs.models import MLJob
+
+    MLJob.finish_sharded(job_id=job_id, shard_results=shard_results)
+
+
+@celery_app.task(soft_time_limit=default_soft_time_limit, time_limit=default_time_limit)
+def fail_sharded_job(request, exc: Exception, traceback, job_id: int) -> None:
+    """
+    Called by the chord of a sharded job instead of `finish_sharded_job` if one of the shards raised an exception.
+    """
+    from ami.jobs.models import MLJob
+
+    MLJob.fail_sharded(job_id=job_id, error=f"A shard of the job failed: {exc}")
+
+
 @task_postrun.connect(sender=run_job)
 @task_prerun.connect(sender=run_job)
 def update_job_status(sender, task_id, task, *args, **kwargs):
@@ -48,6 +65,10 @@ def update_job_status(sender, task_id, task, *args, **kwargs):
             logger.error(f"No job found for task {task_id} or job_id {job_id}")
             return
 
+    if job.shard_task_ids and not job.finished_at:
+        # The shards are still running, the job is finished by `finish_sharded_job`
+        return
+
     task = AsyncResult(task_id)  # I'm not sure if this is reliable
     job.update_status(task.status, save=False)
     job.save()
@@ -2,7 +2,8 @@ from django.test import TestCase
 from rest_framework.test import APIRequestFactory, APITestCase
 
 from ami.base.serializers import reverse_with_params
-from ami.jobs.models import Job, JobProgress, JobState
+from ami.jobs.models import Job, JobProgress, JobState, MLJob
+from ami.jobs.tasks import fail_sharded_job
 from ami.main.models import Project, SourceImageCollection
 from ami.ml.models import Pipeline
 from ami.users.models import User
@@ -53,6 +54,112 @@ class TestJobProgress(TestCase):
         self.assertEqual(job.progress.stages[0].progress, 1)
         self.assertEqual(job.progress.stages[0].status, JobState.SUCCESS)
 
+    def test_sharded_job_progress(self):
+        job = Job.objects.create(
+            project=self.project,
+            name="Test sharded job",
+            pipeline=self.pipeline,
+            source_image_collection=self.source_image_collection,
+            shard_size=2,
+        )
+        job.progress.update_stage("process", processed=0, failed=0, remaining=5, detections=0, classifications=0)
+        job.update_status(JobState.STARTED)
+
+        # The counts from each shard are added to the counts of the others
+        MLJob.update_shard_progress(job.pk, processed=2, detections=3, classifications=6)
+        MLJob.update_shard_progress(job.pk, failed=1, error="Failed to process a batch of 1 images")
+        MLJob.update_shard_progress(job.pk, processed=2, detections=1, classifications=2)
+
+        job.refresh_from_db()
+        stage = job.progress.get_stage("process")
+        self.assertEqual(stage.progress, 1)
+        self.assertEqual(job.progress.get_stage_param("process", "processed").value, 4)
+        self.assertEqual(job.progress.get_stage_param("process", "failed").value, 1)
+        self.assertEqual(job.progress.get_stage_param("process", "remaining").value, 0)
+        self.assertEqual(job.progress.get_stage_param("process", "detections").value, 4)
+        self.assertEqual(job.progress.get_stage_param("process", "classifications").value, 8)
+        self.assertIn("Failed to process a batch of 1 images", job.progress.errors)
+        self.assertIsNone(job.finished_at)
+
+        MLJob.finish_sharded(job.pk, shard_results=[{"failed": 0}, {"failed": 1}, {"failed": 0}])
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobState.SUCCESS.value)
+        self.assertEqual(job.progress.summary.status, JobState.SUCCESS)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_interleaved_shards(self):
+        job = Job.objects.create(
+            project=self.project,
+            name="Test sharded job",
+            pipeline=self.pipeline,
+            source_image_collection=self.source_image_collection,
+            shard_size=2,
+        )
+        job.progress.update_stage("process", processed=0, failed=0, remaining=4, detections=0, classifications=0)
+        job.update_status(JobState.STARTED)
+
+        # Each shard reads its own copy of the job when it starts saving results
+        shard_a = Job.objects.get(pk=job.pk)
+        shard_b = Job.objects.get(pk=job.pk)
+        shard_a.logger.info("Saving results of shard A")
+        shard_b.logger.info("Saving results of shard B")
+        MLJob.update_shard_progress(job.pk, processed=2, detections=3, classifications=6)
+        shard_a.logger.info("Created 9 objects")
+        MLJob.add_created_objects(job.pk, 9)
+        MLJob.update_shard_progress(job.pk, failed=1, error="Failed to process a batch of 1 images")
+        shard_b.logger.error("Failed to save results")
+        MLJob.update_shard_progress(job.pk, processed=1, detections=1, classifications=2)
+        shard_b.logger.info("Created 3 objects")
+        MLJob.add_created_objects(job.pk, 3)
+
+        job.refresh_from_db()
+        self.assertEqual(job.progress.get_stage_param("process", "processed").value, 3)
+        self.assertEqual(job.progress.get_stage_param("process", "failed").value, 1)
+        self.assertEqual(job.progress.get_stage_param("process", "remaining").value, 0)
+        self.assertEqual(job.progress.get_stage_param("process", "detections").value, 4)
+        self.assertEqual(job.progress.get_stage_param("process", "classifications").value, 8)
+        self.assertEqual(job.progress.get_stage_param("results", "objects_created").value, 12)
+        self.assertIn("Failed to process a batch of 1 images", job.progress.errors)
+        self.assertIn("Failed to save results", job.progress.errors)
+        for message in ["Saving results of shard A", "Saving results of shard B", "Created 9 objects"]:
+            self.assertTrue(any(log.endswith(message) for log in job.progress.logs), message)
+
+    def test_canceled_sharded_job_is_not_finished(self):
+        job = Job.objects.create(
+            project=self.project,
+            name="Test sharded job",
+            pipeline=self.pipeline,
+            source_image_collection=self.source_image_collection,
+            shard_size=2,
+        )
+        job.update_status(JobState.REVOKED)
+
+        MLJob.finish_sharded(job.pk, shard_results=[])
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobState.REVOKED.value)
+        self.assertIsNone(job.finished_at)
+
+    def test_sharded_job_fails_if_a_shard_raises(self):
+        job = Job.objects.create(
+            project=self.project,
+            name="Test sharded job",
+            pipeline=self.pipeline,
+            source_image_collection=self.source_image_collection,
+            shard_size=2,
+        )
+        job.progress.update_stage("process", processed=0, failed=0, remaining=4, detections=0, classifications=0)
+        job.update_status(JobState.STARTED)
+        MLJob.update_shard_progress(job.pk, processed=2)
+
+        # The error callback of the chord is called like this by Celery when a shard raises
+        fail_sharded_job(None, RuntimeError("Connection to the ML backend lost"), None, job_id=job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobState.FAILURE.value)
+        self.assertEqual(job.progress.get_stage("process").status, JobState.FAILURE)
+        self.assertEqual(job.progress.get_stage_param("process", "processed").value, 2)
+        self.assertIn("A shard of the job failed: Connection to the ML backend lost", job.progress.errors)
+        self.assertIsNotNone(job.finished_at)
+
 
 class TestJobView(APITestCase):
     """
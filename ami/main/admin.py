@@ -1,11 +1,12 @@
 from typing import Any
 
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.db import models
 from django.db.models.query import QuerySet
 from django.http.request import HttpRequest
 from django.template.defaultfilters import filesizeformat
 from django.utils.formats import number_format
+from django.utils.html import format_html_join
 
 import ami.utils
 from ami import tasks
@@ -16,6 +17,7 @@ from .models import (
     Deployment,
     Device,
     Event,
+    LocalStorageSource,
     Occurrence,
     Project,
     S3StorageSource,
@@ -66,7 +68,14 @@ class ProjectAdmin(admin.ModelAdmin[Project]):
             task_ids.append(task.id)
         self.message_user(request, f"Started {len(task_ids)} tasks to delete classification: {task_ids}")
 
-    actions = [_remove_duplicate_classifications]
+    @admin.action(description="Update the statistics of all deployments in the project")
+    def update_deployment_stats(self, request: HttpRequest, queryset: QuerySet[Project]) -> None:
+        from ami.main.models import update_calculated_fields_for_deployments
+
+        deployments = update_calculated_fields_for_deployments(qs=Deployment.objects.filter(project__in=queryset))
+        self.message_user(request, f"Updated the statistics of {len(deployments)} deployments.")
+
+    actions = [_remove_duplicate_classifications, update_deployment_stats]
 
 
 @admin.register(Deployment)
@@ -114,6 +123,46 @@ class DeploymentAdmin(admin.ModelAdmin[Deployment]):
         msg = f"Syncing captures for {len(queued_tasks)} deployments in background: {queued_tasks}"
         self.message_user(request, msg)
 
+    @admin.action(description="Sync new captures since the last sync (async)")
+    def sync_new_captures(self, request: HttpRequest, queryset: QuerySet[Deployment]) -> None:
+        queued_tasks = [tasks.sync_source_images.delay(deployment.pk, incremental=True) for deployment in queryset]
+        msg = f"Syncing new captures for {len(queued_tasks)} deployments in background: {queued_tasks}"
+        self.message_user(request, msg)
+
+    @admin.action(description="Delete captures that are no longer in the data source")
+    def delete_stale_captures(self, request: HttpRequest, queryset: QuerySet[Deployment]) -> None:
+        num_deleted = 0
+        for deployment in queryset:
+            num_deleted += deployment.delete_stale_captures(dry_run=False)
+            deployment.save()
+        self.message_user(request, f"Deleted {num_deleted} stale captures from {queryset.count()} deployments.")
+
+    @admin.action(description="Delete events without captures or occurrences")
+    def delete_empty_events(self, request: HttpRequest, queryset: QuerySet[Deployment]) -> None:
+        from ami.main.models import delete_empty_events
+
+        num_deleted = sum(delete_empty_events(deployment=deployment) for deployment in queryset)
+        self.message_user(request, f"Deleted {num_deleted} empty events from {queryset.count()} deployments.")
+
+    @admin.action(description="Read missing image dimensions of captures from the data source (async)")
+    def set_capture_dimensions(self, request: HttpRequest, queryset: QuerySet[Deployment]) -> None:
+        queued_tasks = [tasks.set_capture_dimensions.delay(deployment.pk) for deployment in queryset]
+        msg = f"Setting image dimensions for {len(queued_tasks)} deployments in background: {queued_tasks}"
+        self.message_user(request, msg)
+
+    @admin.action(description="Read missing timestamps of captures from EXIF data (async)")
+    def set_capture_timestamps_from_exif(self, request: HttpRequest, queryset: QuerySet[Deployment]) -> None:
+        queued_tasks = [tasks.set_capture_timestamps_from_exif.delay(deployment.pk) for deployment in queryset]
+        msg = f"Reading timestamps from EXIF data for {len(queued_tasks)} deployments in background: {queued_tasks}"
+        self.message_user(request, msg)
+
+    @admin.action(description="Update statistics")
+    def update_stats(self, request: HttpRequest, queryset: QuerySet[Deployment]) -> None:
+        from ami.main.models import update_calculated_fields_for_deployments
+
+        deployments = update_calculated_fields_for_deployments(qs=queryset)
+        self.message_user(request, f"Updated the statistics of {len(deployments)} deployments.")
+
     # Action that regroups all captures in the deployment into events
     @admin.action(description="Regroup captures into events")
     def regroup_events(self, request: HttpRequest, queryset: QuerySet[Deployment]) -> None:
@@ -123,8 +172,33 @@ class DeploymentAdmin(admin.ModelAdmin[Deployment]):
             group_images_into_events(deployment)
         self.message_user(request, f"Regrouped {queryset.count()} deployments.")
 
+    @admin.action(description="Group new captures into events and compare to a full regroup")
+    def regroup_new_events(self, request: HttpRequest, queryset: QuerySet[Deployment]) -> None:
+        from ami.main.models import diff_events_with_full_regroup, group_new_images_into_events
+
+        for deployment in queryset:
+            group_new_images_into_events(deployment)
+            differences = diff_events_with_full_regroup(deployment)
+            if differences:
+                self.message_user(
+                    request,
+                    f"Events of {deployment} differ from a full regroup: {'; '.join(differences[:10])}",
+                    level=messages.WARNING,
+                )
+        self.message_user(request, f"Grouped new captures of {queryset.count()} deployments.")
+
     list_filter = ("project",)
-    actions = [sync_captures, regroup_events]
+    actions = [
+        sync_captures,
+        sync_new_captures,
+        delete_stale_captures,
+        delete_empty_events,
+        set_capture_dimensions,
+        set_capture_timestamps_from_exif,
+        regroup_events,
+        regroup_new_events,
+        update_stats,
+    ]
 
     def get_queryset(self, request: HttpRequest) -> QuerySet[Any]:
         qs = super().get_queryset(request)
@@ -330,18 +404,46 @@ class S3StorageSourceAdmin(admin.ModelAdmin[S3StorageSource]):
     """Admin panel example for ``S3StorageSource`` model."""
 
     list_display = ("name", "bucket", "prefix", "size", "total_files", "last_checked")
+    readonly_fields = ("size_by_prefix",)
 
     def size(self, obj) -> str:
         return filesizeformat(obj.total_size)
 
+    @admin.display(description="Size by prefix")
+    def size_by_prefix(self, obj) -> str:
+        return format_html_join(
+            "\n",
+            "<div>{}: {} ({} files)</div>",
+            (
+                (prefix or "/", filesizeformat(size), number_format(files, force_grouping=True))
+                for prefix, size, files in obj.size_by_prefix()
+            ),
+        )
+
     @admin.action()
     def calculate_size_async(self, request: HttpRequest, queryset: QuerySet[S3StorageSource]) -> None:
-        queued_tasks = [tasks.calculate_storage_size.apply_async([source.pk]) for source in queryset]
+        queued_tasks = [
+            tasks.calculate_storage_size.apply_async([source.pk], {"model_name": source.__class__.__name__})
+            for source in queryset
+        ]
         self.message_user(
             request,
             f"Calculating size & file counts for {len(queued_tasks)} source(s) background tasks: {queued_tasks}.",
         )
 
+    @admin.action()
+    def recalculate_size_async(self, request: HttpRequest, queryset: QuerySet[S3StorageSource]) -> None:
+        queued_tasks = [
+            tasks.calculate_storage_size.apply_async(
+                [source.pk], {"full": True, "model_name": source.__class__.__name__}
+            )
+            for source in queryset
+        ]
+        self.message_user(
+            request,
+            f"Recounting all files for {len(queued_tasks)} source(s) background tasks: {queued_tasks}.",
+        )
+
     @admin.action()
     def count_files(self, request: HttpRequest, queryset: QuerySet[S3StorageSource]) -> None:
         # measure the time elapsed for the action
@@ -349,7 +451,14 @@ class S3StorageSourceAdmin(admin.ModelAdmin[S3StorageSource]):
             source.count_files()
         self.message_user(request, f"File count calculated for {queryset.count()} source(s).")
 
-    actions = [calculate_size_async, count_files]
+    actions = [calculate_size_async, recalculate_size_async, count_files]
+
+
+@admin.register(LocalStorageSource)
+class LocalStorageSourceAdmin(S3StorageSourceAdmin):
+    """Admin panel example for ``LocalStorageSource`` model."""
+
+    list_display = ("name", "path", "size", "total_files", "last_checked")
 
 
 @admin.register(SourceImageCollection)
@@ -1,11 +1,13 @@
 import datetime
+import typing
 
 from django.db.models import QuerySet
+from django.db.models.manager import BaseManager
 from rest_framework import serializers
 
 from ami.base.serializers import DefaultSerializer, MinimalNestedModelSerializer, get_current_user, reverse_with_params
 from ami.jobs.models import Job
-from ami.main.models import create_source_image_from_upload
+from ami.main.models import create_source_image_from_upload, presign_source_image_urls
 from ami.ml.models import Algorithm
 from ami.ml.serializers import AlgorithmSerializer
 from ami.users.models import User
@@ -31,6 +33,32 @@ from ..models import (
 )
 
 
+class PresignedURLsListSerializer(serializers.ListSerializer):
+    """
+    Presign the URLs of all captures in a list at once, instead of one by one as each item is serialized.
+
+    Subclasses for other models return the captures that will be serialized with `get_source_images`.
+    """
+
+    def get_source_images(self, items: list) -> typing.Iterable[SourceImage]:
+        return items
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, BaseManager) else data)
+        presign_source_image_urls(self.get_source_images(items))
+        return super().to_representation(items)
+
+
+class EventCapturesPresignedURLsListSerializer(PresignedURLsListSerializer):
+    def get_source_images(self, items: list[Event]) -> typing.Iterable[SourceImage]:
+        return [capture for event in items for capture in getattr(event, "example_captures", [])]
+
+
+class DetectionCapturesPresignedURLsListSerializer(PresignedURLsListSerializer):
+    def get_source_images(self, items: list[Detection]) -> typing.Iterable[SourceImage]:
+        return [detection.source_image for detection in items if detection.source_image]
+
+
 class ProjectNestedSerializer(DefaultSerializer):
     class Meta:
         model = Project
@@ -71,6 +99,7 @@ class SourceImageNestedSerializer(DefaultSerializer):
 
     class Meta:
         model = SourceImage
+        list_serializer_class = PresignedURLsListSerializer
         fields = [
             "id",
             "details",
@@ -87,6 +116,7 @@ class SourceImageNestedSerializer(DefaultSerializer):
 class ExampleSourceImageNestedSerializer(DefaultSerializer):
     class Meta:
         model = SourceImage
+        list_serializer_class = PresignedURLsListSerializer
         fields = [
             "id",
             "details",
@@ -270,6 +300,7 @@ class EventListSerializer(DefaultSerializer):
 
     class Meta:
         model = Event
+        list_serializer_class = EventCapturesPresignedURLsListSerializer
         fields = [
             "id",
             "name",
@@ -320,6 +351,7 @@ class DeploymentCaptureNestedSerializer(DefaultSerializer):
 
     class Meta:
         model = SourceImage
+        list_serializer_class = PresignedURLsListSerializer
         fields = [
             "id",
             "details",
@@ -774,6 +806,7 @@ class DetectionNestedSerializer(DefaultSerializer):
 
     class Meta:
         model = Detection
+        list_serializer_class = DetectionCapturesPresignedURLsListSerializer
         # queryset = Detection.objects.prefetch_related("classifications")
         fields = [
             "id",
@@ -830,6 +863,7 @@ class SourceImageListSerializer(DefaultSerializer):
 
     class Meta:
         model = SourceImage
+        list_serializer_class = PresignedURLsListSerializer
         fields = [
             "id",
             "details",
@@ -181,12 +181,15 @@ class DeploymentViewSet(DefaultViewSet):
         return qs
 
     @action(detail=True, methods=["post"], name="sync")
-    def sync(self, _request, pk=None) -> Response:
+    def sync(self, request, pk=None) -> Response:
         """
         Queue a task to sync data from the deployment's data source.
+
+        The whole data source is scanned, and captures that are no longer in it are found.
+        Pass `incremental=true` as a query parameter to only import the files added since the last sync.
         """
         deployment: Deployment = self.get_object()
-        if deployment and deployment.data_source:
+        if deployment and deployment.get_storage_source():
             # queued_task = tasks.sync_source_images.delay(deployment.pk)
             from ami.jobs.models import DataStorageSyncJob, Job
 
@@ -194,6 +197,7 @@ class DeploymentViewSet(DefaultViewSet):
                 name=f"Sync captures for deployment {deployment.pk}",
                 deployment=deployment,
                 project=deployment.project,
+                incremental=BooleanField(required=False).clean(request.query_params.get("incremental", False)),
             )
             job.progress.add_stage(DataStorageSyncJob.name)
             job.enqueue()
@@ -405,11 +409,11 @@ class SourceImageViewSet(DefaultViewSet):
         queryset = super().get_queryset()
         with_detections_default = False
 
-        queryset.select_related(
+        queryset = queryset.select_related(
             "event",
             "deployment",
-            "deployment__storage",
-        ).order_by("timestamp")
+            "deployment__data_source",
+        )
 
         if self.action == "list":
             # It's cumbersome to override the default list view, so customize the queryset here
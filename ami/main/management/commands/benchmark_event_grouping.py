@@ -0,0 +1,91 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from tqdm import tqdm
+
+from ...models import Deployment, Event, Project, SourceImage, diff_events_with_full_regroup, group_images_into_events
+
+
+class RollbackBenchmark(Exception):
+    pass
+
+
+def create_benchmark_captures(deployment: Deployment, num_captures: int, images_per_night: int, batch_size=10000):
+    """
+    Create captures every 10 minutes during the night, one night after the other.
+    """
+    first_night = datetime.datetime(2020, 1, 1, 20, 0)
+    captures = []
+    with tqdm(total=num_captures, desc="Creating captures", unit="captures") as pbar:
+        for i in range(num_captures):
+            night, image = divmod(i, images_per_night)
+            timestamp = first_night + datetime.timedelta(days=night, minutes=10 * image)
+            captures.append(
+                SourceImage(
+                    deployment=deployment,
+                    project=deployment.project,
+                    timestamp=timestamp,
+                    path=f"benchmark/{timestamp:%Y%m%d%H%M%S}.jpg",
+                )
+            )
+            if len(captures) >= batch_size:
+                SourceImage.objects.bulk_create(captures)
+                pbar.update(len(captures))
+                captures = []
+        SourceImage.objects.bulk_create(captures)
+        pbar.update(len(captures))
+
+
+class Command(BaseCommand):
+    r"""Compare the speed of grouping captures into events in Python and in the database."""
+
+    help = (
+        "Compare the speed of grouping captures into events in Python and in the database. "
+        "Synthetic captures are created in a new deployment and everything is rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--captures", type=int, default=1_000_000, help="Number of captures to create")
+        parser.add_argument("--images-per-night", type=int, default=60, help="Captures per monitoring session")
+        parser.add_argument("--deployment", type=int, help="Benchmark an existing deployment instead (rolled back)")
+        parser.add_argument("--skip-python", action="store_true", help="Only time the grouping in the database")
+
+    def time_grouping(self, deployment: Deployment, in_database: bool) -> float:
+        # Start from captures without events, like a first sync
+        SourceImage.objects.filter(deployment=deployment).update(event=None)
+        Event.objects.filter(deployment=deployment).delete()
+        start = time.time()
+        events = group_images_into_events(deployment, in_database=in_database)
+        duration = time.time() - start
+        engine = "database" if in_database else "Python"
+        self.stdout.write(f"Grouped into {len(set(events))} events in {engine} in {duration:.1f} seconds")
+        differences = diff_events_with_full_regroup(deployment)
+        if differences:
+            self.stdout.write(self.style.ERROR(f"{len(differences)} differences, e.g. {differences[:5]}"))
+        return duration
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if options["deployment"]:
+                    deployment = Deployment.objects.get(pk=options["deployment"])
+                else:
+                    project = Project.objects.create(name="Event grouping benchmark")
+                    deployment = Deployment.objects.create(project=project, name="Event grouping benchmark")
+                    create_benchmark_captures(deployment, options["captures"], options["images_per_night"])
+                num_captures = SourceImage.objects.filter(deployment=deployment).count()
+                self.stdout.write(f"Benchmarking event grouping of {num_captures} captures from {deployment}")
+
+                database_duration = self.time_grouping(deployment, in_database=True)
+                if not options["skip_python"]:
+                    python_duration = self.time_grouping(deployment, in_database=False)
+                    self.stdout.write(
+                        self.style.SUCCESS(
+                            f"Grouping in the database was {python_duration / database_duration:.1f}x faster"
+                        )
+                    )
+                raise RollbackBenchmark
+        except RollbackBenchmark:
+            self.stdout.write("Rolled back all changes")
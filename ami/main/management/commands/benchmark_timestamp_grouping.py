@@ -0,0 +1,69 @@
+import datetime
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from ami.utils.dates import group_datetimes_by_gap, group_timestamps_by_gap
+
+
+def generate_timestamps(num_timestamps: int, images_per_night: int, seed: int = 0) -> np.ndarray:
+    """
+    Timestamps of captures taken every few minutes during the night, one night after the other.
+    """
+    rng = np.random.default_rng(seed)
+    nights, images = np.divmod(np.arange(num_timestamps), images_per_night)
+    minutes = nights * 24 * 60 + images * 10 + rng.integers(0, 3, size=num_timestamps)
+    first_night = np.datetime64("2020-01-01T20:00", "us")
+    return first_night + minutes.astype("timedelta64[m]")
+
+
+class Command(BaseCommand):
+    r"""Compare the speed of grouping timestamps into sessions in Python and with NumPy."""
+
+    help = "Compare the speed of grouping timestamps into sessions with group_datetimes_by_gap and with NumPy"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--timestamps", type=int, default=10_000_000, help="Number of timestamps to group")
+        parser.add_argument("--images-per-night", type=int, default=60, help="Timestamps per session")
+        parser.add_argument("--max-time-gap", type=int, default=120, help="Max time gap in minutes")
+        parser.add_argument("--skip-python", action="store_true", help="Only time the NumPy version")
+
+    def handle(self, *args, **options):
+        max_time_gap = datetime.timedelta(minutes=options["max_time_gap"])
+        timestamps = generate_timestamps(options["timestamps"], options["images_per_night"])
+        self.stdout.write(f"Grouping {len(timestamps)} timestamps")
+
+        start = time.time()
+        groups = group_timestamps_by_gap(timestamps, max_time_gap)
+        numpy_duration = time.time() - start
+        self.stdout.write(f"NumPy: {len(groups)} groups in {numpy_duration:.2f} seconds")
+
+        start = time.time()
+        stats = groups.interval_stats()
+        self.stdout.write(f"NumPy interval statistics in {time.time() - start:.2f} seconds")
+
+        def seconds(values: np.ndarray) -> np.ndarray:
+            return values[~np.isnat(values)] / np.timedelta64(1, "s")
+
+        self.stdout.write(
+            f"Median interval in a session: {np.median(seconds(stats['median_interval'])):.0f} s, "
+            f"longest interval in a session: {np.max(seconds(stats['max_interval'])):.0f} s, "
+            f"shortest gap between sessions: {np.min(seconds(stats['gap_before'])):.0f} s"
+        )
+
+        if options["skip_python"]:
+            return
+
+        datetimes = timestamps.tolist()
+        start = time.time()
+        python_groups = group_datetimes_by_gap(datetimes, max_time_gap)
+        python_duration = time.time() - start
+        self.stdout.write(f"Python: {len(python_groups)} groups in {python_duration:.2f} seconds")
+
+        if [len(group) for group in python_groups] != groups.counts().tolist():
+            self.stdout.write(self.style.ERROR("The groups are different"))
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(f"Same groups, NumPy is {python_duration / numpy_duration:.1f}x faster")
+            )
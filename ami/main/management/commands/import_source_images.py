@@ -10,10 +10,17 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument("deployment_id", type=int)
+        parser.add_argument(
+            "--inventory",
+            help=(
+                "Read the files from an S3 inventory manifest.json or CSV/Parquet file instead of listing the bucket. "
+                "Use a file:// URI for a local file, an s3:// URI or a key in the bucket of the deployment"
+            ),
+        )
 
     def handle(self, *args, **options):
         deployment_id = options["deployment_id"]
         deployment = Deployment.objects.get(id=deployment_id)
-        created = deployment.import_captures()
-        msg = f"Imported {len(created)} source images for {deployment}"
+        total_files = deployment.sync_captures(inventory=options["inventory"])
+        msg = f"Imported {total_files} source images for {deployment}"
         self.stdout.write(self.style.SUCCESS(msg))
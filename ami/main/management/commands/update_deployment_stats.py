@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from ...models import Deployment, update_calculated_fields_for_deployments
+
+
+class Command(BaseCommand):
+    r"""Update the pre-calculated statistics of deployments."""
+
+    help = "Update the pre-calculated statistics (counts, size, first & last capture) of deployments"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--project", type=int, nargs="*", help="Update all deployments of these projects")
+        parser.add_argument("--deployment", type=int, nargs="*", help="Update these deployments")
+
+    def handle(self, *args, **options):
+        deployments = Deployment.objects.all()
+        if options["project"]:
+            deployments = deployments.filter(project_id__in=options["project"])
+        if options["deployment"]:
+            deployments = deployments.filter(pk__in=options["deployment"])
+
+        updated = update_calculated_fields_for_deployments(qs=deployments)
+        self.stdout.write(self.style.SUCCESS(f"Updated the statistics of {len(updated)} deployments"))
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.10 on 2026-10-17 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0037_alter_detection_path_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="deployment",
+            name="data_source_sync_checkpoint",
+            field=models.JSONField(
+                blank=True,
+                help_text="The last key and LastModified watermark seen by the previous sync, used for incremental syncs.",
+                null=True,
+            ),
+        ),
+    ]
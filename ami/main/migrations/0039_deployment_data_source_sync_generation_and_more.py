@@ -0,0 +1,33 @@
+# Generated by Django 4.2.10 on 2026-10-17 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0038_deployment_data_source_sync_checkpoint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="deployment",
+            name="data_source_sync_generation",
+            field=models.IntegerField(
+                blank=True,
+                help_text=(
+                    "Incremented by every full sync of the data source. Captures that were not seen by the last full "
+                    "sync have an older generation and are no longer in the data source."
+                ),
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="sourceimage",
+            name="sync_generation",
+            field=models.IntegerField(
+                blank=True,
+                help_text="The generation of the last sync of the data source that saw this file.",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.10 on 2026-10-17 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0039_deployment_data_source_sync_generation_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="s3storagesource",
+            name="totals_by_prefix",
+            field=models.JSONField(
+                blank=True,
+                help_text="The number of files and total size in each top-level subdirectory, from the last size calculation.",
+                null=True,
+            ),
+        ),
+    ]
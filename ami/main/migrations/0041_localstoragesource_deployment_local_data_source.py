@@ -0,0 +1,70 @@
+# Generated by Django 4.2.10 on 2026-10-17 13:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0040_s3storagesource_totals_by_prefix"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LocalStorageSource",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("total_size", models.BigIntegerField(blank=True, null=True)),
+                ("total_files", models.BigIntegerField(blank=True, null=True)),
+                (
+                    "totals_by_prefix",
+                    models.JSONField(
+                        blank=True,
+                        help_text="The number of files and total size in each top-level subdirectory, from the last size calculation.",
+                        null=True,
+                    ),
+                ),
+                ("last_checked", models.DateTimeField(blank=True, null=True)),
+                ("name", models.CharField(max_length=255)),
+                (
+                    "path",
+                    models.CharField(help_text="The absolute path of the directory on the server.", max_length=1024),
+                ),
+                (
+                    "public_base_url",
+                    models.CharField(
+                        blank=True,
+                        help_text="The URL where the static file server serves the contents of the directory.",
+                        max_length=255,
+                        null=True,
+                    ),
+                ),
+                (
+                    "project",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="local_storage_sources",
+                        to="main.project",
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.AddField(
+            model_name="deployment",
+            name="local_data_source",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="A local directory to sync captures from, if there is no S3 data source.",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="deployments",
+                to="main.localstoragesource",
+            ),
+        ),
+    ]
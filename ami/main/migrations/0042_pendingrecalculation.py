@@ -0,0 +1,27 @@
+# Generated by Django 4.2.10 on 2026-10-17 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0041_localstoragesource_deployment_local_data_source"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PendingRecalculation",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("model_name", models.CharField(max_length=255)),
+                ("object_id", models.BigIntegerField()),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(fields=("model_name", "object_id"), name="unique_pending_recalculation")
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.10 on 2026-10-17 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0042_pendingrecalculation"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="deployment",
+            name="data_source_timestamp_pattern",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("YYYYMMDDhhmmss", "YYYYMMDDhhmmss"),
+                    ("YYYYMMDD-hhmmss", "YYYYMMDD-hhmmss"),
+                    ("YYYY-MM-DDThh:mm:ss", "YYYY-MM-DDThh:mm:ss"),
+                ],
+                help_text="The timestamp format of the filenames in the data source, learned by the first sync.",
+                max_length=255,
+                null=True,
+            ),
+        ),
+    ]
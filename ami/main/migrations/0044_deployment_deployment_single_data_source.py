@@ -0,0 +1,19 @@
+# Generated by Django 4.2.10 on 2026-10-17 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0043_deployment_data_source_timestamp_pattern"),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="deployment",
+            constraint=models.CheckConstraint(
+                check=models.Q(("data_source__isnull", True), ("local_data_source__isnull", True), _connector="OR"),
+                name="deployment_single_data_source",
+            ),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.10 on 2026-10-17 21:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0044_deployment_deployment_single_data_source"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PendingEventRegroup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "since",
+                    models.DateTimeField(
+                        blank=True,
+                        help_text="Only the captures updated after this time need to be regrouped, all of them if empty.",
+                        null=True,
+                    ),
+                ),
+                (
+                    "deployment",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="pending_event_regroup",
+                        to="main.deployment",
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+    ]
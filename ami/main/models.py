@@ -1,22 +1,30 @@
+import abc
 import collections
+import contextlib
 import datetime
 import functools
 import hashlib
 import logging
+import queue
 import textwrap
+import threading
 import time
 import typing
 import urllib.parse
 from typing import Final, final  # noqa: F401
 
+import PIL.Image
 import pydantic
 from django.apps import apps
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.files.storage import default_storage
-from django.db import IntegrityError, models
-from django.db.models import Q
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import DEFERRED, Q
+from django.db.models.base import ModelBase
 from django.db.models.fields.files import ImageFieldFile
+from django.db.models.functions import Cast, Coalesce, TruncDate
 from django.db.models.signals import pre_delete
 from django.dispatch import receiver
 from django.template.defaultfilters import filesizeformat
@@ -228,22 +236,122 @@ class DeploymentManager(models.Manager):
 def _create_source_image_for_sync(
     deployment: "Deployment",
     obj: ami.utils.s3.ObjectTypeDef,
+    sync_generation: int | None = None,
+    timestamp: datetime.datetime | None = None,
+    timestamp_parsed: bool = False,
 ) -> typing.Union["SourceImage", None]:
+    """
+    Build the SourceImage row of a listed file. Set `timestamp_parsed` if the filename was already
+    parsed for a timestamp, so it isn't parsed again when `timestamp` is None.
+    """
     assert "Key" in obj, f"File in object store response has no Key: {obj}"
 
     source_image = SourceImage(
         deployment=deployment,
         path=obj["Key"],
+        timestamp=timestamp,
         last_modified=obj.get("LastModified"),
         size=obj.get("Size"),
         checksum=obj.get("ETag", "").strip('"'),
         checksum_algorithm=obj.get("ChecksumAlgorithm"),
+        sync_generation=sync_generation,
     )
     logger.debug(f"Preparing to create or update SourceImage {source_image.path}")
-    source_image.update_calculated_fields()
+    source_image.update_calculated_fields(extract_timestamp=not timestamp_parsed)
     return source_image
 
 
+def _create_source_images_for_sync(
+    deployment: "Deployment",
+    objs: list[ami.utils.s3.ObjectTypeDef],
+    state: dict[str, typing.Any],
+    sync_generation: int | None = None,
+    pattern_sample_size: int = 100,
+) -> list["SourceImage"]:
+    """
+    Build the SourceImage rows of a batch of listed files, parsing the timestamps of all the filenames together.
+
+    The filename pattern of the deployment is learned from the first batch of the sync if it isn't known yet,
+    and kept in `state["timestamp_pattern"]` to be saved on the deployment.
+    """
+    paths = [obj["Key"] for obj in objs]
+    if not state.get("timestamp_pattern") and not state.get("timestamp_pattern_checked"):
+        state["timestamp_pattern"] = ami.utils.dates.learn_filename_timestamp_pattern(paths[:pattern_sample_size])
+        state["timestamp_pattern_checked"] = True
+        logger.info(f"Filename timestamp pattern of deployment {deployment}: {state['timestamp_pattern']}")
+    timestamps = ami.utils.dates.get_image_timestamps_from_filenames(paths, state.get("timestamp_pattern"))
+    num_missing = timestamps.count(None)
+    if num_missing:
+        logger.warning(
+            f"No timestamp could be extracted from the filenames of {num_missing} of {len(paths)} files, "
+            f"e.g. {paths[timestamps.index(None)]}. They will be read from EXIF data"
+        )
+    return [
+        source_image
+        for obj, timestamp in zip(objs, timestamps)
+        if (
+            source_image := _create_source_image_for_sync(
+                deployment, obj, sync_generation, timestamp, timestamp_parsed=True
+            )
+        )
+    ]
+
+
+def _list_batches_for_sync(
+    deployment: "Deployment",
+    files: typing.Iterator[tuple[ami.utils.s3.ObjectTypeDef | None, int]],
+    batches: queue.Queue,
+    stop: threading.Event,
+    state: dict[str, typing.Any],
+    batch_size: int = 1000,
+    sync_generation: int | None = None,
+):
+    """
+    The listing stage of `Deployment.sync_captures`, run in its own thread.
+
+    Build SourceImage rows from the object store listing and put them on the `batches` queue in batches,
+    along with the running totals. The queue is bounded, so the listing waits for the database writes
+    if it gets too far ahead. A `None` item marks the end of the listing. The last key and LastModified
+    timestamp seen, the filename timestamp pattern, or the exception that stopped the listing,
+    are recorded in `state`.
+    """
+    total_files = 0
+    total_size = 0
+    objs: list[ami.utils.s3.ObjectTypeDef] = []
+
+    def build_batch():
+        source_images = _create_source_images_for_sync(deployment, objs, state, sync_generation)
+        batches.put(("batch", source_images, total_files, total_size))
+        objs.clear()
+
+    try:
+        for obj, file_index in files:
+            if stop.is_set():
+                break
+            logger.debug(f"Processing file {file_index}: {obj}")
+            if not obj:
+                continue
+            state["last_key"] = max(filter(None, [state["last_key"], obj.get("Key")]), default=None)
+            state["last_modified"] = max(filter(None, [state["last_modified"], obj.get("LastModified")]), default=None)
+            assert "Key" in obj, f"File in object store response has no Key: {obj}"
+            total_files += 1
+            total_size += obj.get("Size", 0)
+            objs.append(obj)
+
+            if len(objs) >= batch_size:
+                build_batch()
+
+        if objs and not stop.is_set():
+            build_batch()
+    except Exception as e:
+        logger.error(f"Error listing files for sync of deployment {deployment}: {e}")
+        state["error"] = e
+    finally:
+        batches.put(None)
+        # Nothing here should query the database, but don't leave a connection open in this thread if it did
+        connection.close()
+
+
 def _insert_or_update_batch_for_sync(
     deployment: "Deployment",
     source_images: list["SourceImage"],
@@ -259,7 +367,7 @@ def _insert_or_update_batch_for_sync(
             batch_size=sql_batch_size,
             update_conflicts=True,
             unique_fields=["deployment", "path"],  # type: ignore
-            update_fields=["last_modified", "size", "checksum", "checksum_algorithm"],
+            update_fields=["last_modified", "size", "checksum", "checksum_algorithm", "sync_generation"],
         )
     except IntegrityError as e:
         logger.error(f"Error bulk inserting batch of SourceImages: {e}")
@@ -271,11 +379,59 @@ def _insert_or_update_batch_for_sync(
     deployment.data_source_last_checked = datetime.datetime.now()
 
     if regroup_events_per_batch:
-        group_images_into_events(deployment)
+        group_new_images_into_events(deployment)
 
     deployment.save(update_calculated_fields=False)
 
 
+def _get_checkpoint_for_sync(deployment: "Deployment") -> tuple[str | None, datetime.datetime | None]:
+    """
+    Return the last key and the LastModified watermark recorded by the previous sync of this deployment.
+
+    The checkpoint is ignored if the data source, subdir or regex filter of the deployment has changed since.
+    """
+    checkpoint = deployment.data_source_sync_checkpoint or {}
+    if not checkpoint or checkpoint.get("uri") != deployment.data_source_uri():
+        return None, None
+    last_modified = checkpoint.get("last_modified")
+    return checkpoint.get("last_key"), datetime.datetime.fromisoformat(last_modified) if last_modified else None
+
+
+def _get_checkpoint_synced_at(deployment: "Deployment") -> datetime.datetime | None:
+    """
+    Return the time of the latest state of the data source seen by a previous sync of this deployment.
+    """
+    checkpoint = deployment.data_source_sync_checkpoint or {}
+    if not checkpoint or checkpoint.get("uri") != deployment.data_source_uri():
+        return None
+    synced_at = checkpoint.get("synced_at") or checkpoint.get("last_modified")
+    return datetime.datetime.fromisoformat(synced_at) if synced_at else None
+
+
+def _update_checkpoint_for_sync(
+    deployment: "Deployment",
+    last_key: str | None,
+    last_modified: datetime.datetime | None,
+    synced_at: datetime.datetime | None = None,
+) -> None:
+    """
+    Advance the sync checkpoint of the deployment. The watermarks only ever move forward. Does not save.
+
+    `synced_at` is the time of the state of the data source that was listed: when the listing started,
+    or when the inventory report was created.
+    """
+    previous_key, previous_modified = _get_checkpoint_for_sync(deployment)
+    last_key = max(filter(None, [previous_key, last_key]), default=None)
+    last_modified = max(filter(None, [previous_modified, last_modified]), default=None)
+    synced_at = max(filter(None, [_get_checkpoint_synced_at(deployment), synced_at]), default=None)
+    deployment.data_source_sync_checkpoint = {
+        "uri": deployment.data_source_uri(),
+        "last_key": last_key,
+        "last_modified": last_modified.isoformat() if last_modified else None,
+        "synced_at": synced_at.isoformat() if synced_at else None,
+    }
+
+
 def _compare_totals_for_sync(deployment: "Deployment", total_files_found: int):
     # @TODO compare total_files to the number of SourceImages for this deployment
     existing_file_count = SourceImage.objects.filter(deployment=deployment).count()
@@ -307,6 +463,14 @@ class Deployment(BaseModel):
     data_source = models.ForeignKey(
         "S3StorageSource", on_delete=models.SET_NULL, null=True, blank=True, related_name="deployments"
     )
+    local_data_source = models.ForeignKey(
+        "LocalStorageSource",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="deployments",
+        help_text="A local directory to sync captures from, if there is no S3 data source.",
+    )
 
     # Pre-calculated values from the data source
     data_source_total_files = models.IntegerField(blank=True, null=True)
@@ -314,6 +478,26 @@ class Deployment(BaseModel):
     data_source_subdir = models.CharField(max_length=255, blank=True, null=True)
     data_source_regex = models.CharField(max_length=255, blank=True, null=True)
     data_source_last_checked = models.DateTimeField(blank=True, null=True)
+    data_source_sync_checkpoint = models.JSONField(
+        blank=True,
+        null=True,
+        help_text="The last key and LastModified watermark seen by the previous sync, used for incremental syncs.",
+    )
+    data_source_sync_generation = models.IntegerField(
+        blank=True,
+        null=True,
+        help_text=(
+            "Incremented by every full sync of the data source. Captures that were not seen by the last full sync "
+            "have an older generation and are no longer in the data source."
+        ),
+    )
+    data_source_timestamp_pattern = models.CharField(
+        max_length=255,
+        blank=True,
+        null=True,
+        choices=[(pattern, pattern) for pattern in ami.utils.dates.FILENAME_TIMESTAMP_PATTERNS],
+        help_text="The timestamp format of the filenames in the data source, learned by the first sync.",
+    )
     # data_source_start_date = models.DateTimeField(blank=True, null=True)
     # data_source_end_date = models.DateTimeField(blank=True, null=True)
     # data_source_last_check_duration = models.DurationField(blank=True, null=True)
@@ -353,6 +537,19 @@ class Deployment(BaseModel):
 
     class Meta:
         ordering = ["name"]
+        constraints = [
+            models.CheckConstraint(
+                check=Q(data_source__isnull=True) | Q(local_data_source__isnull=True),
+                name="deployment_single_data_source",
+            ),
+        ]
+
+    def clean(self):
+        super().clean()
+        if self.data_source_id and self.local_data_source_id:
+            raise ValidationError(
+                {"local_data_source": "A deployment can sync from an S3 data source or a local one, not both."}
+            )
 
     def taxa(self) -> models.QuerySet["Taxon"]:
         return Taxon.objects.filter(Q(occurrences__deployment=self)).distinct()
@@ -378,9 +575,14 @@ class Deployment(BaseModel):
     def last_date(self) -> datetime.date | None:
         return self.last_capture_timestamp.date() if self.last_capture_timestamp else None
 
+    def get_storage_source(self) -> "StorageSource | None":
+        """Return the S3 data source of the deployment, or its local data source."""
+        return self.data_source or self.local_data_source
+
     def data_source_uri(self) -> str | None:
-        if self.data_source:
-            uri = self.data_source.uri().rstrip("/")
+        storage_source = self.get_storage_source()
+        if storage_source:
+            uri = storage_source.uri().rstrip("/")
             if self.data_source_subdir:
                 uri = f"{uri}/{self.data_source_subdir.strip('/')}/"
             if self.data_source_regex:
@@ -395,61 +597,179 @@ class Deployment(BaseModel):
         else:
             return filesizeformat(self.data_source_total_size)
 
-    def sync_captures(self, batch_size=1000, regroup_events_per_batch=False, job: "Job | None" = None) -> int:
-        """Import images from the deployment's data source"""
+    def sync_captures(
+        self,
+        batch_size=1000,
+        regroup_events_per_batch=False,
+        job: "Job | None" = None,
+        sharded: bool = False,
+        shard_workers: int = 8,
+        incremental: bool = False,
+        delete_stale: bool = False,
+        queue_size: int = 4,
+        inventory: str | None = None,
+    ) -> int:
+        """
+        Import images from the deployment's data source (an S3 bucket or a local directory)
+
+        If `sharded` is True, the subdirectories of the data source (for S3, the top-level date folders)
+        are listed concurrently using `shard_workers` threads. Otherwise the files are listed one page at a time.
+
+        If `incremental` is True, only files after the checkpoint recorded by the previous sync are listed:
+        keys that sort after the last key seen, and files directly under the subdir that were modified since.
+        Folders are only compared by key, so files copied with their original modification times are found.
+        Files added to older folders, or deleted, are only picked up by a full sync (the default).
+
+        Every capture seen by a sync is tagged with the sync generation. After a full sync, captures with an older
+        generation are no longer in the data source. They are reported, and deleted if `delete_stale` is True.
+
+        If `inventory` is the path to the manifest.json of an S3 inventory report of the bucket (or to one of its
+        CSV, CSV.gz or Parquet files), the files are read from the inventory instead of listing the bucket.
+        See `ami.utils.s3.list_files_from_inventory`. An inventory only counts as a full sync, which can find
+        stale captures, if its manifest was created after the state of the data source seen by the last sync.
+        Otherwise files added since the report was created would be taken for deleted files.
+
+        Listing the files runs in a separate thread, so the object store listing continues while each batch of
+        `batch_size` captures is written to the database. At most `queue_size` batches wait to be written.
+        """
 
         deployment = self
-        assert deployment.data_source, f"Deployment {deployment.name} has no data source configured"
+        storage_source = deployment.get_storage_source()
+        assert storage_source, f"Deployment {deployment.name} has no data source configured"
 
-        s3_config = deployment.data_source.config
         total_size = 0
         total_files = 0
-        source_images = []
-        django_batch_size = batch_size
         sql_batch_size = 1000
 
+        start_after, modified_after = _get_checkpoint_for_sync(deployment) if incremental else (None, None)
+        full_sync = not start_after
+        if inventory:
+            assert isinstance(storage_source, S3StorageSource), "Inventory reports are only available for S3"
+            synced_at = ami.utils.s3.get_inventory_creation_time(storage_source.config, inventory)
+            last_synced_at = _get_checkpoint_synced_at(deployment)
+            if full_sync and (not synced_at or (last_synced_at and synced_at <= last_synced_at)):
+                msg = (
+                    f"The inventory report {inventory} (created {synced_at or 'at an unknown time'}) is not newer "
+                    f"than the last sync of deployment '{deployment}' ({last_synced_at}), "
+                    f"not looking for stale captures"
+                )
+                logger.warning(msg)
+                if job:
+                    job.logger.warning(msg)
+                full_sync = False
+        else:
+            synced_at = timezone.now()
+        # Incremental syncs don't see every file, so they don't start a new generation
+        last_generation = deployment.data_source_sync_generation or 0
+        sync_generation = last_generation + 1 if full_sync else last_generation
+
         if job:
+            if start_after:
+                job.logger.info(f"Syncing captures added after {start_after}")
             job.logger.info(f"Syncing captures for deployment {deployment}")
             job.update_progress()
             job.save()
 
-        for obj, file_index in ami.utils.s3.list_files_paginated(
-            s3_config,
-            subdir=self.data_source_subdir,
-            regex_filter=self.data_source_regex,
-        ):
-            logger.debug(f"Processing file {file_index}: {obj}")
-            if not obj:
-                continue
-            source_image = _create_source_image_for_sync(deployment, obj)
-            if source_image:
-                total_files += 1
-                total_size += obj.get("Size", 0)
-                source_images.append(source_image)
+        # Listing and building the rows happens in a separate thread while this thread writes to the database.
+        # Everything that touches the database (including the job progress) stays in this thread.
+        batches: queue.Queue = queue.Queue(maxsize=queue_size)
+        stop_listing = threading.Event()
+        listing_state: dict[str, typing.Any] = {
+            "last_key": None,
+            "last_modified": None,
+            "error": None,
+            "timestamp_pattern": deployment.data_source_timestamp_pattern,
+        }
+        # Load the related objects used to build the rows before the listing thread needs them
+        deployment.project
+
+        def on_shard_complete(shard_prefix: str, shards_completed: int, shards_total: int):
+            # Called from the listing thread
+            batches.put(("shard", shard_prefix, shards_completed, shards_total))
+
+        if inventory:
+            files = ami.utils.s3.list_files_from_inventory(
+                storage_source.config,
+                inventory_path=inventory,
+                subdir=self.data_source_subdir,
+                regex_filter=self.data_source_regex,
+                start_after=start_after,
+                modified_after=modified_after,
+            )
+        else:
+            files = storage_source.list_files(
+                subdir=self.data_source_subdir,
+                regex_filter=self.data_source_regex,
+                start_after=start_after,
+                modified_after=modified_after,
+                max_workers=shard_workers if sharded else 1,
+                on_shard_complete=on_shard_complete,
+            )
 
-            if len(source_images) >= django_batch_size:
+        lister = threading.Thread(
+            target=_list_batches_for_sync,
+            kwargs=dict(
+                deployment=deployment,
+                files=files,
+                batches=batches,
+                stop=stop_listing,
+                state=listing_state,
+                batch_size=batch_size,
+                sync_generation=sync_generation,
+            ),
+            name=f"sync-captures-{deployment.pk}",
+            daemon=True,
+        )
+        lister.start()
+        try:
+            while (item := batches.get()) is not None:
+                if item[0] == "shard":
+                    _kind, shard_prefix, shards_completed, shards_total = item
+                    if job:
+                        job.logger.info(f"Listed shard {shards_completed} of {shards_total}: {shard_prefix}")
+                        job.progress.update_stage(
+                            job.job_type().key,
+                            shards=f"{shards_completed} / {shards_total}",
+                            # Leave room for the final upsert and cache update
+                            progress=0.99 * shards_completed / shards_total,
+                        )
+                        job.update_progress()
+                    continue
+
+                _kind, source_images, total_files, total_size = item
                 _insert_or_update_batch_for_sync(
                     deployment, source_images, total_files, total_size, sql_batch_size, regroup_events_per_batch
                 )
-                source_images = []
                 if job:
                     job.logger.info(f"Processed {total_files} files")
                     job.progress.update_stage(job.job_type().key, total_files=total_files)
                     job.update_progress()
-
-        if source_images:
-            # Insert/update the last batch
-            _insert_or_update_batch_for_sync(
-                deployment, source_images, total_files, total_size, sql_batch_size, regroup_events_per_batch
-            )
-        if job:
-            job.logger.info(f"Processed {total_files} files")
-            job.progress.update_stage(job.job_type().key, total_files=total_files)
-            job.update_progress()
-
-        _compare_totals_for_sync(deployment, total_files)
-
-        # @TODO decide if we should delete SourceImages that are no longer in the data source
+        finally:
+            # If writing failed, stop the listing and unblock it until it has finished
+            stop_listing.set()
+            while lister.is_alive():
+                try:
+                    batches.get(timeout=1)
+                except queue.Empty:
+                    pass
+            lister.join()
+
+        if listing_state["error"]:
+            raise listing_state["error"]
+        last_key: str | None = listing_state["last_key"]
+        last_modified: datetime.datetime | None = listing_state["last_modified"]
+        deployment.data_source_timestamp_pattern = listing_state["timestamp_pattern"]
+
+        if full_sync:
+            # An incremental sync only sees the new files
+            _compare_totals_for_sync(deployment, total_files)
+            deployment.data_source_sync_generation = sync_generation
+            stale_count = deployment.delete_stale_captures(dry_run=not delete_stale)
+            if job:
+                job.progress.update_stage(job.job_type().key, stale_captures=stale_count)
+                if stale_count and not delete_stale:
+                    job.logger.warning(f"Found {stale_count} captures that are no longer in the data source")
+        _update_checkpoint_for_sync(deployment, last_key, last_modified, synced_at)
 
         if job:
             job.logger.info("Saving and recalculating sessions for deployment")
@@ -544,6 +864,50 @@ class Deployment(BaseModel):
         if changed_count != previous_count:
             raise ValueError(f"Only {changed_count} captures were updated to new subdir: {new_subdir}")
 
+    def stale_captures(self) -> models.QuerySet["SourceImage"]:
+        """
+        Captures that were not seen by the last full sync of the data source.
+
+        Manually uploaded captures are not in the data source and are never stale.
+        """
+        if not self.data_source_sync_generation:
+            return SourceImage.objects.none()
+        return (
+            SourceImage.objects.filter(deployment=self, upload__isnull=True)
+            .filter(Q(sync_generation__lt=self.data_source_sync_generation) | Q(sync_generation__isnull=True))
+            .order_by()
+        )
+
+    def delete_stale_captures(self, dry_run=True, chunk_size=1000) -> int:
+        """
+        Report or delete the captures that are no longer in the data source.
+
+        Returns the number of stale captures found (or deleted).
+        """
+        stale_captures = self.stale_captures()
+        if dry_run:
+            count = stale_captures.count()
+            if count:
+                examples = ", ".join(stale_captures.values_list("path", flat=True)[:5])
+                logger.warning(
+                    f"Deployment '{self}' has {count} captures that are no longer in the data source, "
+                    f"e.g. {examples}"
+                )
+            return count
+
+        num_deleted = 0
+        while True:
+            pks = list(stale_captures.values_list("pk", flat=True)[:chunk_size])
+            if not pks:
+                break
+            num_deleted_in_chunk = delete_source_images(pks)
+            if not num_deleted_in_chunk:
+                logger.error(f"Could not delete stale captures from '{self}': {pks}")
+                break
+            num_deleted += num_deleted_in_chunk
+        logger.info(f"Deleted {num_deleted} captures that are no longer in the data source from '{self}'")
+        return num_deleted
+
     def update_children(self):
         """
         Update all attribute on all child objects that should be equal to their deployment values.
@@ -570,51 +934,176 @@ class Deployment(BaseModel):
             qs.update(project=self.project)
 
     def update_calculated_fields(self, save=False):
-        """Update calculated fields on the deployment."""
-
-        self.data_source_total_files = self.captures.count()
-        self.data_source_total_size = self.captures.aggregate(total_size=models.Sum("size")).get("total_size")
-
-        self.events_count = self.events.count()
-        self.captures_count = self.data_source_total_files or self.captures.count()
-        self.detections_count = Detection.objects.filter(Q(source_image__deployment=self)).count()
-        self.occurrences_count = (
-            self.occurrences.filter(
-                determination_score__gte=settings.DEFAULT_CONFIDENCE_THRESHOLD,
-                event__isnull=False,
-            )
-            .distinct()
-            .count()
-        )
-        self.taxa_count = (
-            Taxon.objects.filter(
-                occurrences__deployment=self,
-                occurrences__determination_score__gte=settings.DEFAULT_CONFIDENCE_THRESHOLD,
-                occurrences__event__isnull=False,
-            )
-            .distinct()
-            .count()
-        )
+        """
+        Update calculated fields on the deployment.
+
+        See `update_calculated_fields_for_deployments` to update many deployments at once.
+        """
+        if self.pk is None:
+            return
 
-        self.first_capture_timestamp, self.last_capture_timestamp = self.get_first_and_last_timestamps()
+        for field, value in _calculate_deployment_stats([self.pk])[self.pk].items():
+            setattr(self, field, value)
 
         if save:
             self.save(update_calculated_fields=False)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded project to tell if it was changed when saving
+        instance._loaded_project_id = dict(zip(field_names, values)).get("project_id", DEFERRED)
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        if fields is None or {"project", "project_id"} & set(fields):
+            self._loaded_project_id = self.project_id
+
+    def project_changed(self, update_fields=None) -> bool:
+        """
+        Tell if the project of the deployment is being changed by a save with these `update_fields`.
+
+        The database is only queried if the project was not loaded with the deployment.
+        """
+        if not self.pk or (update_fields is not None and not {"project", "project_id"} & set(update_fields)):
+            return False
+        previous_project_id = getattr(self, "_loaded_project_id", DEFERRED)
+        if previous_project_id is DEFERRED:
+            previous_project_id = Deployment.objects.filter(pk=self.pk).values_list("project_id", flat=True).first()
+        return self.project_id != previous_project_id
+
     def save(self, update_calculated_fields=True, *args, **kwargs):
         last_updated = self.updated_at or timezone.now()
+        project_changed = update_calculated_fields and self.project_changed(kwargs.get("update_fields"))
         super().save(*args, **kwargs)
+        self._loaded_project_id = self.project_id
         if self.pk and update_calculated_fields:
-            # @TODO Use "dirty" flag strategy to only update when needed
-            new_or_updated_captures = self.captures.filter(updated_at__gte=last_updated).count()
-            deleted_captures = True if self.captures.count() < (self.captures_count or 0) else False
-            if new_or_updated_captures or deleted_captures:
-                ami.tasks.regroup_events.delay(self.pk)
-            self.update_calculated_fields(save=True)
-            if self.project:
+            # Captures that were deleted queue their own regroup, see `delete_source_image`
+            if self.captures.filter(updated_at__gte=last_updated).exists():
+                # Only the time ranges around the new captures need to be regrouped
+                queue_regroup_events(self.pk, since=last_updated)
+            if project_changed and self.project_id:
+                # The child objects have to move to the new project right away
                 self.update_children()
-                # @TODO this isn't working as a background task
-                # ami.tasks.model_task.delay("Project", self.project.pk, "update_children_project")
+            # The counts are updated in the background, see `_recalculate_deployments`
+            mark_for_recalculation("Deployment", [self.pk])
+
+
+DEPLOYMENT_CALCULATED_FIELDS = [
+    "data_source_total_files",
+    "data_source_total_size",
+    "events_count",
+    "captures_count",
+    "detections_count",
+    "occurrences_count",
+    "taxa_count",
+    "first_capture_timestamp",
+    "last_capture_timestamp",
+]
+
+
+def _calculate_deployment_stats(pks: list[typing.Any]) -> dict[typing.Any, dict[str, typing.Any]]:
+    """
+    Calculate the values of the pre-calculated fields of deployments, with one grouped query per child table.
+
+    Returns the values of each field in DEPLOYMENT_CALCULATED_FIELDS by deployment pk.
+    """
+    stats: dict[typing.Any, dict[str, typing.Any]] = {
+        pk: {
+            "data_source_total_files": 0,
+            "data_source_total_size": None,
+            "events_count": 0,
+            "captures_count": 0,
+            "detections_count": 0,
+            "occurrences_count": 0,
+            "taxa_count": 0,
+            "first_capture_timestamp": None,
+            "last_capture_timestamp": None,
+        }
+        for pk in pks
+    }
+
+    captures = (
+        SourceImage.objects.filter(deployment_id__in=pks)
+        .order_by()
+        .values("deployment_id")
+        .annotate(
+            count=models.Count("pk"),
+            size=models.Sum("size"),
+            first=models.Min("timestamp"),
+            last=models.Max("timestamp"),
+        )
+    )
+    for row in captures:
+        stats[row["deployment_id"]].update(
+            data_source_total_files=row["count"],
+            data_source_total_size=row["size"],
+            captures_count=row["count"],
+            first_capture_timestamp=row["first"],
+            last_capture_timestamp=row["last"],
+        )
+
+    events = (
+        Event.objects.filter(deployment_id__in=pks)
+        .order_by()
+        .values("deployment_id")
+        .annotate(count=models.Count("pk"))
+    )
+    for row in events:
+        stats[row["deployment_id"]]["events_count"] = row["count"]
+
+    detections = (
+        Detection.objects.filter(source_image__deployment_id__in=pks)
+        .order_by()
+        .values("source_image__deployment_id")
+        .annotate(count=models.Count("pk"))
+    )
+    for row in detections:
+        stats[row["source_image__deployment_id"]]["detections_count"] = row["count"]
+
+    # Only count occurrences that are confident enough and belong to an event, like the occurrences list
+    occurrences = (
+        Occurrence.objects.filter(
+            deployment_id__in=pks,
+            determination_score__gte=settings.DEFAULT_CONFIDENCE_THRESHOLD,
+            event__isnull=False,
+        )
+        .order_by()
+        .values("deployment_id")
+        .annotate(count=models.Count("pk"), taxa=models.Count("determination", distinct=True))
+    )
+    for row in occurrences:
+        stats[row["deployment_id"]].update(occurrences_count=row["count"], taxa_count=row["taxa"])
+
+    return stats
+
+
+def update_calculated_fields_for_deployments(
+    qs: models.QuerySet[Deployment] | None = None,
+    pks: list[typing.Any] | None = None,
+    save=True,
+) -> list[Deployment]:
+    """
+    Update the statistics of many deployments at once, e.g. all deployments of a project.
+
+    Each child table is aggregated once for all deployments and the deployments are saved with one bulk update.
+    """
+    qs = Deployment.objects.all() if qs is None else qs
+    if pks:
+        qs = qs.filter(pk__in=pks)
+    deployments = list(qs)
+
+    start_time = time.time()
+    stats = _calculate_deployment_stats([deployment.pk for deployment in deployments])
+    for deployment in deployments:
+        for field, value in stats[deployment.pk].items():
+            setattr(deployment, field, value)
+
+    if save:
+        Deployment.objects.bulk_update(deployments, DEPLOYMENT_CALCULATED_FIELDS, batch_size=500)
+    logger.info(f"Updated statistics of {len(deployments)} deployments in {time.time() - start_time:.2f} seconds")
+    return deployments
 
 
 @final
@@ -755,7 +1244,8 @@ class Event(BaseModel):
 
     def update_calculated_fields(self, save=False, updated_timestamp: datetime.datetime | None = None):
         """
-        Important: if you update a new field, add it to the bulk_update call in update_calculated_fields_for_events
+        Important: if you update a new field, add it to _event_calculated_fields, used by
+        update_calculated_fields_for_events
         """
         event = self
         if not event.group_by and event.start:
@@ -789,57 +1279,193 @@ class Event(BaseModel):
             self.update_calculated_fields(save=True)
 
 
+def _event_calculated_fields() -> dict[str, models.Expression]:
+    """
+    Expressions that recalculate the cached fields of an event in the same way as
+    `Event.update_calculated_fields`, with one aggregate subquery per field.
+    """
+    captures = SourceImage.objects.filter(event=models.OuterRef("pk")).order_by().values("event")
+    detections = (
+        Detection.objects.filter(source_image__event=models.OuterRef("pk")).order_by().values("source_image__event")
+    )
+    occurrences = (
+        Occurrence.objects.filter(
+            event=models.OuterRef("pk"), determination_score__gte=settings.DEFAULT_CONFIDENCE_THRESHOLD
+        )
+        .order_by()
+        .values("event")
+    )
+
+    def aggregate(qs: models.QuerySet, expression: models.Aggregate) -> models.Subquery:
+        return models.Subquery(qs.annotate(value=expression).values("value")[:1])
+
+    return {
+        # Keep the start and end times if the event has no captures with a timestamp
+        "start": Coalesce(aggregate(captures, models.Min("timestamp")), models.F("start")),
+        "end": Coalesce(aggregate(captures, models.Max("timestamp")), models.F("end")),
+        "captures_count": Coalesce(aggregate(captures, models.Count("pk", distinct=True)), 0),
+        "detections_count": Coalesce(aggregate(detections, models.Count("pk")), 0),
+        "occurrences_count": Coalesce(aggregate(occurrences, models.Count("pk", distinct=True)), 0),
+    }
+
+
 def update_calculated_fields_for_events(
     qs: models.QuerySet[Event] | None = None,
     pks: list[typing.Any] | None = None,
     last_updated: datetime.datetime | None = None,
     save=True,
-):
+) -> list[Event]:
     """
-    This function is called by a migration to update the calculated fields for all events.
+    Recalculate the start, end and counts of many events at once.
 
-    @TODO this can likely be abstracted to a more generic function that can be used for any model
-    """
-    to_update = []
+    All events are updated with a single UPDATE that uses correlated subqueries, instead of
+    several queries per event. With `save=False` the recalculated values are only set on the
+    returned events.
 
-    qs = qs or Event.objects.all()
+    This function is also called by a migration to update the calculated fields for all events.
+    """
+    qs = Event.objects.all() if qs is None else qs
     if pks:
         qs = qs.filter(pk__in=pks)
+    all_events = qs
     if last_updated:
         # query for None or before the last updated time
         qs = qs.filter(
             Q(calculated_fields_updated_at__isnull=True) | Q(calculated_fields_updated_at__lte=last_updated)
         )
 
-    logging.info(f"Updating pre-calculated fields for {len(to_update)} events")
-
     updated_timestamp = timezone.now()
-    for event in qs:
-        event.update_calculated_fields(save=False, updated_timestamp=updated_timestamp)
-        to_update.append(event)
+    calculated_fields = _event_calculated_fields()
 
-    if save:
-        updated_count = Event.objects.bulk_update(
-            to_update,
-            [
-                "group_by",
-                "start",
-                "end",
-                "project",
-                "captures_count",
-                "detections_count",
-                "occurrences_count",
-                "calculated_fields_updated_at",
-            ],
+    if not save:
+        events = list(qs.annotate(**{f"calculated_{name}": value for name, value in calculated_fields.items()}))
+        for event in events:
+            for name in calculated_fields:
+                setattr(event, name, getattr(event, f"calculated_{name}"))
+            event.calculated_fields_updated_at = updated_timestamp
+        return events
+
+    # Fill in the values that Event.update_calculated_fields sets for new events
+    qs.filter(project=None).exclude(deployment=None).update(
+        project=models.Subquery(Deployment.objects.filter(pk=models.OuterRef("deployment")).values("project")[:1])
+    )
+    qs.filter(group_by="").update(group_by=Cast(TruncDate("start"), output_field=models.CharField()))
+
+    updated_count = qs.update(**calculated_fields, calculated_fields_updated_at=updated_timestamp)
+    logger.info(f"Updated pre-calculated fields for {updated_count} events")
+    # The updated events no longer match the last_updated filter
+    return list(all_events.filter(calculated_fields_updated_at=updated_timestamp) if last_updated else qs)
+
+
+def _sessions_sql() -> str:
+    """
+    Common table expressions that number the sessions of a deployment's capture timestamps.
+
+    A new session starts wherever the gap to the previous timestamp is at least the max time gap,
+    the same way as `ami.utils.dates.group_datetimes_by_gap`.
+    """
+    return f"""
+        WITH timestamps AS (
+            SELECT DISTINCT "timestamp"
+            FROM {SourceImage._meta.db_table}
+            WHERE deployment_id = %(deployment_id)s AND "timestamp" IS NOT NULL
+        ),
+        gaps AS (
+            SELECT
+                "timestamp",
+                CASE WHEN "timestamp" - LAG("timestamp") OVER (ORDER BY "timestamp") >= %(max_time_gap)s
+                    THEN 1 ELSE 0 END AS new_session
+            FROM timestamps
+        ),
+        sessions AS (
+            SELECT "timestamp", SUM(new_session) OVER (ORDER BY "timestamp") AS session
+            FROM gaps
         )
-        if updated_count != len(to_update):
-            logging.error(f"Failed to update {len(to_update) - updated_count} events")
-    return to_update
+    """
+
+
+def _group_images_into_events_in_database(deployment: Deployment, max_time_gap: datetime.timedelta) -> list[Event]:
+    """
+    Group the captures of a deployment into events without loading their timestamps into Python.
+
+    Sessions are found with window functions, the missing events are created in bulk
+    and all captures are assigned to their event with a single UPDATE, joined on the session numbers.
+    """
+    params = {"deployment_id": deployment.pk, "max_time_gap": max_time_gap}
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            {_sessions_sql()}
+            SELECT session, MIN("timestamp"), MAX("timestamp"), COUNT(*)
+            FROM sessions
+            GROUP BY session
+            ORDER BY session
+            """,
+            params,
+        )
+        sessions = cursor.fetchall()
+
+    # Sessions that start on the same day share an event, like in the Python grouping
+    event_ranges: dict[str, tuple[datetime.datetime, datetime.datetime]] = {}
+    session_group_bys: dict[int, str] = {}
+    for session, start_date, end_date, num_timestamps in sessions:
+        logger.debug(f"Found session starting at {start_date} with {num_timestamps} images, ending at {end_date}")
+        group_by = str(start_date.date())
+        start, end = event_ranges.get(group_by, (start_date, end_date))
+        event_ranges[group_by] = (min(start, start_date), max(end, end_date))
+        session_group_bys[session] = group_by
+
+    event_ids = dict(
+        Event.objects.filter(deployment=deployment, group_by__in=event_ranges.keys()).values_list("group_by", "pk")
+    )
+    new_events = [
+        Event(deployment=deployment, project=deployment.project, group_by=group_by, start=start, end=end)
+        for group_by, (start, end) in event_ranges.items()
+        if group_by not in event_ids
+    ]
+    Event.objects.bulk_create(new_events, batch_size=1000)
+    logger.info(f"Created {len(new_events)} new events for deployment {deployment}")
+    event_ids.update({event.group_by: event.pk for event in new_events})
+    params["sessions"] = list(session_group_bys.keys())
+    params["event_ids"] = [event_ids[group_by] for group_by in session_group_bys.values()]
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            {_sessions_sql()}
+            UPDATE {SourceImage._meta.db_table} AS capture
+            SET event_id = session_events.event_id
+            FROM sessions
+            JOIN UNNEST(%(sessions)s::bigint[], %(event_ids)s::bigint[]) AS session_events(session, event_id)
+                ON session_events.session = sessions.session
+            WHERE capture.deployment_id = %(deployment_id)s
+                AND capture."timestamp" = sessions."timestamp"
+                AND capture.event_id IS DISTINCT FROM session_events.event_id
+            """,
+            params,
+        )
+        logger.info(f"Assigned {cursor.rowcount} captures to events for deployment {deployment}")
+
+    events = Event.objects.filter(pk__in=event_ids.values())
+    # Update start and end times and other cached fields
+    return update_calculated_fields_for_events(qs=events)
 
 
 def group_images_into_events(
-    deployment: Deployment, max_time_gap=datetime.timedelta(minutes=120), delete_empty=True
+    deployment: Deployment,
+    max_time_gap=datetime.timedelta(minutes=120),
+    delete_empty=True,
+    in_database: bool | None = None,
 ) -> list[Event]:
+    """
+    Group all captures of a deployment into events (monitoring sessions) by the time gaps between them.
+
+    With `in_database`, the sessions are found and assigned in the database, which scales to deployments
+    with millions of captures. Defaults to the EVENTS_GROUP_IN_DATABASE setting.
+    """
+    if in_database is None:
+        in_database = settings.EVENTS_GROUP_IN_DATABASE
+
     # Log a warning if multiple SourceImages have the same timestamp
     dupes = (
         SourceImage.objects.filter(deployment=deployment)
@@ -857,6 +1483,203 @@ def group_images_into_events(
             f"Only one image will be used for each timestamp for each event."
         )
 
+    if in_database:
+        events = _group_images_into_events_in_database(deployment, max_time_gap)
+    else:
+        image_timestamps = list(
+            SourceImage.objects.filter(deployment=deployment)
+            .exclude(timestamp=None)
+            .values_list("timestamp", flat=True)
+            .order_by("timestamp")
+            .distinct()
+        )
+
+        timestamp_groups = ami.utils.dates.group_timestamps_by_gap(image_timestamps, max_time_gap)
+        # @TODO this event grouping needs testing. Still getting events over 24 hours
+        # timestamp_groups = ami.utils.dates.group_datetimes_by_shifted_day(image_timestamps)
+
+        events = []
+        for start_date, end_date, num_timestamps in timestamp_groups.ranges():
+            events.append(_save_event_for_group(deployment, start_date, end_date, num_timestamps))
+
+    if delete_empty:
+        delete_empty_events(deployment=deployment)
+
+    for event in events:
+        # Set the width and height of all images in each event based on the first image
+        set_dimensions_for_collection(event)
+
+    events_over_24_hours = Event.objects.filter(
+        deployment=deployment, start__lt=models.F("end") - datetime.timedelta(days=1)
+    )
+    if events_over_24_hours.count():
+        logger.warning(f"Found {events_over_24_hours.count()} events over 24 hours in deployment {deployment}. ")
+    events_starting_before_noon = Event.objects.filter(
+        deployment=deployment, start__lt=models.F("start") + datetime.timedelta(hours=12)
+    )
+    if events_starting_before_noon.count():
+        logger.warning(
+            f"Found {events_starting_before_noon.count()} events starting before noon in deployment {deployment}. "
+        )
+
+    return events
+
+
+def _save_event_for_group(
+    deployment: Deployment, start_date: datetime.datetime, end_date: datetime.datetime, num_timestamps: int
+) -> Event:
+    """
+    Create or update the event for a group of capture timestamps and assign the captures to it.
+
+    The group must contain all timestamps of the deployment between its first and last timestamp.
+    """
+    # Print debugging info about groups
+    delta = end_date - start_date
+    hours = round(delta.seconds / 60 / 60, 1)
+    logger.debug(
+        f"Found session starting at {start_date} with {num_timestamps} images that ran for {hours} hours.\n"
+        f"From {start_date.strftime('%c')} to {end_date.strftime('%c')}."
+    )
+
+    # Creating events & assigning images
+    group_by = start_date.date()
+    event, _ = Event.objects.get_or_create(
+        deployment=deployment,
+        group_by=group_by,
+        defaults={"start": start_date, "end": end_date},
+    )
+    SourceImage.objects.filter(deployment=deployment, timestamp__gte=start_date, timestamp__lte=end_date).update(
+        event=event
+    )
+    event.save()  # Update start and end times and other cached fields
+    logger.info(
+        f"Created/updated event {event} with {num_timestamps} images for deployment {deployment}. "
+        f"Duration: {event.duration_label()}"
+    )
+    return event
+
+
+def _expand_range_for_regrouping(
+    captures: models.QuerySet["SourceImage"],
+    start: datetime.datetime,
+    end: datetime.datetime,
+    max_time_gap: datetime.timedelta,
+    event_pks: set[int],
+) -> tuple[datetime.datetime, datetime.datetime]:
+    """
+    Widen a time range until it covers every event that a capture within the range could join.
+
+    The events found are added to `event_pks`.
+    """
+    while True:
+        nearby_captures = captures.filter(timestamp__gt=start - max_time_gap, timestamp__lt=end + max_time_gap)
+        new_event_pks = set(nearby_captures.exclude(event=None).values_list("event_id", flat=True).distinct())
+        new_event_pks -= event_pks
+        if not new_event_pks:
+            return start, end
+        event_pks.update(new_event_pks)
+        bounds = captures.filter(event_id__in=new_event_pks).aggregate(
+            first=models.Min("timestamp"), last=models.Max("timestamp")
+        )
+        start = min(start, bounds["first"])
+        end = max(end, bounds["last"])
+
+
+def group_new_images_into_events(
+    deployment: Deployment,
+    since: datetime.datetime | None = None,
+    max_time_gap=datetime.timedelta(minutes=120),
+    delete_empty=True,
+    verify=False,
+) -> list[Event]:
+    """
+    Group only the new or changed captures of a deployment into events.
+
+    New captures are the ones without an event, changed captures are the ones updated after `since`.
+    Only the time ranges around those captures are regrouped, the same way `group_images_into_events`
+    would regroup them, so the events in the rest of the deployment are not touched.
+
+    Returns the events that were created or updated. With `verify`, the result is compared to a
+    full regroup (see `diff_events_with_full_regroup`) and a full regroup is run if they differ.
+    """
+    captures = SourceImage.objects.filter(deployment=deployment).exclude(timestamp=None).order_by()
+    changed = Q(event=None)
+    if since:
+        changed |= Q(updated_at__gte=since)
+    changed_captures = captures.filter(changed)
+
+    # Start from the sessions formed by the changed captures alone and the events they were in before
+    changed_timestamps = sorted(set(changed_captures.values_list("timestamp", flat=True)))
+    ranges = [
+        (group[0], group[-1])
+        for group in ami.utils.dates.group_datetimes_by_gap(changed_timestamps, max_time_gap)
+        if group
+    ]
+    previous_event_pks = set(changed_captures.exclude(event=None).values_list("event_id", flat=True).distinct())
+    if previous_event_pks:
+        for previous_event in (
+            captures.filter(event_id__in=previous_event_pks)
+            .values("event_id")
+            .annotate(first=models.Min("timestamp"), last=models.Max("timestamp"))
+        ):
+            ranges.append((previous_event["first"], previous_event["last"]))
+
+    affected_event_pks = set(previous_event_pks)
+    expanded_ranges = sorted(
+        _expand_range_for_regrouping(captures, start, end, max_time_gap, affected_event_pks) for start, end in ranges
+    )
+
+    # Merge the ranges that overlap or are close enough that their captures may join the same event
+    merged_ranges: list[list[datetime.datetime]] = []
+    for start, end in expanded_ranges:
+        if merged_ranges and start - merged_ranges[-1][1] < max_time_gap:
+            merged_ranges[-1][1] = max(merged_ranges[-1][1], end)
+        else:
+            merged_ranges.append([start, end])
+
+    logger.info(
+        f"Regrouping {len(changed_timestamps)} new or changed timestamps in {len(merged_ranges)} time ranges "
+        f"with {len(affected_event_pks)} existing events for deployment {deployment}"
+    )
+
+    events = []
+    for start, end in merged_ranges:
+        image_timestamps = list(
+            captures.filter(timestamp__gte=start, timestamp__lte=end)
+            .values_list("timestamp", flat=True)
+            .order_by("timestamp")
+            .distinct()
+        )
+        for start_date, end_date, num_timestamps in ami.utils.dates.group_timestamps_by_gap(
+            image_timestamps, max_time_gap
+        ).ranges():
+            events.append(_save_event_for_group(deployment, start_date, end_date, num_timestamps))
+
+    if delete_empty and affected_event_pks:
+        delete_empty_events(deployment=deployment, qs=Event.objects.filter(pk__in=affected_event_pks))
+
+    for event in events:
+        set_dimensions_for_collection(event)
+
+    if verify:
+        differences = diff_events_with_full_regroup(deployment, max_time_gap)
+        if differences:
+            for difference in differences:
+                logger.error(
+                    f"Incremental grouping of deployment {deployment} differs from a full regroup: {difference}"
+                )
+            logger.warning(f"Running a full regroup of deployment {deployment}")
+            return group_images_into_events(deployment, max_time_gap=max_time_gap, delete_empty=delete_empty)
+
+    return events
+
+
+def diff_events_with_full_regroup(deployment: Deployment, max_time_gap=datetime.timedelta(minutes=120)) -> list[str]:
+    """
+    Compare the current events of a deployment to the events that `group_images_into_events` would create.
+
+    Nothing is changed. Returns a description of each difference, an empty list means the events match.
+    """
     image_timestamps = list(
         SourceImage.objects.filter(deployment=deployment)
         .exclude(timestamp=None)
@@ -864,107 +1687,269 @@ def group_images_into_events(
         .order_by("timestamp")
         .distinct()
     )
-
-    timestamp_groups = ami.utils.dates.group_datetimes_by_gap(image_timestamps, max_time_gap)
-    # @TODO this event grouping needs testing. Still getting events over 24 hours
-    # timestamp_groups = ami.utils.dates.group_datetimes_by_shifted_day(image_timestamps)
-
-    events = []
-    for group in timestamp_groups:
+    expected_events: dict[str, tuple[datetime.datetime, datetime.datetime]] = {}
+    expected_group_by: dict[datetime.datetime, str] = {}
+    for group in ami.utils.dates.group_datetimes_by_gap(image_timestamps, max_time_gap):
         if not len(group):
             continue
+        # Groups that start on the same day share an event, see group_images_into_events
+        group_by = str(group[0].date())
+        start, end = expected_events.get(group_by, (group[0], group[-1]))
+        expected_events[group_by] = (min(start, group[0]), max(end, group[-1]))
+        for timestamp in group:
+            expected_group_by[timestamp] = group_by
+
+    differences = []
+    captures = (
+        SourceImage.objects.filter(deployment=deployment)
+        .exclude(timestamp=None)
+        .values_list("timestamp", "event__deployment_id", "event__group_by")
+        .order_by("timestamp")
+        .distinct()
+    )
+    for timestamp, event_deployment_id, group_by in captures:
+        if event_deployment_id != deployment.pk or group_by != expected_group_by[timestamp]:
+            differences.append(
+                f"Capture at {timestamp} is in event '{group_by}', expected '{expected_group_by[timestamp]}'"
+            )
 
-        start_date = group[0]
-        end_date = group[-1]
+    events = (
+        Event.objects.filter(deployment=deployment)
+        .annotate(first_timestamp=models.Min("captures__timestamp"), last_timestamp=models.Max("captures__timestamp"))
+        .exclude(first_timestamp=None)
+    )
+    for event in events:
+        expected = expected_events.pop(event.group_by, None)
+        if not expected:
+            differences.append(f"Event '{event.group_by}' would not exist")
+        elif (event.first_timestamp, event.last_timestamp) != expected or (event.start, event.end) != expected:
+            differences.append(
+                f"Event '{event.group_by}' spans {event.start} to {event.end}, expected {expected[0]} to {expected[1]}"
+            )
+    for group_by in expected_events:
+        differences.append(f"Event '{group_by}' is missing")
 
-        # Print debugging info about groups
-        delta = end_date - start_date
-        hours = round(delta.seconds / 60 / 60, 1)
-        logger.debug(
-            f"Found session starting at {start_date} with {len(group)} images that ran for {hours} hours.\n"
-            f"From {start_date.strftime('%c')} to {end_date.strftime('%c')}."
-        )
+    return differences
 
-        # Creating events & assigning images
-        group_by = start_date.date()
-        event, _ = Event.objects.get_or_create(
-            deployment=deployment,
-            group_by=group_by,
-            defaults={"start": start_date, "end": end_date},
-        )
-        events.append(event)
-        SourceImage.objects.filter(deployment=deployment, timestamp__in=group).update(event=event)
-        event.save()  # Update start and end times and other cached fields
-        logger.info(
-            f"Created/updated event {event} with {len(group)} images for deployment {deployment}. "
-            f"Duration: {event.duration_label()}"
-        )
 
-    if delete_empty:
-        delete_empty_events()
+def empty_events(
+    deployment: Deployment | None = None, qs: models.QuerySet[Event] | None = None
+) -> models.QuerySet[Event]:
+    """
+    Events that have no captures and no occurrences, optionally only from one deployment or a queryset of events.
+    """
+    events = Event.objects.all() if qs is None else qs
+    if deployment:
+        events = events.filter(deployment=deployment)
+    return events.filter(
+        ~models.Exists(SourceImage.objects.filter(event=models.OuterRef("pk"))),
+        ~models.Exists(Occurrence.objects.filter(event=models.OuterRef("pk"))),
+    ).order_by()
 
-    for event in events:
-        # Set the width and height of all images in each event based on the first image
-        set_dimensions_for_collection(event)
 
-    events_over_24_hours = Event.objects.filter(
-        deployment=deployment, start__lt=models.F("end") - datetime.timedelta(days=1)
-    )
-    if events_over_24_hours.count():
-        logger.warning(f"Found {events_over_24_hours.count()} events over 24 hours in deployment {deployment}. ")
-    events_starting_before_noon = Event.objects.filter(
-        deployment=deployment, start__lt=models.F("start") + datetime.timedelta(hours=12)
-    )
-    if events_starting_before_noon.count():
-        logger.warning(
-            f"Found {events_starting_before_noon.count()} events starting before noon in deployment {deployment}. "
-        )
+def delete_empty_events(
+    deployment: Deployment | None = None,
+    qs: models.QuerySet[Event] | None = None,
+    dry_run=False,
+    chunk_size=1000,
+) -> int:
+    """
+    Delete events that have no images, occurrences or other related records.
+
+    Pass a deployment or a queryset to only check some of the events, otherwise all events are checked.
+    Events are deleted in chunks. With `dry_run`, the empty events are only reported.
+
+    Returns the number of empty events found (or deleted).
+    """
+
+    # @TODO Search all models that have a foreign key to Event
+    # related_models = [
+    #     f.related_model
+    #     for f in Event._meta.get_fields()
+    #     if f.one_to_many or f.one_to_one or (f.many_to_many and f.auto_created)
+    # ]
+
+    events = empty_events(deployment=deployment, qs=qs)
+
+    if dry_run:
+        count = events.count()
+        if count:
+            examples = ", ".join(str(event) for event in events.select_related("deployment")[:5])
+            logger.info(f"Would delete {count} empty events (dry run), e.g. {examples}")
+        return count
+
+    num_deleted = 0
+    while True:
+        pks = list(events.values_list("pk", flat=True)[:chunk_size])
+        if not pks:
+            break
+        # Check again that the events are empty when deleting them
+        _, deleted_per_model = empty_events(qs=Event.objects.filter(pk__in=pks)).delete()
+        num_deleted_in_chunk = deleted_per_model.get(Event._meta.label, 0)
+        if not num_deleted_in_chunk:
+            logger.error(f"Could not delete empty events: {pks}")
+            break
+        num_deleted += num_deleted_in_chunk
+    logger.info(f"Deleted {num_deleted} empty events" + (f" from deployment {deployment}" if deployment else ""))
+    return num_deleted
+
+
+def sample_events(deployment: Deployment, day_interval: int = 3) -> typing.Generator[Event, None, None]:
+    """
+    Return a sample of events from the deployment, evenly spaced apart by day_interval.
+    """
+
+    last_event = None
+    for event in Event.objects.filter(deployment=deployment).order_by("start"):
+        if not last_event:
+            yield event
+            last_event = event
+        else:
+            delta = event.start - last_event.start
+            if delta.days >= day_interval:
+                yield event
+                last_event = event
+
+
+class AbstractModelBase(abc.ABCMeta, ModelBase):
+    """
+    The metaclass of abstract models that declare methods with `abc.abstractmethod`,
+    so that a subclass that doesn't implement all of them can't be instantiated.
+    """
+
+
+class StorageSource(BaseModel, metaclass=AbstractModelBase):
+    """
+    A location that captures are synced from, e.g. an S3 bucket or a local directory.
+
+    Subclasses implement the listing, reading and URLs for their type of storage.
+    Paths are relative to the root of the storage source.
+    """
+
+    total_size = models.BigIntegerField(null=True, blank=True)
+    total_files = models.BigIntegerField(null=True, blank=True)
+    totals_by_prefix = models.JSONField(
+        null=True,
+        blank=True,
+        help_text="The number of files and total size in each top-level subdirectory, from the last size calculation.",
+    )
+    last_checked = models.DateTimeField(null=True, blank=True)
+
+    deployments: models.QuerySet["Deployment"]
+
+    class Meta:
+        abstract = True
+
+    @abc.abstractmethod
+    def uri(self, path: str | None = None) -> str:
+        """Return the full URI for the given path."""
+
+    @abc.abstractmethod
+    def list_files(
+        self,
+        subdir: str | None = None,
+        regex_filter: str | None = None,
+        start_after: str | None = None,
+        modified_after: datetime.datetime | None = None,
+        max_workers: int = 1,
+        on_shard_complete: typing.Callable[[str, int, int], None] | None = None,
+    ) -> typing.Iterator[tuple[ami.utils.s3.ObjectTypeDef | None, int]]:
+        """
+        Recursively list the image files, with the same output and filters as `ami.utils.s3.list_files_paginated`.
+        """
+
+    @abc.abstractmethod
+    def count_files_by_prefix(self, previous: dict | None = None, max_workers: int = 8) -> dict:
+        """Count the files and total size in each top-level subdirectory, see `ami.utils.s3.count_files_by_prefix`."""
+
+    @abc.abstractmethod
+    def read_image_header(self, path: str) -> PIL.Image.Image:
+        """Read the header of an image to get its size and EXIF data, without the pixel data."""
+
+    @abc.abstractmethod
+    def read_image_headers(
+        self, paths: typing.Iterable[str], max_workers: int = 16
+    ) -> typing.Iterator[tuple[str, PIL.Image.Image | None]]:
+        """Read the headers of many images concurrently, see `read_image_header`."""
+
+    @abc.abstractmethod
+    def read_exifs(
+        self, paths: typing.Iterable[str], max_workers: int = 16
+    ) -> typing.Iterator[tuple[str, PIL.Image.Exif | None]]:
+        """Read the EXIF data of many images concurrently, only reading the start of each file."""
+
+    @abc.abstractmethod
+    def public_url(self, path: str) -> str | None:
+        """Return the public URL for the given path, or None if the files are not served publicly."""
+
+    @abc.abstractmethod
+    def test_connection(
+        self, subdir: str | None = None, regex_filter: str | None = None
+    ) -> ami.utils.storages.ConnectionTestResult:
+        """Check that the storage can be reached and list its first file."""
+
+    def deployments_count(self) -> int:
+        return self.deployments.count()
+
+    def total_files_indexed(self) -> int:
+        return self.deployments.aggregate(total_files=models.Sum("data_source_total_files"))["total_files"]
+
+    @functools.cache
+    def total_size_indexed(self) -> int:
+        return self.deployments.aggregate(total_size=models.Sum("data_source_total_size"))["total_size"]
 
-    return events
+    def total_size_indexed_display(self) -> str:
+        return filesizeformat(self.total_size_indexed())
 
+    def total_captures_indexed(self) -> int:
+        return self.deployments.aggregate(total_captures=models.Sum("captures_count"))["total_captures"]
 
-def delete_empty_events(dry_run=False):
-    """
-    Delete events that have no images, occurrences or other related records.
-    """
+    def count_files(self):
+        """Count & save the number of files in the storage source."""
 
-    # @TODO Search all models that have a foreign key to Event
-    # related_models = [
-    #     f.related_model
-    #     for f in Event._meta.get_fields()
-    #     if f.one_to_many or f.one_to_one or (f.many_to_many and f.auto_created)
-    # ]
+        self.calculate_size()
+        return self.total_files
 
-    events = Event.objects.annotate(num_images=models.Count("captures")).filter(num_images=0)
-    events = events.annotate(num_occurrences=models.Count("occurrences")).filter(num_occurrences=0)
+    def calculate_size(self, full: bool = False, max_workers: int = 8):
+        """
+        Calculate the total size and count of all files in the storage source.
 
-    if dry_run:
-        for event in events:
-            logger.debug(f"Would delete event {event} (dry run)")
-    else:
-        logger.info(f"Deleting {events.count()} empty events")
-        events.delete()
+        The top-level subdirectories are counted concurrently, and the totals of each are saved.
+        Subdirectories without new files since the last calculation are not counted again,
+        unless `full` is True. See `ami.utils.s3.count_files_by_prefix`.
+        """
 
+        self.totals_by_prefix = self.count_files_by_prefix(
+            previous=None if full else self.totals_by_prefix,
+            max_workers=max_workers,
+        )
+        self.total_size = sum(totals["size"] for totals in self.totals_by_prefix.values())
+        self.total_files = sum(totals["files"] for totals in self.totals_by_prefix.values())
+        self.last_checked = timezone.now()
+        self.save()
+        return self.total_size
 
-def sample_events(deployment: Deployment, day_interval: int = 3) -> typing.Generator[Event, None, None]:
-    """
-    Return a sample of events from the deployment, evenly spaced apart by day_interval.
-    """
+    def size_by_prefix(self) -> list[tuple[str, int, int]]:
+        """Return (prefix, total size, number of files) for each subdirectory, largest first."""
 
-    last_event = None
-    for event in Event.objects.filter(deployment=deployment).order_by("start"):
-        if not last_event:
-            yield event
-            last_event = event
-        else:
-            delta = event.start - last_event.start
-            if delta.days >= day_interval:
-                yield event
-                last_event = event
+        return sorted(
+            ((prefix, totals["size"], totals["files"]) for prefix, totals in (self.totals_by_prefix or {}).items()),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+
+    def save(self, *args, **kwargs):
+        # If public_base_url has changed, update the urls for all source images
+        if self.pk:
+            old = self.__class__.objects.get(pk=self.pk)
+            if old.public_base_url != self.public_base_url:
+                for deployment in self.deployments.all():
+                    ami.tasks.update_public_urls.delay(deployment.pk, self.public_base_url)
+        super().save(*args, **kwargs)
 
 
 @final
-class S3StorageSource(BaseModel):
+class S3StorageSource(StorageSource):
     """
     Per-deployment configuration for an S3 bucket.
     """
@@ -976,15 +1961,10 @@ class S3StorageSource(BaseModel):
     secret_key = models.TextField()
     endpoint_url = models.CharField(max_length=255, blank=True, null=True)
     public_base_url = models.CharField(max_length=255, blank=True, null=True)
-    total_size = models.BigIntegerField(null=True, blank=True)
-    total_files = models.BigIntegerField(null=True, blank=True)
-    last_checked = models.DateTimeField(null=True, blank=True)
     # last_check_duration = models.DurationField(null=True, blank=True)
     # use_signed_urls = models.BooleanField(default=False)
     project = models.ForeignKey(Project, on_delete=models.SET_NULL, null=True, related_name="storage_sources")
 
-    deployments: models.QuerySet["Deployment"]
-
     @property
     def config(self) -> ami.utils.s3.S3Config:
         return ami.utils.s3.S3Config(
@@ -996,45 +1976,55 @@ class S3StorageSource(BaseModel):
             public_base_url=self.public_base_url,
         )
 
-    def deployments_count(self) -> int:
-        return self.deployments.count()
-
-    def total_files_indexed(self) -> int:
-        return self.deployments.aggregate(total_files=models.Sum("data_source_total_files"))["total_files"]
-
-    @functools.cache
-    def total_size_indexed(self) -> int:
-        return self.deployments.aggregate(total_size=models.Sum("data_source_total_size"))["total_size"]
-
-    def total_size_indexed_display(self) -> str:
-        return filesizeformat(self.total_size_indexed())
-
-    def total_captures_indexed(self) -> int:
-        return self.deployments.aggregate(total_captures=models.Sum("captures_count"))["total_captures"]
+    def list_files(
+        self,
+        subdir: str | None = None,
+        regex_filter: str | None = None,
+        start_after: str | None = None,
+        modified_after: datetime.datetime | None = None,
+        max_workers: int = 1,
+        on_shard_complete: typing.Callable[[str, int, int], None] | None = None,
+    ):
+        """
+        Recursively list files in the bucket/prefix.
 
-    def list_files(self, limit=None):
-        """Recursively list files in the bucket/prefix."""
+        The top-level subdirectories are listed concurrently if `max_workers` is more than 1.
+        """
 
-        return ami.utils.s3.list_files_paginated(self.config, limit=limit)
+        if max_workers > 1:
+            return ami.utils.s3.list_files_sharded(
+                self.config,
+                subdir=subdir,
+                regex_filter=regex_filter,
+                max_workers=max_workers,
+                on_shard_complete=on_shard_complete,
+                start_after=start_after,
+                modified_after=modified_after,
+            )
+        else:
+            return ami.utils.s3.list_files_paginated(
+                self.config,
+                subdir=subdir,
+                regex_filter=regex_filter,
+                start_after=start_after,
+                modified_after=modified_after,
+            )
 
-    def count_files(self):
-        """Count & save the number of files in the bucket/prefix."""
+    def count_files_by_prefix(self, previous: dict | None = None, max_workers: int = 8) -> dict:
+        return ami.utils.s3.count_files_by_prefix(self.config, previous=previous, max_workers=max_workers)
 
-        count = ami.utils.s3.count_files_paginated(self.config)
-        self.total_files = count
-        self.save()
-        return count
+    def read_image_header(self, path: str) -> PIL.Image.Image:
+        return ami.utils.s3.read_image_header(self.config, key=path)
 
-    def calculate_size(self):
-        """Calculate the total size and count of all files in the bucket/prefix."""
+    def read_image_headers(
+        self, paths: typing.Iterable[str], max_workers: int = 16
+    ) -> typing.Iterator[tuple[str, PIL.Image.Image | None]]:
+        return ami.utils.s3.read_image_headers(self.config, paths, max_workers=max_workers)
 
-        sizes = [obj["Size"] for obj, _num_files_checked in self.list_files() if obj]  # type: ignore
-        size = sum(sizes)
-        count = len(sizes)
-        self.total_size = size
-        self.total_files = count
-        self.save()
-        return size
+    def read_exifs(
+        self, paths: typing.Iterable[str], max_workers: int = 16
+    ) -> typing.Iterator[tuple[str, PIL.Image.Exif | None]]:
+        return ami.utils.s3.read_exifs(self.config, paths, max_workers=max_workers)
 
     def uri(self, path: str | None = None):
         """Return the full URI for the given path."""
@@ -1054,14 +2044,80 @@ class S3StorageSource(BaseModel):
 
         return ami.utils.s3.test_connection(self.config, subdir=subdir, regex_filter=regex_filter)
 
-    def save(self, *args, **kwargs):
-        # If public_base_url has changed, update the urls for all source images
-        if self.pk:
-            old = S3StorageSource.objects.get(pk=self.pk)
-            if old.public_base_url != self.public_base_url:
-                for deployment in self.deployments.all():
-                    ami.tasks.update_public_urls.delay(deployment.pk, self.public_base_url)
-        super().save(*args, **kwargs)
+
+@final
+class LocalStorageSource(StorageSource):
+    """
+    A directory on the local disk or a network mount, served by a static file server at `public_base_url`.
+    """
+
+    name = models.CharField(max_length=255)
+    path = models.CharField(max_length=1024, help_text="The absolute path of the directory on the server.")
+    public_base_url = models.CharField(
+        max_length=255,
+        blank=True,
+        null=True,
+        help_text="The URL where the static file server serves the contents of the directory.",
+    )
+    project = models.ForeignKey(Project, on_delete=models.SET_NULL, null=True, related_name="local_storage_sources")
+
+    @property
+    def config(self) -> ami.utils.local.LocalConfig:
+        return ami.utils.local.LocalConfig(root=self.path, public_base_url=self.public_base_url)
+
+    def list_files(
+        self,
+        subdir: str | None = None,
+        regex_filter: str | None = None,
+        start_after: str | None = None,
+        modified_after: datetime.datetime | None = None,
+        max_workers: int = 1,
+        on_shard_complete: typing.Callable[[str, int, int], None] | None = None,
+    ):
+        """Recursively list files in the directory, scanning subdirectories with `max_workers` threads."""
+
+        return ami.utils.local.list_files(
+            self.config,
+            subdir=subdir,
+            regex_filter=regex_filter,
+            max_workers=max_workers,
+            start_after=start_after,
+            modified_after=modified_after,
+        )
+
+    def count_files_by_prefix(self, previous: dict | None = None, max_workers: int = 8) -> dict:
+        return ami.utils.local.count_files_by_prefix(self.config, previous=previous, max_workers=max_workers)
+
+    def read_image_header(self, path: str) -> PIL.Image.Image:
+        return ami.utils.local.read_image_header(self.config, key=path)
+
+    def read_image_headers(
+        self, paths: typing.Iterable[str], max_workers: int = 16
+    ) -> typing.Iterator[tuple[str, PIL.Image.Image | None]]:
+        return ami.utils.local.read_image_headers(self.config, paths, max_workers=max_workers)
+
+    def read_exifs(
+        self, paths: typing.Iterable[str], max_workers: int = 16
+    ) -> typing.Iterator[tuple[str, PIL.Image.Exif | None]]:
+        return ami.utils.local.read_exifs(self.config, paths, max_workers=max_workers)
+
+    def uri(self, path: str | None = None):
+        """Return the full URI for the given path."""
+
+        full_path = "/".join(str(part).strip("/") for part in [self.path, path] if part)
+        return f"file:///{full_path}"
+
+    def public_url(self, path: str) -> str | None:
+        """Return the URL of the file on the static file server, or None if `public_base_url` is not set."""
+
+        return ami.utils.local.public_url(self.config, path)
+
+    def test_connection(
+        self, subdir: str | None = None, regex_filter: str | None = None
+    ) -> ami.utils.storages.ConnectionTestResult:
+        """Test that the directory can be read."""
+
+        return ami.utils.local.test_connection(self.config, subdir=subdir, regex_filter=regex_filter)
 
 
 def validate_filename_timestamp(filename: str) -> None:
@@ -1140,6 +2196,8 @@ def delete_source_image(sender, instance, **kwargs):
         instance.source_image = None
         instance.save()
         source_image.delete()
+        # The events of the deployment may have lost captures
+        queue_regroup_events(instance.deployment.pk)
     # @TODO Use a "dirty" flag to mark the deployment as having new uploads, needs refresh
     instance.deployment.save()
 
@@ -1162,6 +2220,9 @@ class SourceImage(BaseModel):
 
     # Precaclulated values
     detections_count = models.IntegerField(null=True, blank=True)
+    sync_generation = models.IntegerField(
+        null=True, blank=True, help_text="The generation of the last sync of the data source that saw this file."
+    )
 
     project = models.ForeignKey(Project, on_delete=models.SET_NULL, null=True, related_name="captures")
     deployment = models.ForeignKey(Deployment, on_delete=models.SET_NULL, null=True, related_name="captures")
@@ -1193,14 +2254,9 @@ class SourceImage(BaseModel):
         @TODO every source image request requires joins for the deployment and data source, is this necessary?
         """
         # Get presigned URL if access keys are configured
-        data_source = self.deployment.data_source if self.deployment and self.deployment.data_source else None
-        if (
-            data_source is not None
-            and not data_source.public_base_url
-            and data_source.access_key
-            and data_source.secret_key
-        ):
-            url = ami.utils.s3.get_presigned_url(data_source.config, key=self.path)
+        data_source = self.get_private_data_source()
+        if data_source is not None:
+            url = self._presigned_url or ami.utils.s3.get_presigned_url(data_source.config, key=self.path)
         elif self.public_base_url:
             url = urllib.parse.urljoin(self.public_base_url, self.path.lstrip("/"))
         else:
@@ -1224,6 +2280,23 @@ class SourceImage(BaseModel):
     # backwards compatibility
     url = public_url
 
+    # Set in bulk for lists of captures by `presign_source_image_urls`
+    _presigned_url: str | None = None
+
+    def get_private_data_source(self) -> typing.Optional["S3StorageSource"]:
+        """
+        Return the data source of the deployment if URLs to its images must be presigned.
+        """
+        data_source = self.deployment.data_source if self.deployment and self.deployment.data_source else None
+        if (
+            data_source is not None
+            and not data_source.public_base_url
+            and data_source.access_key
+            and data_source.secret_key
+        ):
+            return data_source
+        return None
+
     def get_detections_count(self) -> int:
         return self.detections.distinct().count()
 
@@ -1235,21 +2308,23 @@ class SourceImage(BaseModel):
 
         If the public_base_url is None, a presigned URL will be generated for each request.
         """
-        if self.deployment and self.deployment.data_source and self.deployment.data_source.public_base_url:
-            return self.deployment.data_source.public_base_url
+        storage_source = self.deployment.get_storage_source() if self.deployment else None
+        if storage_source and storage_source.public_base_url:
+            return storage_source.public_base_url
         else:
             return None
 
     def extract_timestamp(self) -> datetime.datetime | None:
         """
-        Extract a timestamp from the filename or EXIF data
+        Extract a timestamp from the filename.
+
+        Reading the EXIF data of each image while syncing would be too slow, captures without a timestamp
+        in their filename are filled in afterwards by `set_timestamps_from_exif_for_captures`.
         """
-        # @TODO use EXIF data if necessary (use methods in AMI data companion repo)
         timestamp = ami.utils.dates.get_image_timestamp_from_filename(self.path)
         if not timestamp:
-            # timestamp = ami.utils.dates.get_image_timestamp_from_exif(self.path)
-            msg = f"No timestamp could be extracted from the filename or EXIF data of {self.path}"
-            logger.error(msg)
+            msg = f"No timestamp could be extracted from the filename of {self.path}, it will be read from EXIF data"
+            logger.warning(msg)
         return timestamp
 
     def event_next_capture_id(self) -> int | None:
@@ -1306,10 +2381,10 @@ class SourceImage(BaseModel):
 
     def get_dimensions(self) -> tuple[int | None, int | None]:
         """Calculate the width and height of the original image."""
-        if self.path and self.deployment and self.deployment.data_source:
-            config = self.deployment.data_source.config
+        storage_source = self.deployment.get_storage_source() if self.deployment else None
+        if self.path and storage_source:
             try:
-                img = ami.utils.s3.read_image(config=config, key=self.path)
+                img = storage_source.read_image_header(self.path)
             except Exception as e:
                 logger.error(f"Could not determine image dimensions for {self.path}: {e}")
             else:
@@ -1318,8 +2393,8 @@ class SourceImage(BaseModel):
                 return self.width, self.height
         return None, None
 
-    def update_calculated_fields(self, save=False):
-        if self.path and not self.timestamp:
+    def update_calculated_fields(self, save=False, extract_timestamp=True):
+        if self.path and not self.timestamp and extract_timestamp:
             self.timestamp = self.extract_timestamp()
         if self.path and not self.public_base_url:
             self.public_base_url = self.get_base_url()
@@ -1357,7 +2432,7 @@ def update_detection_counts(qs: models.QuerySet[SourceImage] | None = None, null
 
     @TODO Needs testing.
     """
-    qs = qs or SourceImage.objects.all()
+    qs = SourceImage.objects.all() if qs is None else qs
     if null_only:
         qs = qs.filter(detections_count__isnull=True)
 
@@ -1377,6 +2452,266 @@ def update_detection_counts(qs: models.QuerySet[SourceImage] | None = None, null
     return num_updated
 
 
+class PendingRecalculation(BaseModel):
+    """
+    An object whose pre-calculated fields (counts, first and last timestamps) are out of date.
+
+    Code that writes many detections or captures at once marks the affected objects here
+    with `mark_for_recalculation` instead of recalculating them on every save.
+    A debounced task recalculates each marked object once, in bulk.
+    """
+
+    model_name = models.CharField(max_length=255)
+    object_id = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["model_name", "object_id"], name="unique_pending_recalculation"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.model_name} #{self.object_id}"
+
+
+def _recalculate_source_images(pks: list[int]):
+    update_detection_counts(SourceImage.objects.filter(pk__in=pks))
+
+
+def _recalculate_events(pks: list[int]):
+    update_calculated_fields_for_events(pks=pks)
+
+
+def _recalculate_deployments(pks: list[int]) -> list[int]:
+    # Deployments that a task is regrouping are left marked for a later run
+    locked_pks = lock_deployments(pks)
+    update_calculated_fields_for_deployments(pks=locked_pks)
+    return locked_pks
+
+
+# In the order they are recalculated, events and deployments include the counts of their captures.
+# Each function returns the objects it recalculated, or None if it recalculated all of them.
+RECALCULATE_PENDING: dict[str, typing.Callable[[list[int]], list[int] | None]] = {
+    "SourceImage": _recalculate_source_images,
+    "Event": _recalculate_events,
+    "Deployment": _recalculate_deployments,
+}
+
+
+def schedule_pending_recalculation():
+    """
+    Queue the task that recalculates the marked objects, unless one is already waiting.
+    """
+    delay = settings.PENDING_RECALCULATION_DELAY
+    # Objects marked while the task waits are included when it runs
+    if cache.add("pending-recalculation-scheduled", True, timeout=delay):
+        ami.tasks.recalculate_pending.apply_async(countdown=delay)
+
+
+def mark_for_recalculation(model_name: str, pks: typing.Iterable[typing.Any]):
+    """
+    Mark objects whose pre-calculated fields need to be updated, and schedule the update.
+
+    Marking an object that is already marked does nothing, so this is cheap to call on every write.
+    """
+    mark_many_for_recalculation({model_name: pks})
+
+
+def mark_many_for_recalculation(pks_by_model: dict[str, typing.Iterable[typing.Any]]):
+    """
+    Mark objects of several models at once with a single insert, see `mark_for_recalculation`.
+    """
+    pending = []
+    for model_name, pks in pks_by_model.items():
+        assert model_name in RECALCULATE_PENDING, f"Can't recalculate the fields of {model_name}"
+        pending.extend(PendingRecalculation(model_name=model_name, object_id=pk) for pk in set(pks) if pk is not None)
+    if not pending:
+        return
+    PendingRecalculation.objects.bulk_create(pending, ignore_conflicts=True)
+    transaction.on_commit(schedule_pending_recalculation)
+
+
+def recalculate_pending(batch_size: int = 1000) -> dict[str, int]:
+    """
+    Recalculate the pre-calculated fields of all marked objects, each of them once.
+
+    Several workers can run this at the same time, each one takes different objects.
+    Objects that can't be recalculated now stay marked for the next run.
+    Returns the number of objects recalculated per model.
+    """
+    counts = {}
+    for model_name, recalculate in RECALCULATE_PENDING.items():
+        counts[model_name] = 0
+        skipped_pks: list[int] = []
+        while True:
+            with transaction.atomic():
+                pending = list(
+                    PendingRecalculation.objects.select_for_update(skip_locked=True)
+                    .filter(model_name=model_name)
+                    .exclude(pk__in=skipped_pks)
+                    .order_by("pk")
+                    .values_list("pk", "object_id")[:batch_size]
+                )
+                if not pending:
+                    break
+                recalculated = recalculate([object_id for _, object_id in pending])
+                recalculated_ids = None if recalculated is None else set(recalculated)
+                done_pks = {
+                    pk for pk, object_id in pending if recalculated_ids is None or object_id in recalculated_ids
+                }
+                skipped_pks.extend(pk for pk, _ in pending if pk not in done_pks)
+                # The rows stay locked until the end of the transaction, so objects marked again
+                # in the meantime get a new row and are recalculated by the next run
+                PendingRecalculation.objects.filter(pk__in=done_pks).delete()
+            counts[model_name] += len(done_pks)
+        if counts[model_name]:
+            logger.info(f"Recalculated fields of {counts[model_name]} {model_name} objects")
+    return counts
+
+
+# First key of the Postgres advisory locks held by the maintenance tasks of a deployment, the second is its id
+DEPLOYMENT_LOCK_KEY = 7301
+
+
+@contextlib.contextmanager
+def deployment_lock(deployment_id: int) -> typing.Iterator[bool]:
+    """
+    Try to take the lock on the maintenance tasks of a deployment (e.g. regrouping its captures into events).
+
+    Yields whether the lock was taken, without waiting for it. Postgres releases the lock if the worker
+    dies, so a crashed task can't block the deployment.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock(%s, %s)", [DEPLOYMENT_LOCK_KEY, deployment_id])
+        (locked,) = cursor.fetchone()
+    try:
+        yield locked
+    finally:
+        if locked:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s, %s)", [DEPLOYMENT_LOCK_KEY, deployment_id])
+
+
+def lock_deployments(deployment_ids: typing.Iterable[int]) -> list[int]:
+    """
+    Take the locks of `deployment_lock` on many deployments until the end of the current transaction.
+
+    Returns the ids of the deployments that were locked, without the ones another task is working on.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT id FROM unnest(%s::integer[]) AS id WHERE pg_try_advisory_xact_lock(%s, id)",
+            [list(deployment_ids), DEPLOYMENT_LOCK_KEY],
+        )
+        return [deployment_id for (deployment_id,) in cursor.fetchall()]
+
+
+class PendingEventRegroup(BaseModel):
+    """
+    A request to regroup the captures of a deployment into events, waiting for its task to run.
+
+    See `queue_regroup_events`. There is at most one request per deployment, which merges all the
+    requests made before the task starts.
+    """
+
+    deployment = models.OneToOneField(Deployment, on_delete=models.CASCADE, related_name="pending_event_regroup")
+    since = models.DateTimeField(
+        blank=True,
+        null=True,
+        help_text="Only the captures updated after this time need to be regrouped, all of them if empty.",
+    )
+
+    def __str__(self) -> str:
+        return f"Regroup events of deployment #{self.deployment_id} since {self.since or 'the start'}"
+
+
+def queue_regroup_events(deployment_id: int, since: datetime.datetime | None = None):
+    """
+    Request the captures of a deployment to be regrouped into events, in the background.
+
+    All of them are regrouped, or only the ones updated after `since`. Requests are merged until the task
+    starts, so many saves of a deployment in a row queue a single task: a full regroup covers everything,
+    otherwise the earliest `since` is used.
+    """
+    with transaction.atomic():
+        request, created = PendingEventRegroup.objects.select_for_update().get_or_create(
+            deployment_id=deployment_id, defaults={"since": since}
+        )
+        if not created and request.since and (since is None or since < request.since):
+            request.since = since
+            request.save(update_fields=["since", "updated_at"])
+    if created:
+        # A request that already existed has its task waiting
+        transaction.on_commit(lambda: ami.tasks.regroup_events.delay(deployment_id, queued=True))
+
+
+def pop_regroup_events_request(deployment_id: int) -> datetime.datetime | None:
+    """
+    Take the waiting request to regroup the captures of a deployment, see `queue_regroup_events`.
+
+    Returns the time since which captures need to be regrouped, or None to regroup all of them,
+    which is also done if no request was found. Requests made after this queue a new task.
+    """
+    with transaction.atomic():
+        request = PendingEventRegroup.objects.select_for_update().filter(deployment_id=deployment_id).first()
+        if not request:
+            logger.warning(f"No request to regroup the events of deployment {deployment_id}, regrouping all of them")
+            return None
+        request.delete()
+    return request.since
+
+
+def presign_source_image_urls(source_images: typing.Iterable[SourceImage]) -> None:
+    """
+    Generate the presigned URLs for a list of captures in bulk, before their `public_url` is requested.
+
+    Only captures from private data sources that have not been presigned yet are included,
+    so this can be called again for captures that are nested in several lists.
+    """
+    to_presign = []
+    for source_image in source_images:
+        if source_image._presigned_url:
+            continue
+        data_source = source_image.get_private_data_source()
+        if data_source is not None:
+            to_presign.append((source_image, data_source.config))
+    if not to_presign:
+        return
+    urls = ami.utils.s3.get_presigned_urls([(config, source_image.path) for source_image, config in to_presign])
+    for (source_image, _config), url in zip(to_presign, urls):
+        source_image._presigned_url = url
+
+
+def delete_source_images(pks: list[typing.Any]) -> int:
+    """
+    Delete source images and everything derived from them using set-based queries.
+
+    Classifications and detections of the images are deleted, occurrences that are left without any
+    detections are deleted, and so are the events left without any images. The remaining events and the
+    deployments of the images are marked for recalculation, see `mark_for_recalculation`.
+    """
+    detections = Detection.objects.filter(source_image_id__in=pks)
+    occurrence_ids = set(detections.exclude(occurrence=None).values_list("occurrence_id", flat=True))
+    event_ids, deployment_ids = set(), set()
+    for event_id, deployment_id in SourceImage.objects.filter(pk__in=pks).values_list("event_id", "deployment_id"):
+        event_ids.add(event_id)
+        deployment_ids.add(deployment_id)
+    event_ids.discard(None)
+
+    with transaction.atomic():
+        Classification.objects.filter(detection__source_image_id__in=pks).delete()
+        detections.delete()
+        _, deleted_per_model = SourceImage.objects.filter(pk__in=pks).delete()
+        Occurrence.objects.filter(pk__in=occurrence_ids).exclude(
+            models.Exists(Detection.objects.filter(occurrence=models.OuterRef("pk")))
+        ).delete()
+
+    if event_ids:
+        delete_empty_events(qs=Event.objects.filter(pk__in=event_ids))
+        event_ids = set(Event.objects.filter(pk__in=event_ids).values_list("pk", flat=True))
+    mark_many_for_recalculation({"Event": event_ids, "Deployment": deployment_ids})
+    return deleted_per_model.get(SourceImage._meta.label, 0)
+
+
 def set_dimensions_for_collection(
     event: Event, replace_existing: bool = False, width: int | None = None, height: int | None = None
 ):
@@ -1424,6 +2759,96 @@ def set_dimensions_for_collection(
         )
 
 
+def set_dimensions_for_captures(
+    captures: models.QuerySet[SourceImage], replace_existing: bool = False, max_workers: int = 16, batch_size=500
+) -> int:
+    """
+    Read the width & height of each image from its header in the data source.
+
+    Only the first bytes of each image are downloaded, and many images are read concurrently,
+    so this is practical for backfilling the dimensions of whole deployments.
+    Returns the number of captures that were updated.
+    """
+    if not replace_existing:
+        captures = captures.filter(Q(width__isnull=True) | Q(height__isnull=True))
+
+    def set_dimensions_for_batch(storage_source: StorageSource, batch: list[SourceImage]) -> int:
+        captures_by_path = {capture.path: capture for capture in batch}
+        to_update = []
+        for path, img in storage_source.read_image_headers(captures_by_path.keys(), max_workers=max_workers):
+            if img:
+                capture = captures_by_path[path]
+                capture.width, capture.height = img.size
+                to_update.append(capture)
+        SourceImage.objects.bulk_update(to_update, ["width", "height"])
+        return len(to_update)
+
+    num_updated = 0
+    deployment_ids = captures.order_by().values_list("deployment", flat=True).distinct()
+    for deployment in Deployment.objects.filter(pk__in=deployment_ids):
+        storage_source = deployment.get_storage_source()
+        if not storage_source:
+            logger.warning(f"Deployment {deployment} has no data source to read image headers from")
+            continue
+        batch = []
+        for capture in captures.filter(deployment=deployment).only("pk", "path").iterator(chunk_size=batch_size):
+            batch.append(capture)
+            if len(batch) >= batch_size:
+                num_updated += set_dimensions_for_batch(storage_source, batch)
+                batch = []
+                logger.info(f"Set dimensions for {num_updated} captures")
+        if batch:
+            num_updated += set_dimensions_for_batch(storage_source, batch)
+
+    logger.info(f"Set dimensions for {num_updated} captures")
+    return num_updated
+
+
+def set_timestamps_from_exif_for_captures(
+    captures: models.QuerySet[SourceImage], max_workers: int = 16, batch_size=500
+) -> int:
+    """
+    Read the timestamp of each capture without one from the EXIF data of the image in the data source.
+
+    Only the EXIF segment at the start of each image is downloaded, and many images are read concurrently,
+    so this is practical for backfilling whole deployments. The captures still need to be grouped into events.
+    Returns the number of captures that were updated.
+    """
+    captures = captures.filter(timestamp__isnull=True)
+
+    def set_timestamps_for_batch(storage_source: StorageSource, batch: list[SourceImage]) -> int:
+        captures_by_path = {capture.path: capture for capture in batch}
+        to_update = []
+        for path, exif in storage_source.read_exifs(captures_by_path.keys(), max_workers=max_workers):
+            timestamp = ami.utils.dates.get_image_timestamp_from_exif(exif)
+            if timestamp:
+                capture = captures_by_path[path]
+                capture.timestamp = timestamp
+                to_update.append(capture)
+        SourceImage.objects.bulk_update(to_update, ["timestamp"])
+        return len(to_update)
+
+    num_updated = 0
+    deployment_ids = captures.order_by().values_list("deployment", flat=True).distinct()
+    for deployment in Deployment.objects.filter(pk__in=deployment_ids):
+        storage_source = deployment.get_storage_source()
+        if not storage_source:
+            logger.warning(f"Deployment {deployment} has no data source to read EXIF data from")
+            continue
+        batch = []
+        for capture in captures.filter(deployment=deployment).only("pk", "path").iterator(chunk_size=batch_size):
+            batch.append(capture)
+            if len(batch) >= batch_size:
+                num_updated += set_timestamps_for_batch(storage_source, batch)
+                batch = []
+                logger.info(f"Set timestamps from EXIF data for {num_updated} captures")
+        if batch:
+            num_updated += set_timestamps_for_batch(storage_source, batch)
+
+    logger.info(f"Set timestamps from EXIF data for {num_updated} captures")
+    return num_updated
+
+
 def sample_captures_by_interval(
     minute_interval: int = 10,
     qs: models.QuerySet[SourceImage] | None = None,
@@ -1852,18 +3277,19 @@ class Detection(BaseModel):
         if self.occurrence:
             return self.occurrence
 
+        # Only the ids of the related objects of the capture are needed, so they are not loaded
+        source_image = self.source_image
         occurrence = Occurrence.objects.create(
-            event=self.source_image.event,
-            deployment=self.source_image.deployment,
-            project=self.source_image.project,
+            event_id=source_image.event_id,
+            deployment_id=source_image.deployment_id,
+            project_id=source_image.project_id,
         )
         self.occurrence = occurrence
         self.save()
         occurrence.save()  # Need to save again to update the aggregate values
-        # Update aggregate values on source image
-        # @TODO this should be done async in a task with an eta of a few seconds
+        # Update aggregate values on source image & event in the background,
         # so it isn't done for every detection in a batch
-        self.source_image.save()
+        mark_many_for_recalculation({"SourceImage": [self.source_image_id], "Event": [source_image.event_id]})
         return occurrence
 
     def update_calculated_fields(self, save=True):
@@ -2108,6 +3534,47 @@ def update_occurrence_determination(
         occurrence.save(update_determination=False)
 
 
+def update_new_occurrence_determinations(occurrences: typing.Iterable[Occurrence], batch_size=1000) -> int:
+    """
+    Set the determination of new occurrences from their predictions, with one query to read them all.
+
+    This is what `Occurrence.save` does for occurrences created one by one: occurrences that have no
+    identifications yet are determined by their top prediction, see `Occurrence.predictions`. The
+    occurrences whose determination or score changed are saved with `bulk_update`.
+
+    Returns the number of occurrences that were updated.
+    """
+    occurrences_by_pk = {occurrence.pk: occurrence for occurrence in occurrences}
+    classifications_by_occurrence = collections.defaultdict(list)
+    for row in Classification.objects.filter(detection__occurrence_id__in=occurrences_by_pk).values_list(
+        "detection__occurrence_id", "algorithm_id", "taxon_id", "score", "created_at", "pk"
+    ):
+        classifications_by_occurrence[row[0]].append(row)
+
+    updated = []
+    for occurrence_pk, rows in classifications_by_occurrence.items():
+        # The max score of each algorithm, then the most recent classification with one of these scores
+        max_scores: dict[typing.Any, float] = {}
+        for _occurrence_pk, algorithm_id, _taxon_id, score, _created_at, _pk in rows:
+            if score is not None and score > max_scores.get(algorithm_id, float("-inf")):
+                max_scores[algorithm_id] = score
+        top_scores = set(max_scores.values())
+        top_prediction = max(
+            (row for row in rows if row[3] in top_scores), key=lambda row: (row[4], row[5]), default=None
+        )
+        if not top_prediction or not top_prediction[2]:
+            continue
+        occurrence = occurrences_by_pk[occurrence_pk]
+        _occurrence_pk, _algorithm_id, taxon_id, score, _created_at, _pk = top_prediction
+        if occurrence.determination_id != taxon_id or occurrence.determination_score != score:
+            occurrence.determination_id = taxon_id
+            occurrence.determination_score = score
+            updated.append(occurrence)
+
+    Occurrence.objects.bulk_update(updated, ["determination", "determination_score"], batch_size=batch_size)
+    return len(updated)
+
+
 @final
 class TaxaManager(models.Manager):
     def get_queryset(self):
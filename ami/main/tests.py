@@ -1,12 +1,13 @@
 import datetime
 import logging
 
+from django.conf import settings
 from django.db import connection
 from django.test import TestCase
 from rest_framework.test import APIRequestFactory, APITestCase
 from rich import print
 
-from ami.main.models import Event, Occurrence, Project, Taxon, TaxonRank, group_images_into_events
+from ami.main.models import Event, Occurrence, Project, SourceImage, Taxon, TaxonRank, group_images_into_events
 from ami.tests.fixtures.main import create_captures, create_occurrences, create_taxa, setup_test_project
 from ami.users.models import User
 
@@ -39,6 +40,71 @@ class TestImageGrouping(TestCase):
         for event in events:
             assert event.captures.count() == images_per_night
 
+    def test_grouping_in_database(self):
+        from ami.main.models import diff_events_with_full_regroup
+
+        num_nights = 3
+        images_per_night = 3
+
+        create_captures(
+            deployment=self.deployment,
+            num_nights=num_nights,
+            images_per_night=images_per_night,
+            interval_minutes=10,
+        )
+        # Captures that are already in an event from a previous grouping should be moved
+        group_images_into_events(deployment=self.deployment, max_time_gap=datetime.timedelta(days=3))
+        self.assertEqual(self.deployment.events.count(), 1)
+
+        events = group_images_into_events(
+            deployment=self.deployment,
+            max_time_gap=datetime.timedelta(hours=2),
+            in_database=True,
+        )
+
+        assert len(events) == num_nights
+        for event in events:
+            assert event.captures.count() == images_per_night
+            assert event.captures_count == images_per_night
+        self.assertEqual(diff_events_with_full_regroup(self.deployment, max_time_gap=datetime.timedelta(hours=2)), [])
+
+    def test_grouping_in_database_sessions_on_the_same_day(self):
+        from ami.main.models import diff_events_with_full_regroup
+
+        day = datetime.datetime(2023, 6, 1, tzinfo=datetime.timezone.utc)
+        # An early morning session and an evening session, both starting on the same day
+        for hour in [1, 2, 21, 22, 23]:
+            SourceImage.objects.create(
+                deployment=self.deployment, timestamp=day + datetime.timedelta(hours=hour), path=f"{hour}.jpg"
+            )
+        SourceImage.objects.create(
+            deployment=self.deployment, timestamp=day + datetime.timedelta(days=1, hours=21), path="next.jpg"
+        )
+
+        events = group_images_into_events(
+            deployment=self.deployment,
+            max_time_gap=datetime.timedelta(hours=2),
+            in_database=True,
+        )
+
+        self.assertEqual(sorted(event.group_by for event in events), ["2023-06-01", "2023-06-02"])
+        self.assertEqual(self.deployment.events.get(group_by="2023-06-01").captures.count(), 5)
+        self.assertEqual(diff_events_with_full_regroup(self.deployment, max_time_gap=datetime.timedelta(hours=2)), [])
+
+    def test_benchmark_event_grouping(self):
+        import io
+
+        from django.core.management import call_command
+
+        out = io.StringIO()
+        call_command("benchmark_event_grouping", captures=500, images_per_night=50, stdout=out, stderr=io.StringIO())
+
+        output = out.getvalue()
+        self.assertIn("Grouped into 10 events in database", output)
+        self.assertIn("Grouped into 10 events in Python", output)
+        self.assertNotIn("differences", output)
+        self.assertFalse(Project.objects.filter(name="Event grouping benchmark").exists())
+
     def test_pruning_empty_events(self):
         from ami.main.models import delete_empty_events
 
@@ -54,6 +120,24 @@ class TestImageGrouping(TestCase):
 
         assert remaining_events.count() == 0
 
+    def test_pruning_empty_events_of_deployment(self):
+        from ami.main.models import delete_empty_events
+
+        _, other_deployment = setup_test_project(reuse=False)
+        for deployment in [self.deployment, other_deployment]:
+            create_captures(deployment=deployment, num_nights=2)
+            group_images_into_events(deployment=deployment)
+            deployment.captures.all().delete()
+
+        # Only report the empty events
+        self.assertEqual(delete_empty_events(deployment=self.deployment, dry_run=True), 2)
+        self.assertEqual(self.deployment.events.count(), 2)
+
+        self.assertEqual(delete_empty_events(deployment=self.deployment, chunk_size=1), 2)
+        self.assertEqual(self.deployment.events.count(), 0)
+        # The empty events of other deployments are not touched
+        self.assertEqual(other_deployment.events.count(), 2)
+
     def test_setting_image_dimensions(self):
         from ami.main.models import set_dimensions_for_collection
 
@@ -73,6 +157,76 @@ class TestImageGrouping(TestCase):
                 # print(capture.path, capture.width, capture.height)
                 assert (capture.width == image_width) and (capture.height == image_height)
 
+    def _create_captures_at(self, timestamps: list[datetime.datetime]) -> list[SourceImage]:
+        return [
+            SourceImage.objects.create(deployment=self.deployment, timestamp=timestamp, path=f"test/{timestamp}.jpg")
+            for timestamp in timestamps
+        ]
+
+    def test_incremental_grouping(self):
+        from ami.main.models import diff_events_with_full_regroup, group_new_images_into_events
+
+        first_night = datetime.datetime(2023, 6, 1, 22, 0)
+        night = [datetime.timedelta(minutes=minutes) for minutes in range(0, 60, 10)]
+        self._create_captures_at([first_night + timedelta for timedelta in night])
+        self._create_captures_at([first_night + datetime.timedelta(days=5) + timedelta for timedelta in night])
+        last_night = first_night + datetime.timedelta(days=10, hours=2, minutes=30)
+        self._create_captures_at([last_night + timedelta for timedelta in night])
+        events = group_images_into_events(deployment=self.deployment)
+        self.assertEqual(len(events), 3)
+        first_event, middle_event, last_event = events
+
+        # Extend the first session, start a new one on its own and prepend the last one across midnight
+        self._create_captures_at(
+            [
+                first_night + datetime.timedelta(minutes=100),
+                first_night + datetime.timedelta(days=7),
+                last_night - datetime.timedelta(minutes=90),
+            ]
+        )
+        events = group_new_images_into_events(deployment=self.deployment, verify=False)
+
+        self.assertEqual(diff_events_with_full_regroup(self.deployment), [])
+        self.assertEqual(len(events), 3)
+        self.assertIn(first_event.pk, [event.pk for event in events])
+        # The session in the middle was not touched
+        self.assertNotIn(middle_event.pk, [event.pk for event in events])
+        middle_event_before = middle_event.updated_at
+        middle_event.refresh_from_db()
+        self.assertEqual(middle_event.updated_at, middle_event_before)
+        # The last session now starts on the previous day, so it was replaced by a new event
+        self.assertFalse(Event.objects.filter(pk=last_event.pk).exists())
+        self.assertEqual(self.deployment.events.count(), 4)
+
+    def test_incremental_grouping_merges_events(self):
+        from ami.main.models import diff_events_with_full_regroup, group_new_images_into_events
+
+        first_night = datetime.datetime(2023, 6, 1, 23, 0)
+        self._create_captures_at([first_night, first_night + datetime.timedelta(hours=3)])
+        group_images_into_events(deployment=self.deployment)
+        self.assertEqual(self.deployment.events.count(), 2)
+
+        # A capture in the gap joins both sessions into one event
+        self._create_captures_at([first_night + datetime.timedelta(minutes=90)])
+        group_new_images_into_events(deployment=self.deployment)
+
+        self.assertEqual(diff_events_with_full_regroup(self.deployment), [])
+        self.assertEqual(self.deployment.events.count(), 1)
+
+    def test_diff_events_with_full_regroup(self):
+        from ami.main.models import diff_events_with_full_regroup
+
+        create_captures(deployment=self.deployment, num_nights=2)
+        self.assertEqual(len(diff_events_with_full_regroup(self.deployment)), 2 * 3 + 2)
+
+        group_images_into_events(deployment=self.deployment)
+        self.assertEqual(diff_events_with_full_regroup(self.deployment), [])
+
+        # Move one capture to the other session without regrouping
+        event, other_event = self.deployment.events.all()
+        SourceImage.objects.filter(pk=event.captures.first().pk).update(event=other_event)
+        self.assertNotEqual(diff_events_with_full_regroup(self.deployment), [])
+
 
 # This test is disabled because it requires certain data to be present in the database
 # and data in a configured S3 bucket. Will require Minio or something like it to be running.
@@ -166,6 +320,324 @@ class TestEvents(TestCase):
             self.assertEqual(event.occurrences_count, event.get_occurrences_count())
             self.assertGreater(event.calculated_fields_updated_at, last_updated)  # type: ignore
 
+    def test_event_calculated_fields_batch_queries(self):
+        from ami.main.models import update_calculated_fields_for_events
+
+        create_captures(deployment=self.deployment, num_nights=5, images_per_night=3)
+        group_images_into_events(deployment=self.deployment)
+        events = self.deployment.events.all()
+        num_events = events.count()
+        events.update(captures_count=None, detections_count=None, occurrences_count=None)
+
+        # The number of queries does not depend on the number of events
+        with self.assertNumQueries(4):
+            updated_events = update_calculated_fields_for_events(qs=events)
+
+        self.assertEqual(len(updated_events), num_events)
+        for event in updated_events:
+            self.assertEqual(event.captures_count, event.get_captures_count())
+            self.assertEqual(event.detections_count, event.get_detections_count())
+            self.assertEqual(event.occurrences_count, event.get_occurrences_count())
+            self.assertEqual(event.start, event.captures.order_by("timestamp").first().timestamp)
+
+        # Recalculate without saving
+        events.update(captures_count=None)
+        for event in update_calculated_fields_for_events(qs=events, save=False):
+            self.assertEqual(event.captures_count, event.get_captures_count())
+        self.assertFalse(events.exclude(captures_count=None).exists())
+
+
+class TestPendingRecalculation(TestCase):
+    def setUp(self) -> None:
+        project, deployment = setup_test_project(reuse=False)
+        create_taxa(project=project)
+        create_captures(deployment=deployment, num_nights=2, images_per_night=5)
+        group_images_into_events(deployment=deployment)
+        self.project = project
+        self.deployment = deployment
+        return super().setUp()
+
+    def test_recalculate_marked_objects(self):
+        from ami.main.models import PendingRecalculation, SourceImage, recalculate_pending
+
+        # Creating occurrences marks their captures and events instead of recalculating them
+        create_occurrences(deployment=self.deployment, num=3)
+        event = self.deployment.events.first()
+        assert event is not None
+        self.assertEqual(event.occurrences_count, 0)
+        self.assertTrue(PendingRecalculation.objects.filter(model_name="Event", object_id=event.pk).exists())
+        # Each object is only marked once
+        self.assertEqual(PendingRecalculation.objects.filter(model_name="Event").count(), 1)
+
+        counts = recalculate_pending()
+
+        self.assertEqual(counts["Event"], 1)
+        self.assertFalse(PendingRecalculation.objects.exists())
+        event.refresh_from_db()
+        self.assertEqual(event.occurrences_count, event.get_occurrences_count())
+        self.assertEqual(event.detections_count, 3)
+        for capture in SourceImage.objects.filter(deployment=self.deployment):
+            self.assertEqual(capture.detections_count, capture.get_detections_count())
+
+    def test_recalculate_deployment(self):
+        from ami.main.models import mark_for_recalculation, recalculate_pending
+
+        Deployment = type(self.deployment)
+        Deployment.objects.filter(pk=self.deployment.pk).update(captures_count=None, events_count=None)
+        mark_for_recalculation("Deployment", [self.deployment.pk, self.deployment.pk])
+
+        counts = recalculate_pending()
+
+        self.assertEqual(counts["Deployment"], 1)
+        self.deployment.refresh_from_db()
+        self.assertEqual(self.deployment.captures_count, 10)
+        self.assertEqual(self.deployment.events_count, 2)
+
+    def test_deployment_being_regrouped_stays_marked(self):
+        import threading
+
+        from ami.main.models import PendingRecalculation, deployment_lock, mark_for_recalculation, recalculate_pending
+
+        Deployment = type(self.deployment)
+        Deployment.objects.filter(pk=self.deployment.pk).update(captures_count=None)
+        mark_for_recalculation("Deployment", [self.deployment.pk])
+
+        # Another task holds the lock of the deployment, e.g. while regrouping its events
+        locked, release = threading.Event(), threading.Event()
+
+        def hold_lock():
+            with deployment_lock(self.deployment.pk):
+                locked.set()
+                release.wait()
+            connection.close()
+
+        thread = threading.Thread(target=hold_lock)
+        thread.start()
+        locked.wait()
+        try:
+            counts = recalculate_pending()
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual(counts["Deployment"], 0)
+        self.assertTrue(PendingRecalculation.objects.filter(model_name="Deployment").exists())
+
+        counts = recalculate_pending()
+        self.assertEqual(counts["Deployment"], 1)
+        self.assertFalse(PendingRecalculation.objects.filter(model_name="Deployment").exists())
+        self.deployment.refresh_from_db()
+        self.assertEqual(self.deployment.captures_count, 10)
+
+    def test_save_deployment_marks_it(self):
+        from ami.main.models import PendingRecalculation, recalculate_pending
+
+        PendingRecalculation.objects.all().delete()
+        type(self.deployment).objects.filter(pk=self.deployment.pk).update(captures_count=None)
+        self.deployment.refresh_from_db()
+
+        self.deployment.save()
+
+        self.assertIsNone(self.deployment.captures_count)
+        self.assertTrue(
+            PendingRecalculation.objects.filter(model_name="Deployment", object_id=self.deployment.pk).exists()
+        )
+        recalculate_pending()
+        self.deployment.refresh_from_db()
+        self.assertEqual(self.deployment.captures_count, 10)
+
+
+class TestDeploymentTasks(TestCase):
+    def setUp(self) -> None:
+        project, deployment = setup_test_project(reuse=False)
+        self.project = project
+        self.deployment = deployment
+        return super().setUp()
+
+    def test_regroup_requests_are_merged(self):
+        from ami.main.models import PendingEventRegroup, pop_regroup_events_request, queue_regroup_events
+
+        earlier = datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc)
+        later = datetime.datetime(2023, 1, 2, tzinfo=datetime.timezone.utc)
+        with self.captureOnCommitCallbacks() as callbacks:
+            queue_regroup_events(self.deployment.pk, since=later)
+            queue_regroup_events(self.deployment.pk, since=earlier)
+            queue_regroup_events(self.deployment.pk, since=later)
+        # A single task is queued for all of them
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(PendingEventRegroup.objects.get(deployment=self.deployment).since, earlier)
+        self.assertEqual(pop_regroup_events_request(self.deployment.pk), earlier)
+        self.assertFalse(PendingEventRegroup.objects.filter(deployment=self.deployment).exists())
+
+        # A full regroup covers everything
+        queue_regroup_events(self.deployment.pk, since=earlier)
+        queue_regroup_events(self.deployment.pk)
+        queue_regroup_events(self.deployment.pk, since=later)
+        self.assertEqual(pop_regroup_events_request(self.deployment.pk), None)
+
+        # Without a request, everything is regrouped
+        self.assertEqual(pop_regroup_events_request(self.deployment.pk), None)
+
+    def test_deployment_lock(self):
+        import threading
+
+        from django.db import transaction
+
+        from ami.main.models import deployment_lock, lock_deployments
+
+        results = []
+
+        def try_lock():
+            with deployment_lock(self.deployment.pk) as locked:
+                results.append(locked)
+            with transaction.atomic():
+                results.append(lock_deployments([self.deployment.pk]))
+            connection.close()
+
+        with deployment_lock(self.deployment.pk) as locked:
+            self.assertTrue(locked)
+            thread = threading.Thread(target=try_lock)
+            thread.start()
+            thread.join()
+        # The recalculation of the counts skips the deployment too
+        self.assertEqual(results, [False, []])
+
+        thread = threading.Thread(target=try_lock)
+        thread.start()
+        thread.join()
+        self.assertEqual(results, [False, [], True, [self.deployment.pk]])
+
+
+class TestDeploymentStats(TestCase):
+    def setUp(self) -> None:
+        project, deployment = setup_test_project(reuse=False)
+        create_taxa(project=project)
+        create_captures(deployment=deployment, num_nights=2, images_per_night=5)
+        group_images_into_events(deployment=deployment)
+        create_occurrences(deployment=deployment, num=3)
+        _, other_deployment = setup_test_project(reuse=False)
+        self.project = project
+        self.deployments = [deployment, other_deployment]
+        return super().setUp()
+
+    def test_update_calculated_fields_for_deployments(self):
+        from ami.main.models import Deployment, Detection, update_calculated_fields_for_deployments
+
+        qs = Deployment.objects.filter(pk__in=[deployment.pk for deployment in self.deployments]).order_by("pk")
+        # One query for the deployments and one for each child table
+        with self.assertNumQueries(5):
+            deployments = update_calculated_fields_for_deployments(qs=qs, save=False)
+
+        deployment, other_deployment = deployments
+        self.assertEqual(deployment.captures_count, 10)
+        self.assertEqual(deployment.data_source_total_files, 10)
+        self.assertEqual(deployment.events_count, 2)
+        self.assertEqual(
+            deployment.detections_count, Detection.objects.filter(source_image__deployment=deployment).count()
+        )
+        self.assertEqual(
+            deployment.occurrences_count,
+            deployment.occurrences.filter(
+                determination_score__gte=settings.DEFAULT_CONFIDENCE_THRESHOLD, event__isnull=False
+            ).count(),
+        )
+        self.assertEqual(
+            deployment.taxa_count,
+            Taxon.objects.filter(
+                occurrences__deployment=deployment,
+                occurrences__determination_score__gte=settings.DEFAULT_CONFIDENCE_THRESHOLD,
+                occurrences__event__isnull=False,
+            )
+            .distinct()
+            .count(),
+        )
+        self.assertEqual(
+            deployment.get_first_and_last_timestamps(),
+            (
+                deployment.first_capture_timestamp,
+                deployment.last_capture_timestamp,
+            ),
+        )
+        self.assertEqual(other_deployment.captures_count, 0)
+        self.assertIsNone(other_deployment.first_capture_timestamp)
+
+        # The single deployment version gives the same result
+        single = Deployment.objects.get(pk=deployment.pk)
+        single.update_calculated_fields()
+        for field in ["captures_count", "events_count", "detections_count", "occurrences_count", "taxa_count"]:
+            self.assertEqual(getattr(single, field), getattr(deployment, field))
+
+        update_calculated_fields_for_deployments(qs=qs)
+        self.assertEqual(Deployment.objects.get(pk=deployment.pk).events_count, 2)
+
+
+class TestStaleCaptures(TestCase):
+    def setUp(self) -> None:
+        project, deployment = setup_test_project(reuse=False)
+        create_taxa(project=project)
+        create_captures(deployment=deployment, num_nights=2, images_per_night=5)
+        group_images_into_events(deployment=deployment)
+        create_occurrences(deployment=deployment, num=3)
+        self.project = project
+        self.deployment = deployment
+        return super().setUp()
+
+    def test_stale_captures(self):
+        from ami.main.models import Detection, PendingRecalculation, SourceImage
+
+        # Simulate a full sync that only saw the captures of the last night
+        first_event, last_event = self.deployment.events.order_by("start")
+        last_event.captures.update(sync_generation=2)
+        first_event.captures.update(sync_generation=1)
+        self.deployment.data_source_sync_generation = 2
+        self.deployment.save(update_calculated_fields=False)
+
+        stale_pks = set(first_event.captures.values_list("pk", flat=True))
+        self.assertEqual(set(self.deployment.stale_captures().values_list("pk", flat=True)), stale_pks)
+
+        # Dry run only reports
+        self.assertEqual(self.deployment.delete_stale_captures(dry_run=True), len(stale_pks))
+        self.assertEqual(SourceImage.objects.filter(pk__in=stale_pks).count(), len(stale_pks))
+
+        self.assertEqual(self.deployment.delete_stale_captures(dry_run=False, chunk_size=2), len(stale_pks))
+        self.assertEqual(SourceImage.objects.filter(pk__in=stale_pks).count(), 0)
+        self.assertEqual(Detection.objects.filter(source_image_id__in=stale_pks).count(), 0)
+        self.assertFalse(Occurrence.objects.filter(event=first_event, detections__isnull=True).exists())
+        self.assertEqual(self.deployment.captures.count(), 5)
+        # The event of the deleted captures is deleted, and the counts of the deployment are updated later
+        self.assertFalse(Event.objects.filter(pk=first_event.pk).exists())
+        self.assertTrue(
+            PendingRecalculation.objects.filter(model_name="Deployment", object_id=self.deployment.pk).exists()
+        )
+
+
+class TestSyncTimestamps(TestCase):
+    def setUp(self) -> None:
+        project, deployment = setup_test_project(reuse=False)
+        self.project = project
+        self.deployment = deployment
+        return super().setUp()
+
+    def test_batch_timestamps(self):
+        from ami.main.models import _create_source_images_for_sync
+        from ami.utils.dates import get_image_timestamp_from_filename
+
+        keys = [f"night/{20220810230000 + i}-00-07.jpg" for i in range(30)] + [
+            "night/2022-08-11T01:02:03.jpg",
+            "night/IMG_0001.jpg",
+        ]
+        state = {"timestamp_pattern": None}
+        with self.assertLogs("ami.main.models", level="WARNING") as logs:
+            source_images = _create_source_images_for_sync(self.deployment, [{"Key": key} for key in keys], state)
+        # The filename without a timestamp is only parsed and reported once
+        self.assertEqual(len([line for line in logs.output if "No timestamp" in line]), 1)
+
+        self.assertEqual(state["timestamp_pattern"], "YYYYMMDDhhmmss")
+        self.assertEqual(
+            [source_image.timestamp for source_image in source_images],
+            [get_image_timestamp_from_filename(key) for key in keys],
+        )
+        self.assertIsNone(source_images[-1].timestamp)
+
 
 class TestDuplicateFieldsOnChildren(TestCase):
     def setUp(self) -> None:
@@ -201,6 +673,22 @@ class TestDuplicateFieldsOnChildren(TestCase):
         assert self.deployment.events.first().project == self.project_two
         assert self.deployment.occurrences.first().project == self.project_two
 
+    def test_project_changed(self):
+        from ami.main.models import Deployment
+
+        deployment = Deployment.objects.get(pk=self.deployment.pk)
+        deployment.project = self.project_two
+        with self.assertNumQueries(0):
+            self.assertFalse(deployment.project_changed(update_fields=["name"]))
+            self.assertTrue(deployment.project_changed())
+        deployment.save()
+        self.assertFalse(deployment.project_changed())
+
+        deferred = Deployment.objects.only("name").get(pk=self.deployment.pk)
+        deferred.project_id = self.project_one.pk
+        with self.assertNumQueries(1):
+            self.assertTrue(deferred.project_changed(update_fields=["project"]))
+
     def test_delete_project(self):
         self.project_one.delete()
 
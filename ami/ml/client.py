@@ -0,0 +1,194 @@
+"""
+HTTP clients for the endpoints of ML backends.
+
+Each backend (scheme and host) has one client, shared by all threads of the process, with a pool
+of keep-alive connections. Requests are retried with a jittered backoff, and the latency and size
+of each request are recorded, see `EndpointClient.stats`.
+"""
+
+import collections
+import dataclasses
+import gzip
+import json
+import logging
+import random
+import threading
+import time
+import typing
+import urllib.parse
+
+import requests
+import requests.adapters
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Responses that may succeed if the same request is sent again
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+@dataclasses.dataclass
+class RequestRecord:
+    """The latency and payload size of a request to an ML backend, including its retries."""
+
+    url: str
+    status_code: int | None = None
+    attempts: int = 0
+    seconds: float = 0
+    bytes_sent: int = 0
+    bytes_uncompressed: int = 0
+    bytes_received: int = 0
+
+
+@dataclasses.dataclass
+class RequestStats:
+    """Totals of the requests sent by a client."""
+
+    requests: int = 0
+    failures: int = 0
+    retries: int = 0
+    seconds: float = 0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+
+    def add(self, record: RequestRecord, failed: bool = False):
+        self.requests += 1
+        self.failures += int(failed)
+        self.retries += max(record.attempts - 1, 0)
+        self.seconds += record.seconds
+        self.bytes_sent += record.bytes_sent
+        self.bytes_received += record.bytes_received
+
+
+class EndpointClient:
+    """
+    A pooled keep-alive session for the endpoints of one ML backend.
+
+    Request bodies are compressed with gzip if `compress_min_size` is set and they are at least that size,
+    which the backend has to support. Compressed responses are always accepted.
+    The requests to ML backends can be repeated safely, so they are retried after connection errors,
+    timeouts and the responses in `RETRY_STATUS_CODES`, waiting between half and all of `retry_backoff`
+    seconds before the first retry and twice as long before each next one.
+    """
+
+    max_records = 100
+
+    def __init__(
+        self,
+        pool_size: int = 10,
+        connect_timeout: float = 10,
+        timeout: float = 300,
+        retries: int = 3,
+        retry_backoff: float = 2.0,
+        compress_min_size: int | None = None,
+    ):
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.compress_min_size = compress_min_size
+
+        self.session = requests.Session()
+        # Retries are done by `post_json` so that they can be counted
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Accept-Encoding": "gzip", "Content-Type": "application/json"})
+
+        self.stats = RequestStats()
+        self.records: collections.deque[RequestRecord] = collections.deque(maxlen=self.max_records)
+        self._stats_lock = threading.Lock()
+
+    def _record(self, record: RequestRecord, failed: bool = False):
+        with self._stats_lock:
+            self.stats.add(record, failed=failed)
+            self.records.append(record)
+        logger.debug(
+            f"POST {record.url}: {record.status_code or 'failed'} in {record.seconds:.2f}s "
+            f"after {record.attempts} attempt(s), sent {record.bytes_sent} bytes "
+            f"({record.bytes_uncompressed} uncompressed), received {record.bytes_received} bytes"
+        )
+
+    def _get_retry_delay(self, attempt: int) -> float:
+        delay = self.retry_backoff * 2**attempt
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def post_json(
+        self,
+        url: str,
+        data: typing.Any,
+        timeout: float | None = None,
+        retries: int | None = None,
+    ) -> tuple[typing.Any, RequestRecord]:
+        """
+        Send `data` as JSON and return the decoded JSON response, with the record of the request.
+        """
+        timeout = timeout or self.timeout
+        retries = self.retries if retries is None else retries
+
+        body = json.dumps(data).encode()
+        headers = {}
+        record = RequestRecord(url=url, bytes_uncompressed=len(body))
+        if self.compress_min_size is not None and len(body) >= self.compress_min_size:
+            body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+        record.bytes_sent = len(body)
+
+        start = time.monotonic()
+        while True:
+            record.attempts += 1
+            try:
+                resp = self.session.post(url, data=body, headers=headers, timeout=(self.connect_timeout, timeout))
+                record.status_code = resp.status_code
+                # The size on the wire, before `requests` decompresses the content
+                record.bytes_received = int(resp.headers.get("Content-Length") or len(resp.content))
+                resp.raise_for_status()
+                result = resp.json()
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                can_retry = not isinstance(e, requests.HTTPError) or e.response.status_code in RETRY_STATUS_CODES
+                if record.attempts > retries or not can_retry:
+                    record.seconds = time.monotonic() - start
+                    self._record(record, failed=True)
+                    raise
+                delay = self._get_retry_delay(record.attempts - 1)
+                logger.warning(f"Request to {url} failed ({e}), retrying in {delay:.1f} seconds")
+                time.sleep(delay)
+            else:
+                record.seconds = time.monotonic() - start
+                self._record(record)
+                return result, record
+
+
+_client_cache: dict[str, EndpointClient] = {}
+_client_cache_lock = threading.Lock()
+
+
+def get_endpoint_client(endpoint_url: str) -> EndpointClient:
+    """
+    Return the client for the backend of an endpoint, shared by all threads of the process.
+
+    The clients are configured by the ML_REQUEST_* settings when they are created.
+    """
+    parts = urllib.parse.urlsplit(endpoint_url)
+    key = f"{parts.scheme}://{parts.netloc}"
+    with _client_cache_lock:
+        if key not in _client_cache:
+            _client_cache[key] = EndpointClient(
+                pool_size=settings.ML_REQUEST_POOL_SIZE,
+                connect_timeout=settings.ML_REQUEST_CONNECT_TIMEOUT,
+                timeout=settings.ML_REQUEST_TIMEOUT,
+                retries=settings.ML_REQUEST_RETRIES,
+                retry_backoff=settings.ML_REQUEST_RETRY_BACKOFF,
+                compress_min_size=settings.ML_REQUEST_COMPRESS_MIN_SIZE,
+            )
+        return _client_cache[key]
+
+
+def clear_client_cache():
+    """
+    Close and drop the clients of the process, e.g. after changing the ML_REQUEST_* settings.
+    """
+    with _client_cache_lock:
+        for client in _client_cache.values():
+            client.session.close()
+        _client_cache.clear()
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.10 on 2026-10-17 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ml", "0005_alter_pipeline_slug"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pipeline",
+            name="batch_size",
+            field=models.PositiveIntegerField(
+                default=2, help_text="Number of images sent to the ML backend in each request."
+            ),
+        ),
+        migrations.AddField(
+            model_name="pipeline",
+            name="max_concurrent_requests",
+            field=models.PositiveIntegerField(
+                default=1,
+                help_text="Number of requests sent to the ML backend at the same time, to match its capacity.",
+            ),
+        ),
+    ]
@@ -1,12 +1,13 @@
+import collections
+import concurrent.futures
 import logging
 import typing
+from dataclasses import dataclass
 
-import requests
-from django.db import models, transaction
+from django.db import connection, models, transaction
 from django.utils.text import slugify
 from django.utils.timezone import now
 from django_pydantic_field import SchemaField
-from rich import print
 
 from ami.base.models import BaseModel
 from ami.base.schemas import ConfigurableStage, default_stages
@@ -20,11 +21,14 @@ from ami.main.models import (
     TaxaList,
     Taxon,
     TaxonRank,
-    update_calculated_fields_for_events,
+    mark_for_recalculation,
+    update_new_occurrence_determinations,
+    update_occurrence_determination,
 )
+from ami.ml.client import RequestRecord, get_endpoint_client
 from ami.ml.tasks import celery_app, create_detection_images
 
-from ..schemas import PipelineRequest, PipelineResponse, SourceImageRequest
+from ..schemas import DetectionResponse, PipelineRequest, PipelineResponse, SourceImageRequest
 from .algorithm import Algorithm
 
 logger = logging.getLogger(__name__)
@@ -37,40 +41,31 @@ def filter_processed_images(
     """
     Return only images that need to be processed by a given pipeline for the first time (have no detections)
     or have detections that need to be classified by the given pipeline.
+
+    The decision is made in the database for all images at once. A queryset of images is filtered lazily,
+    a list of images is filtered with a single query and keeps its order.
+
+    @TODO there is no mechanism to reclassify detections yet, images with unclassified detections
+    are processed from scratch.
     """
     pipeline_algorithms = pipeline.algorithms.all()
-
-    for image in images:
-        existing_detections = image.detections.filter(detection_algorithm__in=pipeline_algorithms)
-        if not existing_detections.exists():
-            logger.debug(f"Image {image} has no existing detections from pipeline {pipeline}")
-            # If there are no existing detections from this pipeline, send the image
-            yield image
-        elif existing_detections.filter(classifications__isnull=True).exists():
-            # Check if there are detections with no classifications
-            logger.debug(f"Image {image} has existing detections with no classifications from pipeline {pipeline}")
-            yield image
-        else:
-            # If there are existing detections with classifications,
-            # Compare their classification algorithms to the current pipeline's algorithms
-            detections_needing_classification = existing_detections.exclude(
-                classifications__algorithm__in=pipeline_algorithms
-            )
-            if detections_needing_classification.exists():
-                logger.debug(
-                    f"Image {image} has existing detections that haven't been classified by the pipeline: {pipeline}"
-                )
-                logger.warn(
-                    f"Image {image} has existing detections that haven't been classified by the pipeline: {pipeline} "
-                    f"however we do yet have a mechanism to reclassify detections. Processing the image from scratch."
-                )
-                yield image
-            else:
-                # If all detections have been classified by the pipeline, skip the image
-                logger.debug(
-                    f"Image {image} has existing detections classified by the pipeline: {pipeline}, skipping!"
-                )
-                continue
+    detections = Detection.objects.filter(
+        source_image=models.OuterRef("pk"), detection_algorithm__in=pipeline_algorithms
+    )
+    classifications = Classification.objects.filter(detection=models.OuterRef("pk"), algorithm__in=pipeline_algorithms)
+    # Images without detections from this pipeline, or with detections it hasn't classified
+    needs_processing = ~models.Exists(detections) | models.Exists(detections.filter(~models.Exists(classifications)))
+
+    if isinstance(images, models.QuerySet):
+        return images.filter(needs_processing)
+
+    images = list(images)
+    pks_to_process = set(
+        SourceImage.objects.filter(pk__in=[image.pk for image in images])
+        .filter(needs_processing)
+        .values_list("pk", flat=True)
+    )
+    return [image for image in images if image.pk in pks_to_process]
 
 
 def collect_images(
@@ -101,20 +96,23 @@ def collect_images(
     else:
         raise ValueError("Must specify a collection, deployment or a list of images")
 
-    total_images = len(images)
+    def count(images: typing.Iterable[SourceImage]) -> int:
+        return images.count() if isinstance(images, models.QuerySet) else len(images)  # type: ignore[arg-type]
+
+    total_images = count(images)
     if pipeline and skip_processed:
         msg = f"Filtering images that have already been processed by pipeline {pipeline}"
         logger.info(msg)
         if job:
             job.logger.info(msg)
-        images = list(filter_processed_images(images, pipeline))
+        images = filter_processed_images(images, pipeline)
     else:
         msg = "NOT filtering images that have already been processed"
         logger.info(msg)
         if job:
             job.logger.info(msg)
 
-    msg = f"Found {len(images)} out of {total_images} images to process"
+    msg = f"Found {count(images)} out of {total_images} images to process"
     logger.info(msg)
     if job:
         job.logger.info(msg)
@@ -122,15 +120,118 @@ def collect_images(
     return images
 
 
+def build_pipeline_request(pipeline: "Pipeline", images: typing.Iterable[SourceImage]) -> PipelineRequest:
+    """
+    Build the request to process images with a pipeline, skipping the images that have no URL.
+    """
+    urls = [(source_image, source_image.public_url()) for source_image in images]
+    return PipelineRequest(
+        pipeline=pipeline.slug,
+        source_images=[
+            SourceImageRequest(
+                id=str(source_image.pk),
+                url=url,
+            )
+            for source_image, url in urls
+            if url
+        ],
+    )
+
+
+def send_pipeline_request(
+    endpoint_url: str,
+    request_data: PipelineRequest,
+    timeout: float | None = None,
+    retries: int | None = None,
+) -> tuple[PipelineResponse, RequestRecord]:
+    """
+    Send a request to the ML backend and return its results, with the latency and size of the request.
+
+    The request goes through the pooled client of the backend, which retries connection errors, timeouts
+    and server errors, see `ami.ml.client.EndpointClient`. This doesn't use the database,
+    so it can be called from other threads.
+    """
+    client = get_endpoint_client(endpoint_url)
+    data, record = client.post_json(endpoint_url, request_data.dict(), timeout=timeout, retries=retries)
+    return PipelineResponse(**data), record
+
+
+@dataclass
+class ProcessedBatch:
+    """The results of a batch of images sent to the ML backend by `process_images_in_batches`."""
+
+    index: int
+    images: list[SourceImage]
+    results: PipelineResponse | None = None
+    error: Exception | None = None
+    request: RequestRecord | None = None
+
+
+def process_images_in_batches(
+    pipeline: "Pipeline",
+    endpoint_url: str,
+    images: list[SourceImage],
+    batch_size: int | None = None,
+    max_concurrent_requests: int | None = None,
+) -> typing.Iterator[ProcessedBatch]:
+    """
+    Send images to the ML backend in batches, with several requests in flight at once.
+
+    The requests are sent from a thread pool while the next batches are prepared, and the results
+    are yielded in the order of the batches, so progress can be counted as batches complete.
+    A batch that still fails after its retries is yielded with its error instead of stopping the others.
+    The images are not filtered, see `collect_images`.
+    """
+    batch_size = batch_size or pipeline.batch_size
+    max_concurrent_requests = max_concurrent_requests or pipeline.max_concurrent_requests
+    batches = (
+        (index, images[start : start + batch_size])  # noqa: E203
+        for index, start in enumerate(range(0, len(images), batch_size))
+    )
+    # Keep the next batches waiting while the first one of the window is not finished
+    window_size = max_concurrent_requests * 2
+    in_flight: collections.deque[tuple[int, list[SourceImage], concurrent.futures.Future]] = collections.deque()
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=max_concurrent_requests, thread_name_prefix=f"pipeline-{pipeline.slug}"
+    ) as executor:
+
+        def submit_next_batch() -> bool:
+            try:
+                index, batch = next(batches)
+            except StopIteration:
+                return False
+            # Building the request can query the database, so it stays in this thread
+            request_data = build_pipeline_request(pipeline, batch)
+            in_flight.append((index, batch, executor.submit(send_pipeline_request, endpoint_url, request_data)))
+            return True
+
+        while len(in_flight) < window_size and submit_next_batch():
+            pass
+        while in_flight:
+            index, batch, future = in_flight.popleft()
+            try:
+                results, record = future.result()
+                processed = ProcessedBatch(index=index, images=batch, results=results, request=record)
+            except Exception as e:
+                processed = ProcessedBatch(index=index, images=batch, error=e)
+            submit_next_batch()
+            yield processed
+
+
 def process_images(
     pipeline: "Pipeline",
     endpoint_url: str,
     images: typing.Iterable[SourceImage],
     job_id: int | None = None,
+    skip_processed: bool = True,
 ) -> PipelineResponse:
     """
     Process images using ML pipeline API.
 
+    Images that were already processed by the pipeline are skipped, unless `skip_processed` is False
+    (e.g. because they were already filtered by `collect_images`).
+
     @TODO find a home for this function.
     @TODO break into task chunks.
     """
@@ -144,7 +245,10 @@ def process_images(
         task_logger = job.logger
 
     prefiltered_images = list(images)
-    images = list(filter_processed_images(images=prefiltered_images, pipeline=pipeline))
+    if skip_processed:
+        images = list(filter_processed_images(images=prefiltered_images, pipeline=pipeline))
+    else:
+        images = prefiltered_images
     if len(images) < len(prefiltered_images):
         # Log how many images were filtered out because they have already been processed
         task_logger.info(f"Ignoring {len(prefiltered_images) - len(images)} images that have already been processed")
@@ -158,24 +262,8 @@ def process_images(
             total_time=0,
         )
     task_logger.info(f"Sending {len(images)} images to ML backend {pipeline.slug}")
-    urls = [source_image.public_url() for source_image in images if source_image.public_url()]
-
-    request_data = PipelineRequest(
-        pipeline=pipeline.slug,
-        source_images=[
-            SourceImageRequest(
-                id=str(source_image.pk),
-                url=url,
-            )
-            for source_image, url in zip(images, urls)
-            if url
-        ],
-    )
-
-    resp = requests.post(endpoint_url, json=request_data.dict())
-    resp.raise_for_status()
-    results = resp.json()
-    results = PipelineResponse(**results)
+    request_data = build_pipeline_request(pipeline, images)
+    results, _record = send_pipeline_request(endpoint_url, request_data)
 
     if job:
         job.logger.debug(f"Results: {results}")
@@ -189,13 +277,76 @@ def process_images(
     return results
 
 
+# Number of rows per INSERT or UPDATE when saving results
+SAVE_RESULTS_BATCH_SIZE = 1000
+
+
+# First key of the Postgres advisory locks taken on captures while their results are saved, the second is their id
+SAVE_RESULTS_LOCK_KEY = 7302
+
+
+def _lock_source_images(source_image_ids: typing.Iterable[int]):
+    """
+    Wait for the other tasks saving results for the same captures, then lock them until the end of the transaction.
+
+    The ids are locked in order, so that two tasks can't wait for each other.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_advisory_xact_lock(%s, id) FROM unnest(%s::integer[]) AS id",
+            [SAVE_RESULTS_LOCK_KEY, sorted(source_image_ids)],
+        )
+
+
+def _get_or_create_algorithms(names: typing.Iterable[str]) -> tuple[dict[str, Algorithm], list[Algorithm]]:
+    """
+    Look up the algorithms returned by the ML backend by name, creating the unknown ones.
+
+    Returns the algorithms by name, and the ones that were created.
+    """
+    names = set(names)
+    algorithms: dict[str, Algorithm] = {}
+    for algorithm in Algorithm.objects.filter(name__in=names):
+        algorithms.setdefault(algorithm.name, algorithm)
+    created = []
+    for name in sorted(names - algorithms.keys()):
+        # Another task may be creating the same algorithm
+        algorithms[name], _created = Algorithm.objects.get_or_create(name=name)
+        if _created:
+            created.append(algorithms[name])
+    return algorithms, created
+
+
+def _get_or_create_taxa(names: typing.Iterable[str]) -> tuple[dict[str, Taxon], list[Taxon]]:
+    """
+    Look up the taxa returned by the ML backend by name, creating the unknown ones.
+
+    Returns the taxa by name, and the ones that were created.
+    """
+    names = set(names)
+    taxa = {taxon.name: taxon for taxon in Taxon.objects.filter(name__in=names)}
+    created = []
+    for name in sorted(names - taxa.keys()):
+        taxa[name], _created = Taxon.objects.get_or_create(
+            name=name,
+            defaults={"name": name, "rank": TaxonRank.UNKNOWN},
+        )
+        if _created:
+            created.append(taxa[name])
+    return taxa, created
+
+
 @celery_app.task(soft_time_limit=60 * 4, time_limit=60 * 5)
 def save_results(results: PipelineResponse | None = None, results_json: str | None = None, job_id: int | None = None):
     """
     Save results from ML pipeline API.
 
+    The algorithms, taxa, source images and existing detections are looked up once for all the results,
+    then the new detections, classifications and occurrences are created in bulk. The number of queries
+    does not depend on the number of detections, except for reprocessed detections that already have
+    an occurrence, whose determination is updated one by one.
+
     @TODO break into task chunks.
-    @TODO rewrite this!
     """
     created_objects = []
     job = None
@@ -208,136 +359,192 @@ def save_results(results: PipelineResponse | None = None, results_json: str | No
     if _created:
         logger.warning(f"Pipeline choice returned by the ML backend was not recognized! {pipeline}")
         created_objects.append(pipeline)
-    algorithms_used = set()
 
     if job_id:
-        from ami.jobs.models import Job
+        from ami.jobs.models import Job, MLJob
 
         job = Job.objects.get(pk=job_id)
         job.logger.info("Saving results...")
 
-    # collection_name = f"Images processed by {results.pipeline} pipeline"
-    # if job_id:
-    #     from ami.jobs.models import Job
-
-    #     job = Job.objects.get(pk=job_id)
-    #     collection_name = f"Images processed by {results.pipeline} pipeline for job {job.name}"
-
-    # collection = SourceImageCollection.objects.create(name=collection_name)
-    # source_image_ids = [source_image.id for source_image in results.source_images]
-    # source_images = SourceImage.objects.filter(pk__in=source_image_ids)
-    # collection.images.set(source_images)
-    source_images = set()
-
     for detection_resp in results.detections:
-        # @TODO use bulk create, or optimize this in some way
-        print(detection_resp)
         assert detection_resp.algorithm, "No detection algorithm was specified in the returned results."
-        detection_algo, _created = Algorithm.objects.get_or_create(
-            name=detection_resp.algorithm,
+        for classification_resp in detection_resp.classifications:
+            assert classification_resp.algorithm, "No classification algorithm was specified in the returned results."
+
+    algorithm_names = {detection_resp.algorithm for detection_resp in results.detections} | {
+        classification_resp.algorithm
+        for detection_resp in results.detections
+        for classification_resp in detection_resp.classifications
+    }
+    algorithms, _created_algorithms = _get_or_create_algorithms(name for name in algorithm_names if name)
+    created_objects.extend(_created_algorithms)
+    algorithms_used: set[Algorithm] = set()
+
+    source_image_ids = {int(detection_resp.source_image_id) for detection_resp in results.detections}
+    # Tasks that save results for the same captures at the same time wait for each other,
+    # so that they don't both create the detections and classifications that are missing
+    with transaction.atomic():
+        _lock_source_images(source_image_ids)
+        source_images_by_id = SourceImage.objects.in_bulk(source_image_ids)
+        source_images: set[SourceImage] = set()
+
+        # Detections are identified by their source image, detection algorithm and bounding box
+        def detection_key(source_image_id: int, algorithm_id: int, bbox: list | None) -> tuple:
+            return (source_image_id, algorithm_id, tuple(bbox or ()))
+
+        detections_by_key = {
+            detection_key(detection.source_image_id, detection.detection_algorithm_id, detection.bbox): detection
+            for detection in Detection.objects.filter(
+                source_image__in=source_images_by_id.keys(),
+                detection_algorithm__in={
+                    algorithms[detection_resp.algorithm].pk  # type: ignore[index]
+                    for detection_resp in results.detections
+                },
+            ).select_related("occurrence__determination")
+        }
+        existing_detection_pks = {detection.pk for detection in detections_by_key.values()}
+        new_detections: list[Detection] = []
+        updated_detections: list[Detection] = []
+        # The saved detection of each detection in the results that has a source image
+        saved_detections: list[tuple[DetectionResponse, Detection]] = []
+
+        for detection_resp in results.detections:
+            source_image = source_images_by_id.get(int(detection_resp.source_image_id))
+            if not source_image:
+                logger.error(f"Source image {detection_resp.source_image_id} of a detection not found, skipping it")
+                continue
+            source_images.add(source_image)
+            detection_algo = algorithms[detection_resp.algorithm]  # type: ignore[index]
+            algorithms_used.add(detection_algo)
+
+            bbox = list(detection_resp.bbox.dict().values())
+            # Ensure that the crop image URL is not empty or only a slash. None is fine.
+            if detection_resp.crop_image_url and detection_resp.crop_image_url.strip("/"):
+                crop_url = detection_resp.crop_image_url
+            else:
+                crop_url = None
+
+            key = detection_key(source_image.pk, detection_algo.pk, bbox)
+            detection = detections_by_key.get(key)
+            if detection:
+                if not detection.path and crop_url:
+                    detection.path = crop_url
+                    updated_detections.append(detection)
+            else:
+                detection = Detection(
+                    source_image=source_image,
+                    bbox=bbox,
+                    timestamp=source_image.timestamp,
+                    path=crop_url,
+                    detection_time=detection_resp.timestamp,
+                    detection_algorithm=detection_algo,
+                )
+                detections_by_key[key] = detection
+                new_detections.append(detection)
+            saved_detections.append((detection_resp, detection))
+
+        Detection.objects.bulk_create(new_detections, batch_size=SAVE_RESULTS_BATCH_SIZE)
+        Detection.objects.bulk_update(updated_detections, ["path"], batch_size=SAVE_RESULTS_BATCH_SIZE)
+        created_objects.extend(new_detections)
+        logger.info(f"Created {len(new_detections)} detections, updated {len(updated_detections)} existing ones")
+
+        classification_responses = [
+            (detection, classification_resp)
+            for detection_resp, detection in saved_detections
+            for classification_resp in detection_resp.classifications
+        ]
+        taxa, _created_taxa = _get_or_create_taxa(
+            [classification_resp.classification for _detection, classification_resp in classification_responses]
         )
-        algorithms_used.add(detection_algo)
-        if _created:
-            created_objects.append(detection_algo)
-
-        # @TODO hmmmm what to do
-        source_image = SourceImage.objects.get(pk=detection_resp.source_image_id)
-        source_images.add(source_image)
-        existing_detection = Detection.objects.filter(
-            source_image=source_image,
-            detection_algorithm=detection_algo,
-            bbox=list(detection_resp.bbox.dict().values()),
-        ).first()
-        # Ensure that the crop image URL is not empty or only a slash. None is fine.
-        if detection_resp.crop_image_url and detection_resp.crop_image_url.strip("/"):
-            crop_url = detection_resp.crop_image_url
-        else:
-            crop_url = None
-        if existing_detection:
-            if not existing_detection.path:
-                existing_detection.path = crop_url
-                existing_detection.save()
-                print("Updated existing detection", existing_detection)
-            detection = existing_detection
-        else:
-            new_detection = Detection.objects.create(
-                source_image=source_image,
-                bbox=list(detection_resp.bbox.dict().values()),
-                timestamp=source_image.timestamp,
-                path=crop_url,
-                detection_time=detection_resp.timestamp,
-                detection_algorithm=detection_algo,
-            )
-            new_detection.save()
-            print("Created new detection", new_detection)
-            created_objects.append(new_detection)
-            detection = new_detection
-
-        for classification in detection_resp.classifications:
-            print(classification)
-
-            assert classification.algorithm, "No classification algorithm was specified in the returned results."
-            classification_algo, _created = Algorithm.objects.get_or_create(
-                name=classification.algorithm,
-            )
+        created_objects.extend(_created_taxa)
+
+        # Add the taxa returned by each classifier to its list
+        taxa_by_algorithm: dict[Algorithm, set[Taxon]] = collections.defaultdict(set)
+        for _detection, classification_resp in classification_responses:
+            classification_algo = algorithms[classification_resp.algorithm]  # type: ignore[index]
+            taxa_by_algorithm[classification_algo].add(taxa[classification_resp.classification])
+        for classification_algo, algorithm_taxa in taxa_by_algorithm.items():
             algorithms_used.add(classification_algo)
-            if _created:
-                created_objects.append(classification_algo)
-
             taxa_list, _created = TaxaList.objects.get_or_create(
                 name=f"Taxa returned by {classification_algo.name}",
             )
             if _created:
                 created_objects.append(taxa_list)
-
-            taxon, _created = Taxon.objects.get_or_create(
-                name=classification.classification,
-                defaults={"name": classification.classification, "rank": TaxonRank.UNKNOWN},
-            )
-            if _created:
-                created_objects.append(taxon)
-
-            taxa_list.taxa.add(taxon)
-
-            # @TODO this is asking for trouble
-            # shouldn't we be able to get the detection from the classification?
-            # also should filter by the correct detection algorithm
-            # or do we use the bbox as a unique identifier?
-            # then it doesn't matter what detection algorithm was used
-
-            new_classification, created = Classification.objects.get_or_create(
+            taxa_list.taxa.add(*algorithm_taxa)
+
+        # Classifications are identified by their detection, taxon, algorithm and score
+        existing_classification_keys = set(
+            Classification.objects.filter(
+                detection__in=existing_detection_pks,
+                algorithm__in=taxa_by_algorithm.keys(),
+            ).values_list("detection", "taxon", "algorithm", "score")
+        )
+        new_classifications: list[Classification] = []
+        new_classifications_by_detection: dict[Detection, list[Classification]] = collections.defaultdict(list)
+        num_duplicates = 0
+        for detection, classification_resp in classification_responses:
+            taxon = taxa[classification_resp.classification]
+            classification_algo = algorithms[classification_resp.algorithm]  # type: ignore[index]
+            score = max(classification_resp.scores)
+            key = (detection.pk, taxon.pk, classification_algo.pk, score)
+            if key in existing_classification_keys:
+                num_duplicates += 1
+                continue
+            existing_classification_keys.add(key)
+            classification = Classification(
                 detection=detection,
                 taxon=taxon,
                 algorithm=classification_algo,
-                score=max(classification.scores),
-                defaults={"timestamp": classification.timestamp or now()},
+                score=score,
+                timestamp=classification_resp.timestamp or now(),
             )
+            new_classifications.append(classification)
+            new_classifications_by_detection[detection].append(classification)
+
+        Classification.objects.bulk_create(new_classifications, batch_size=SAVE_RESULTS_BATCH_SIZE)
+        created_objects.extend(new_classifications)
+        if num_duplicates:
+            logger.warning(f"Found {num_duplicates} duplicate classifications, not creating new ones.")
+
+        # Create a new occurrence for each classified detection (no tracking yet)
+        # @TODO remove when we implement tracking
+        new_occurrences: list[Occurrence] = []
+        detections_with_new_occurrence: list[Detection] = []
+        redetermined_occurrences: list[Occurrence] = []
+        classified_detections = {
+            detection for detection_resp, detection in saved_detections if detection_resp.classifications
+        }
+        for detection in classified_detections:
+            if detection.occurrence:
+                if detection in new_classifications_by_detection:
+                    redetermined_occurrences.append(detection.occurrence)
+                continue
 
-            if created:
-                # Optionally add reference to job or pipeline here
-                created_objects.append(new_classification)
-            else:
-                # Optionally handle the case where a duplicate is found
-                logger.warn("Duplicate classification found, not creating a new one.")
-
-            # Create a new occurrence for each detection (no tracking yet)
-            # @TODO remove when we implement tracking
-            if not detection.occurrence:
-                occurrence = Occurrence.objects.create(
-                    event=source_image.event,
-                    deployment=source_image.deployment,
-                    project=source_image.project,
-                    determination=taxon,
-                    determination_score=new_classification.score,
-                )
-                detection.occurrence = occurrence  # type: ignore
-                detection.save()
-            detection.occurrence.save()
+            source_image = source_images_by_id[detection.source_image_id]
+            occurrence = Occurrence(
+                event_id=source_image.event_id,
+                deployment_id=source_image.deployment_id,
+                project_id=source_image.project_id,
+            )
+            detection.occurrence = occurrence
+            new_occurrences.append(occurrence)
+            detections_with_new_occurrence.append(detection)
+
+        Occurrence.objects.bulk_create(new_occurrences, batch_size=SAVE_RESULTS_BATCH_SIZE)
+        created_objects.extend(new_occurrences)
+        Detection.objects.bulk_update(
+            detections_with_new_occurrence, ["occurrence"], batch_size=SAVE_RESULTS_BATCH_SIZE
+        )
+        # Bulk created occurrences skip `Occurrence.save`, which would determine them from their predictions
+        update_new_occurrence_determinations(new_occurrences, batch_size=SAVE_RESULTS_BATCH_SIZE)
+        for occurrence in redetermined_occurrences:
+            update_occurrence_determination(occurrence, current_determination=occurrence.determination)
+        logger.info(f"Created {len(new_classifications)} classifications and {len(new_occurrences)} occurrences")
 
-    # Update precalculated counts on source images and events
-    with transaction.atomic():
-        for source_image in source_images:
-            source_image.save()
+    # Update precalculated counts on source images, events and deployments in the background
+    mark_for_recalculation("SourceImage", [source_image.pk for source_image in source_images])
+    mark_for_recalculation("Event", [source_image.event_id for source_image in source_images])
+    mark_for_recalculation("Deployment", [source_image.deployment_id for source_image in source_images])
 
     image_cropping_task = create_detection_images.delay(
         source_image_ids=[source_image.pk for source_image in source_images],
@@ -345,9 +552,6 @@ def save_results(results: PipelineResponse | None = None, results_json: str | No
     if job:
         job.logger.info(f"Creating detection images in sub-task {image_cropping_task.id}")
 
-    event_ids = [img.event_id for img in source_images]
-    update_calculated_fields_for_events(pks=event_ids)
-
     registered_algos = pipeline.algorithms.all()
     for algo in algorithms_used:
         # This is important for tracking what objects were processed by which algorithms
@@ -359,16 +563,7 @@ def save_results(results: PipelineResponse | None = None, results_json: str | No
     if job:
         if len(created_objects):
             job.logger.info(f"Created {len(created_objects)} objects")
-            try:
-                previously_created = int(job.progress.get_stage_param("results", "objects_created").value)
-                job.progress.update_stage(
-                    "results",
-                    objects_created=previously_created + len(created_objects),
-                )
-            except ValueError:
-                pass
-            else:
-                job.update_progress()
+            MLJob.add_created_objects(job.pk, len(created_objects))
 
 
 class PipelineStage(ConfigurableStage):
@@ -395,6 +590,14 @@ class Pipeline(BaseModel):
     )
     projects = models.ManyToManyField("main.Project", related_name="pipelines")
     endpoint_url = models.URLField(null=True, blank=True)
+    batch_size = models.PositiveIntegerField(
+        default=2,
+        help_text="Number of images sent to the ML backend in each request.",
+    )
+    max_concurrent_requests = models.PositiveIntegerField(
+        default=1,
+        help_text="Number of requests sent to the ML backend at the same time, to match its capacity.",
+    )
 
     class Meta:
         ordering = ["name", "version"]
@@ -420,7 +623,9 @@ class Pipeline(BaseModel):
             skip_processed=skip_processed,
         )
 
-    def process_images(self, images: typing.Iterable[SourceImage], job_id: int | None = None):
+    def process_images(
+        self, images: typing.Iterable[SourceImage], job_id: int | None = None, skip_processed: bool = True
+    ):
         if not self.endpoint_url:
             raise ValueError("No endpoint URL configured for this pipeline")
         return process_images(
@@ -428,8 +633,14 @@ class Pipeline(BaseModel):
             pipeline=self,
             images=images,
             job_id=job_id,
+            skip_processed=skip_processed,
         )
 
+    def process_images_in_batches(self, images: list[SourceImage]) -> typing.Iterator[ProcessedBatch]:
+        if not self.endpoint_url:
+            raise ValueError("No endpoint URL configured for this pipeline")
+        return process_images_in_batches(pipeline=self, endpoint_url=self.endpoint_url, images=images)
+
     def save_results(self, results: PipelineResponse, job_id: int | None = None):
         return save_results(results=results, job_id=job_id)
 
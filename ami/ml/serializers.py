@@ -53,6 +53,8 @@ class PipelineSerializer(DefaultSerializer):
             "algorithms",
             "stages",
             "endpoint_url",
+            "batch_size",
+            "max_concurrent_requests",
             "created_at",
             "updated_at",
         ]
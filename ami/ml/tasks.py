@@ -8,34 +8,51 @@ logger = logging.getLogger(__name__)
 
 
 @celery_app.task(soft_time_limit=default_soft_time_limit, time_limit=default_time_limit)
-def process_source_images_async(pipeline_choice: str, endpoint_url: str, image_ids: list[int], job_id: int | None):
-    from ami.jobs.models import Job
+def process_source_images_async(
+    pipeline_choice: str, endpoint_url: str, image_ids: list[int], job_id: int | None
+) -> dict[str, int]:
+    """
+    Process and save the results for a shard of the images of a job.
+
+    The images are sent in batches like in a job that runs in a single task,
+    and the counts of each batch are added to the progress of the job.
+    A batch that fails is counted and logged, so the other shards and the job can still finish.
+    """
+    from ami.jobs.models import MLJob
     from ami.main.models import SourceImage
-    from ami.ml.models.pipeline import Pipeline, process_images, save_results
+    from ami.ml.models.pipeline import Pipeline, process_images_in_batches, save_results
 
-    job = None
-    try:
-        job = Job.objects.get(pk=job_id)
-        job.logger.info(f"Processing {len(image_ids)} images for job {job}")
-    except Job.DoesNotExist as e:
-        logger.error(f"Job {job_id} not found: {e}")
-        pass
+    logger.info(f"Processing {len(image_ids)} images for job {job_id}")
 
-    images = SourceImage.objects.filter(pk__in=image_ids)
+    images = list(SourceImage.objects.filter(pk__in=image_ids))
     pipeline = Pipeline.objects.get(slug=pipeline_choice)
-
-    results = process_images(
-        pipeline=pipeline,
-        endpoint_url=endpoint_url,
-        images=images,
-        job_id=job_id,
-    )
-
-    try:
-        save_results(results=results, job_id=job_id)
-    except Exception as e:
-        logger.error(f"Failed to save results for job {job_id}: {e}")
-        raise e
+    counts = {"processed": 0, "failed": 0, "detections": 0, "classifications": 0}
+
+    for batch in process_images_in_batches(pipeline=pipeline, endpoint_url=endpoint_url, images=images):
+        batch_counts = {"processed": 0, "failed": 0, "detections": 0, "classifications": 0}
+        error = None
+        if batch.results is None:
+            error = f"Failed to process a batch of {len(batch.images)} images: {batch.error}"
+            batch_counts["failed"] = len(batch.images)
+        else:
+            try:
+                save_results(results=batch.results, job_id=job_id)
+            except Exception as e:
+                error = f"Failed to save results for a batch of {len(batch.images)} images: {e}"
+                batch_counts["failed"] = len(batch.images)
+            else:
+                batch_counts["processed"] = len(batch.images)
+                batch_counts["detections"] = len(batch.results.detections)
+                batch_counts["classifications"] = sum(len(d.classifications) for d in batch.results.detections)
+
+        if error:
+            logger.error(f"Job {job_id}: {error}")
+        if job_id is not None:
+            MLJob.update_shard_progress(job_id, error=error, **batch_counts)
+        for key, value in batch_counts.items():
+            counts[key] += value
+
+    return counts
 
 
 @celery_app.task(soft_time_limit=default_soft_time_limit, time_limit=default_time_limit)
@@ -1,11 +1,14 @@
 import datetime
 
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from rich import print
 
-from ami.main.models import Classification, Detection, Project, SourceImage, SourceImageCollection
+from ami.main.models import Classification, Detection, Occurrence, Project, SourceImage, SourceImageCollection
+from ami.ml.client import clear_client_cache
 from ami.ml.models import Algorithm, Pipeline
-from ami.ml.models.pipeline import collect_images, save_results
+from ami.ml.models.pipeline import collect_images, filter_processed_images, save_results
 from ami.ml.schemas import (
     BoundingBox,
     ClassificationResponse,
@@ -91,6 +94,65 @@ class TestPipeline(TestCase):
         print(saved_objects)
         # @TODO test the cached counts for detections, etc are updated on Events, Deployments, etc.
 
+    def test_save_results_in_bulk(self):
+        images = [SourceImage.objects.create(path=f"test-2024010100{i:02d}00.jpg") for i in range(10)]
+        results = self.fake_pipeline_results(images, self.pipeline)
+        results.detections = [
+            results.detections[0].copy(
+                update={"source_image_id": str(image.pk), "bbox": BoundingBox(x1=i, y1=0.0, x2=i + 1.0, y2=1.0)}
+            )
+            for image in images
+            for i in range(3)
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            save_results(results)
+        # The number of queries doesn't grow with the number of detections
+        self.assertLess(len(queries), 40)
+
+        # Saving the same results again doesn't create duplicates
+        save_results(results)
+
+        self.assertEqual(Detection.objects.filter(source_image__in=images).count(), 30)
+        self.assertEqual(Classification.objects.filter(detection__source_image__in=images).count(), 30)
+        occurrences = Occurrence.objects.filter(detections__source_image__in=images)
+        self.assertEqual(occurrences.count(), 30)
+        self.assertEqual(set(occurrences.values_list("determination__name", flat=True)), {"Test taxon"})
+
+    def test_save_results_determines_new_occurrences(self):
+        results = self.fake_pipeline_results(self.test_images, self.pipeline)
+        for detection in results.detections:
+            detection.classifications.append(
+                ClassificationResponse(
+                    classification="Test moth",
+                    labels=["Test moth"],
+                    scores=[0.9],
+                    algorithm=self.algorithms["binary_classifier"].name,
+                    timestamp=datetime.datetime.now(),
+                    terminal=False,
+                )
+            )
+
+        save_results(results)
+
+        occurrences = Occurrence.objects.filter(detections__source_image__in=self.test_images)
+        self.assertEqual(occurrences.count(), len(self.test_images))
+        for occurrence in occurrences:
+            # The same determination as saving the occurrence one by one
+            self.assertEqual(occurrence.determination, occurrence.best_prediction.taxon)
+            self.assertEqual(occurrence.determination_score, occurrence.best_prediction.score)
+
+    def test_filter_processed_images(self):
+        save_results(self.fake_pipeline_results(self.test_images, self.pipeline))
+        new_image = SourceImage.objects.create(path="test3-20240101002000.jpg")
+        images = SourceImage.objects.filter(pk__in=[image.pk for image in self.test_images + [new_image]])
+
+        # The images are filtered in the database with a single query
+        with self.assertNumQueries(1):
+            remaining = list(filter_processed_images(images, self.pipeline))
+        self.assertEqual(remaining, [new_image])
+        self.assertEqual(filter_processed_images([new_image, *self.test_images], self.pipeline), [new_image])
+
     def no_test_skip_existing_results(self):
         # @TODO fix issue with "None" algorithm on some detections
 
@@ -247,3 +309,118 @@ class TestPipeline(TestCase):
         images_again = list(collect_images(collection=self.image_collection, pipeline=self.pipeline))
         remaining_images_to_process = len(images_again)
         self.assertEqual(remaining_images_to_process, 0)
+
+
+class TestBatchDispatch(TestCase):
+    """
+    Send batches of images to a local HTTP server standing in for an ML backend.
+    """
+
+    def setUp(self):
+        import gzip
+        import http.server
+        import json
+        import threading
+        import time
+
+        self.images = [
+            SourceImage.objects.create(path=f"test-2024010100{i:02d}00.jpg", public_base_url="http://example.com/")
+            for i in range(9)
+        ]
+        self.pipeline = Pipeline.objects.create(name="Test Pipeline", batch_size=2, max_concurrent_requests=3)
+        state = self.server_state = {
+            "requests": 0,
+            "in_flight": 0,
+            "max_in_flight": 0,
+            "gzip": 0,
+            "connections": set(),
+        }
+        lock = threading.Lock()
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep connections alive
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                request = json.loads(body)
+                with lock:
+                    state["requests"] += 1
+                    state["gzip"] += int(self.headers.get("Content-Encoding") == "gzip")
+                    state["connections"].add(self.client_address)
+                    first_request = state["requests"] == 1
+                    state["in_flight"] += 1
+                    state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+                time.sleep(0.1)
+                with lock:
+                    state["in_flight"] -= 1
+                if first_request:
+                    # The first request fails and is retried
+                    self.send_response(503)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = PipelineResponse(
+                    pipeline=request["pipeline"],
+                    total_time=0.1,
+                    source_images=[
+                        SourceImageResponse(id=image["id"], url=image["url"]) for image in request["source_images"]
+                    ],
+                    detections=[],
+                ).json()
+                response_body = body.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                if "gzip" in self.headers.get("Accept-Encoding", ""):
+                    response_body = gzip.compress(response_body)
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(response_body)))
+                self.end_headers()
+                self.wfile.write(response_body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.pipeline.endpoint_url = f"http://127.0.0.1:{self.server.server_port}/process"
+        self.pipeline.save()
+        clear_client_cache()
+
+    def tearDown(self):
+        clear_client_cache()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_process_images_in_batches(self):
+        with self.settings(ML_REQUEST_RETRY_BACKOFF=0.01):
+            batches = list(self.pipeline.process_images_in_batches(self.images))
+
+        self.assertEqual([batch.index for batch in batches], [0, 1, 2, 3, 4])
+        self.assertEqual([len(batch.images) for batch in batches], [2, 2, 2, 2, 1])
+        for batch in batches:
+            assert batch.results is not None
+            self.assertEqual(
+                [image.id for image in batch.results.source_images], [str(image.pk) for image in batch.images]
+            )
+        # One retry, and several requests at once without going over the limit
+        self.assertEqual(self.server_state["requests"], 6)
+        self.assertGreater(self.server_state["max_in_flight"], 1)
+        self.assertLessEqual(self.server_state["max_in_flight"], 3)
+
+    def test_compressed_requests_reuse_connections(self):
+        with self.settings(ML_REQUEST_RETRY_BACKOFF=0.01, ML_REQUEST_COMPRESS_MIN_SIZE=0):
+            batches = list(self.pipeline.process_images_in_batches(self.images))
+
+        self.assertTrue(all(batch.results for batch in batches))
+        self.assertEqual(self.server_state["gzip"], 6)
+        # No more connections than requests sent at once
+        self.assertLessEqual(len(self.server_state["connections"]), 3)
+        for batch in batches:
+            assert batch.request is not None
+            self.assertEqual(batch.request.status_code, 200)
+            self.assertGreater(batch.request.bytes_sent, 0)
+            self.assertGreater(batch.request.bytes_received, 0)
+        # The failed first request was retried
+        self.assertEqual(sum(batch.request.attempts for batch in batches if batch.request), 6)
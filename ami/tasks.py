@@ -1,6 +1,8 @@
+import datetime
 import logging
 
 from django.apps import apps
+from django.conf import settings
 from django.db import models
 
 from config import celery_app
@@ -16,21 +18,52 @@ default_soft_time_limit = two_days
 
 # @TODO use shared_task decorator instead of celery_app?
 @celery_app.task(soft_time_limit=two_days, time_limit=two_days + one_hour)
-def sync_source_images(deployment_id: int) -> int:
+def sync_source_images(deployment_id: int, incremental: bool = False) -> int:
     from ami.main.models import Deployment
 
     deployment = Deployment.objects.get(id=deployment_id)
     logger.info(f"Importing source images for {deployment}")
-    return deployment.sync_captures()
+    return deployment.sync_captures(incremental=incremental)
 
 
-@celery_app.task(soft_time_limit=two_days, time_limit=two_days + one_hour)
-def calculate_storage_size(storage_source_id: int) -> int:
-    from ami.main.models import S3StorageSource
+@celery_app.task(soft_time_limit=one_day, time_limit=one_day + one_hour)
+def set_capture_dimensions(deployment_id: int, replace_existing: bool = False) -> int:
+    from ami.main.models import SourceImage, set_dimensions_for_captures
+
+    logger.info(f"Setting image dimensions for captures from deployment {deployment_id}")
+    captures = SourceImage.objects.filter(deployment_id=deployment_id)
+    return set_dimensions_for_captures(captures, replace_existing=replace_existing)
+
+
+@celery_app.task(soft_time_limit=one_day, time_limit=one_day + one_hour)
+def set_capture_timestamps_from_exif(deployment_id: int) -> int:
+    from ami.main.models import SourceImage, queue_regroup_events, set_timestamps_from_exif_for_captures
+
+    logger.info(f"Reading missing timestamps from EXIF data for captures from deployment {deployment_id}")
+    captures = SourceImage.objects.filter(deployment_id=deployment_id)
+    num_updated = set_timestamps_from_exif_for_captures(captures)
+    if num_updated:
+        queue_regroup_events(deployment_id)
+    return num_updated
 
-    storage = S3StorageSource.objects.get(id=storage_source_id)
+
+@celery_app.task(soft_time_limit=two_days, time_limit=two_days + one_hour)
+def calculate_storage_size(storage_source_id: int, full: bool = False, model_name: str = "S3StorageSource") -> int:
+    Model = apps.get_model("main", model_name)
+    storage = Model.objects.get(id=storage_source_id)
     logger.info(f"Calculating total storage size for {storage}")
-    return storage.calculate_size()
+    return storage.calculate_size(full=full)
+
+
+@celery_app.task(soft_time_limit=one_hour, time_limit=one_hour + 60)
+def recalculate_pending() -> dict[str, int]:
+    from ami.main.models import PendingRecalculation, recalculate_pending, schedule_pending_recalculation
+
+    counts = recalculate_pending()
+    # Objects marked while this task was running may not have scheduled another run
+    if PendingRecalculation.objects.exists():
+        schedule_pending_recalculation()
+    return counts
 
 
 @celery_app.task(soft_time_limit=one_hour, time_limit=one_hour + 60)
@@ -86,18 +119,48 @@ def populate_collection(collection_id: int) -> None:
 
 
 # Task to group images into events
-@celery_app.task(soft_time_limit=one_hour, time_limit=one_hour + 60)
-def regroup_events(deployment_id: int) -> None:
-    from ami.main.models import Deployment, group_images_into_events
+@celery_app.task(bind=True, max_retries=None, soft_time_limit=one_hour, time_limit=one_hour + 60)
+def regroup_events(
+    self, deployment_id: int, since: str | None = None, verify: bool = False, queued: bool = False
+) -> None:
+    """
+    Regroup all captures of a deployment into events.
 
-    deployment = Deployment.objects.get(id=deployment_id)
-    if deployment:
-        logger.info(f"Grouping captures for {deployment}")
-        events = group_images_into_events(deployment)
-        logger.info(f"{deployment } now has {len(events)} events")
-    else:
-        logger.error(f"Deployment with id {deployment_id} not found")
-    deployment.update_calculated_fields(save=True)
+    If `since` is given (an ISO timestamp), only the captures without an event and the ones
+    updated after it are regrouped, see `group_new_images_into_events`.
+    If the task was queued by `queue_regroup_events`, the request waiting for it is used instead.
+
+    Only one task works on a deployment at a time. If another one is running, this one waits for it
+    to finish, and the requests made in the meantime are merged into it.
+    """
+    from ami.main.models import (
+        Deployment,
+        deployment_lock,
+        group_images_into_events,
+        group_new_images_into_events,
+        pop_regroup_events_request,
+    )
+
+    with deployment_lock(deployment_id) as locked:
+        if not locked:
+            logger.info(f"Another task is working on deployment {deployment_id}, regrouping events after it")
+            raise self.retry(countdown=settings.DEPLOYMENT_TASK_RETRY_DELAY)
+
+        if queued:
+            since_datetime = pop_regroup_events_request(deployment_id)
+        else:
+            since_datetime = datetime.datetime.fromisoformat(since) if since else None
+
+        deployment = Deployment.objects.get(id=deployment_id)
+        if since_datetime:
+            logger.info(f"Grouping new captures for {deployment} since {since_datetime}")
+            events = group_new_images_into_events(deployment, since=since_datetime, verify=verify)
+            logger.info(f"Created or updated {len(events)} events for {deployment}")
+        else:
+            logger.info(f"Grouping captures for {deployment}")
+            events = group_images_into_events(deployment)
+            logger.info(f"{deployment } now has {len(events)} events")
+        deployment.update_calculated_fields(save=True)
 
 
 @celery_app.task(soft_time_limit=one_hour, time_limit=one_hour + 60)
@@ -1,13 +1,29 @@
+import csv
+import dataclasses
+import datetime
+import gzip
+import io
+import json
 import logging
-from urllib.parse import parse_qs, urljoin, urlparse
-
+import os
+import pathlib
+import shutil
+import struct
+import tempfile
+import threading
+from urllib.parse import parse_qs, quote, urljoin, urlparse
+
+import PIL.Image
 import requests
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
 from django.test import TestCase
 
-from ami.main.models import S3StorageSource
+from ami.main.models import LocalStorageSource, S3StorageSource, set_dimensions_for_captures
 from ami.tests.fixtures.main import create_captures_from_files, setup_test_project
 from ami.tests.fixtures.storage import S3_TEST_CONFIG
-from ami.utils import s3
+from ami.utils import local, s3
 
 logger = logging.getLogger(__name__)
 
@@ -117,6 +133,172 @@ class TestS3(TestCase):
         self.assertIsNone(result.first_file_found)
         self.assertEqual(result.files_checked, num_unmatched_files)
 
+    def test_list_files_sharded(self):
+        s3.write_random_file(self.config, key_prefix="root_")
+        for night in ["2023_01_01", "2023_01_02", "2023_01_03"]:
+            for _ in range(3):
+                s3.write_random_file(self.config, key_prefix=f"{night}/test_")
+        paginated_keys = {obj["Key"] for obj, _ in s3.list_files_paginated(self.config) if obj}
+
+        completed_shards = []
+        sharded_results = list(
+            s3.list_files_sharded(
+                self.config,
+                max_workers=2,
+                on_shard_complete=lambda prefix, done, total: completed_shards.append((prefix, done, total)),
+            )
+        )
+        sharded_keys = {obj["Key"] for obj, _ in sharded_results if obj}
+
+        self.assertEqual(sharded_keys, paginated_keys)
+        self.assertEqual(len(sharded_keys), 10)
+        self.assertEqual(len(completed_shards), 3)
+        self.assertEqual(completed_shards[-1][1:], (3, 3))
+        _, num_files_checked = sharded_results[-1]
+        self.assertEqual(num_files_checked, 10)
+
+    def test_list_files_start_after(self):
+        for night in ["2023_01_01", "2023_01_02", "2023_01_03"]:
+            for _ in range(3):
+                s3.write_random_file(self.config, key_prefix=f"{night}/test_")
+        all_keys = sorted(obj["Key"] for obj, _ in s3.list_files_paginated(self.config) if obj)
+        start_after = all_keys[4]  # Second file of the second night
+        expected_keys = set(all_keys[5:])
+
+        paginated_keys = {
+            obj["Key"] for obj, _ in s3.list_files_paginated(self.config, start_after=start_after) if obj
+        }
+        sharded_keys = {obj["Key"] for obj, _ in s3.list_files_sharded(self.config, start_after=start_after) if obj}
+
+        self.assertEqual(paginated_keys, expected_keys)
+        self.assertEqual(sharded_keys, expected_keys)
+
+    def test_list_files_start_after_with_watermark(self):
+        for night in ["2023_01_01", "2023_01_02"]:
+            for _ in range(2):
+                s3.write_random_file(self.config, key_prefix=f"{night}/test_")
+        all_objects = [obj for obj, _ in s3.list_files_paginated(self.config) if obj]
+        start_after = max(obj["Key"] for obj in all_objects)
+        watermark = max(obj["LastModified"] for obj in all_objects)
+        # A file directly under the prefix whose name sorts before the last key
+        root_key, _ = s3.write_random_file(self.config, key_prefix="0000_test_")
+        # A watermark in the future stands for a new file copied with its original modification time
+        future = watermark + datetime.timedelta(days=1)
+        new_key, _ = s3.write_random_file(self.config, key_prefix="2023_01_03/test_")
+
+        for list_files in [s3.list_files_paginated, s3.list_files_sharded]:
+            keys = {
+                obj["Key"]
+                for obj, _ in list_files(self.config, start_after=start_after, modified_after=watermark)
+                if obj
+            }
+            self.assertEqual(keys, {root_key, new_key})
+            keys = {
+                obj["Key"] for obj, _ in list_files(self.config, start_after=start_after, modified_after=future) if obj
+            }
+            self.assertEqual(keys, {new_key})
+
+    def test_list_files_from_inventory(self):
+        for night in ["2023_01_01", "2023_01_02"]:
+            for _ in range(3):
+                s3.write_random_file(self.config, key_prefix=f"{night}/test_")
+        objects = [obj for obj, _ in s3.list_files_paginated(self.config) if obj]
+
+        # Write an inventory report in the format of S3 inventory CSV files (no header, URL-encoded keys)
+        inventory = io.StringIO()
+        writer = csv.writer(inventory)
+        for obj in objects:
+            writer.writerow(
+                [self.config.bucket_name, quote(obj["Key"]), obj["Size"], obj["LastModified"].isoformat(), obj["ETag"]]
+            )
+        data_file = s3.write_file(
+            self.config, key="inventory/data.csv.gz", body=gzip.compress(inventory.getvalue().encode())
+        )
+        manifest = {"fileFormat": "CSV", "fileSchema": s3.INVENTORY_DEFAULT_SCHEMA, "files": [{"key": data_file.key}]}
+        manifest_file = s3.write_file(self.config, key="inventory/manifest.json", body=json.dumps(manifest).encode())
+
+        inventory_objects = [obj for obj, _ in s3.list_files_from_inventory(self.config, manifest_file.key) if obj]
+        self.assertEqual({obj["Key"] for obj in inventory_objects}, {obj["Key"] for obj in objects})
+        self.assertEqual(sum(obj["Size"] for obj in inventory_objects), sum(obj["Size"] for obj in objects))
+
+        night_keys = {
+            obj["Key"]
+            for obj, _ in s3.list_files_from_inventory(self.config, data_file.key, subdir="2023_01_02")
+            if obj
+        }
+        self.assertEqual(
+            night_keys, {obj["Key"] for obj, _ in s3.list_files_paginated(self.config, subdir="2023_01_02") if obj}
+        )
+
+    def test_list_files_from_parquet_inventory(self):
+        import pyarrow
+        import pyarrow.parquet
+
+        for night in ["2023_01_01", "2023_01_02"]:
+            for _ in range(3):
+                s3.write_random_file(self.config, key_prefix=f"{night}/test_")
+        objects = [obj for obj, _ in s3.list_files_paginated(self.config) if obj]
+
+        # Parquet inventory files use snake_case column names and keys that are not URL-encoded
+        table = pyarrow.table(
+            {
+                "bucket": [self.config.bucket_name] * len(objects),
+                "key": [obj["Key"] for obj in objects],
+                "size": [obj["Size"] for obj in objects],
+                "last_modified_date": [obj["LastModified"] for obj in objects],
+                "e_tag": [obj["ETag"] for obj in objects],
+                "is_latest": [True] * len(objects),
+            }
+        )
+        buffer = io.BytesIO()
+        pyarrow.parquet.write_table(table, buffer)
+        data_file = s3.write_file(self.config, key="inventory/data.parquet", body=buffer.getvalue())
+        manifest = {"fileFormat": "Parquet", "files": [{"key": data_file.key}]}
+        manifest_file = s3.write_file(self.config, key="inventory/manifest.json", body=json.dumps(manifest).encode())
+
+        inventory_objects = [obj for obj, _ in s3.list_files_from_inventory(self.config, manifest_file.key) if obj]
+        self.assertEqual({obj["Key"] for obj in inventory_objects}, {obj["Key"] for obj in objects})
+        self.assertEqual(sum(obj["Size"] for obj in inventory_objects), sum(obj["Size"] for obj in objects))
+        self.assertEqual(
+            {obj["Key"]: obj["LastModified"] for obj in inventory_objects},
+            {obj["Key"]: obj["LastModified"] for obj in objects},
+        )
+
+        # A downloaded copy of the report is only read from the disk when it is given as a file:// URI
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with open(os.path.join(temp_dir, "manifest.json"), "w") as f:
+                json.dump(manifest, f)
+            with open(os.path.join(temp_dir, "data.parquet"), "wb") as f:
+                f.write(buffer.getvalue())
+            local_keys = {
+                obj["Key"]
+                for obj, _ in s3.list_files_from_inventory(self.config, f"file://{temp_dir}/manifest.json")
+                if obj
+            }
+        self.assertEqual(local_keys, {obj["Key"] for obj in objects})
+
+    def test_count_files_by_prefix(self):
+        s3.write_random_file(self.config, key_prefix="root_")
+        for night in ["2023_01_01", "2023_01_02"]:
+            for _ in range(3):
+                s3.write_random_file(self.config, key_prefix=f"{night}/test_")
+        objects = [obj for obj, _ in s3.list_files_paginated(self.config) if obj]
+
+        totals = s3.count_files_by_prefix(self.config, max_workers=2)
+        self.assertEqual(len(totals), 3)
+        self.assertEqual(sum(prefix_totals["files"] for prefix_totals in totals.values()), len(objects))
+        self.assertEqual(
+            sum(prefix_totals["size"] for prefix_totals in totals.values()), sum(o["Size"] for o in objects)
+        )
+
+        # Only the prefix with a new file is counted again
+        first_night, second_night = sorted(prefix for prefix in totals if prefix)
+        s3.write_random_file(self.config, key_prefix="2023_01_02/test_")
+        previous = {**totals, first_night: {**totals[first_night], "files": 100}}
+        new_totals = s3.count_files_by_prefix(self.config, previous=previous)
+        self.assertEqual(new_totals[first_night]["files"], 100)
+        self.assertEqual(new_totals[second_night]["files"], totals[second_night]["files"] + 1)
+
     def test_write_and_count(self):
         count = s3.count_files(self.config)
         test_key, test_val = s3.write_random_file(self.config)
@@ -143,6 +325,48 @@ class TestS3(TestCase):
         out_val = resp.content
         self.assertEqual(test_val, out_val)
 
+    def test_presigned_urls(self):
+        keys = [s3.write_random_file(self.config)[0] for _ in range(3)]
+        # One of the URLs is already cached
+        cached_url = s3.get_presigned_url(self.config, keys[0])
+
+        urls = s3.get_presigned_urls([(self.config, key) for key in keys])
+
+        self.assertEqual(len(urls), len(keys))
+        self.assertEqual(urls[0], cached_url)
+        for key, url in zip(keys, urls):
+            self.assertEqual(urlparse(url).path, s3.make_full_key_uri(self.config, key, with_protocol=False))
+            self.assertEqual(s3.get_presigned_url(self.config, key), url)
+
+    def test_read_image_header(self):
+        image = PIL.Image.effect_noise((640, 480), 50).convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG")
+        keys = [s3.write_file(self.config, key=f"test_{i}.jpg", body=buffer.getvalue()).key for i in range(3)]
+
+        header = s3.read_image_header(self.config, keys[0], header_size=1024)
+        self.assertEqual(header.size, (640, 480))
+        # Falls back to reading the whole image if the header is incomplete
+        header = s3.read_image_header(self.config, keys[0], header_size=16)
+        self.assertEqual(header.size, (640, 480))
+
+        results = dict(s3.read_image_headers(self.config, keys + ["missing.jpg"], max_workers=2))
+        self.assertEqual({key: img.size for key, img in results.items() if img}, {key: (640, 480) for key in keys})
+        self.assertIsNone(results["missing.jpg"])
+
+    def test_read_exif_after_large_segment(self):
+        exif = PIL.Image.Exif()
+        exif[0x0132] = "2023:01:01 22:00:05"
+        buffer = io.BytesIO()
+        PIL.Image.effect_noise((64, 48), 50).convert("RGB").save(buffer, format="JPEG", exif=exif.tobytes())
+        data = buffer.getvalue()
+        # An APP2 segment larger than the header before the EXIF segment
+        app2 = b"\xff\xe2" + struct.pack(">H", 10_002) + bytes(10_000)
+        key = s3.write_file(self.config, key="test.jpg", body=data[:2] + app2 + data[2:]).key
+
+        self.assertEqual(s3.read_exif(self.config, key)[0x0132], "2023:01:01 22:00:05")
+        self.assertEqual(s3.read_exif(self.config, key, header_size=32)[0x0132], "2023:01:01 22:00:05")
+
 
 class TestS3PrefixUtils(TestCase):
     def setUp(self):
@@ -192,6 +416,42 @@ class TestS3PrefixUtils(TestCase):
         self.assertEqual(result, expected)
 
 
+class TestS3ClientCache(TestCase):
+    def setUp(self):
+        s3.clear_client_cache()
+        self.config = s3.S3Config(
+            endpoint_url="http://localhost:9000",
+            access_key_id="minioadmin",
+            secret_access_key="minioadmin",
+            bucket_name="test_bucket",
+            prefix="test_prefix",
+        )
+
+    def test_client_is_reused(self):
+        client = s3.get_s3_client(self.config)
+        self.assertIs(s3.get_s3_client(self.config), client)
+        self.assertIs(s3.get_resource(self.config), s3.get_resource(self.config))
+        self.assertEqual(client.meta.config.max_pool_connections, settings.S3_MAX_POOL_CONNECTIONS)
+
+    def test_client_not_shared_between_credentials(self):
+        other_config = dataclasses.replace(self.config, secret_access_key="other")
+        self.assertIsNot(s3.get_s3_client(self.config), s3.get_s3_client(other_config))
+
+    def test_client_cache_is_bounded(self):
+        with self.settings(S3_CLIENT_CACHE_SIZE=2):
+            first_client = s3.get_s3_client(self.config)
+            for i in range(2):
+                s3.get_s3_client(dataclasses.replace(self.config, bucket_name=f"test_bucket_{i}"))
+            self.assertIsNot(s3.get_s3_client(self.config), first_client)
+
+    def test_resource_is_per_thread(self):
+        resources = []
+        thread = threading.Thread(target=lambda: resources.append(s3.get_resource(self.config)))
+        thread.start()
+        thread.join()
+        self.assertIsNot(resources[0], s3.get_resource(self.config))
+
+
 class TestStorageSource(TestCase):
     def setUp(self):
         self.project, self.deployment = setup_test_project()
@@ -265,3 +525,207 @@ class TestStorageSource(TestCase):
         status = self.storage_source.test_connection()
         self.assertTrue(status.connection_successful)
         self.assertIsNotNone(status.first_file_found)
+
+    def test_sync_captures_small_batches(self):
+        # A queue of one small batch makes the listing wait for the database writes
+        num_captures = self.deployment.captures.count()
+        total_files = self.deployment.sync_captures(batch_size=2, queue_size=1, sharded=True)
+        self.assertEqual(total_files, num_captures)
+        self.assertEqual(self.deployment.captures.count(), num_captures)
+
+    def write_inventory(self, created_at: datetime.datetime) -> str:
+        # An inventory report that only lists the first file of the data source
+        assert isinstance(self.storage_source, S3StorageSource)
+        config = self.storage_source.config
+        obj = next(obj for obj, _ in s3.list_files_paginated(config) if obj)
+        inventory = io.StringIO()
+        csv.writer(inventory).writerow(
+            [config.bucket_name, quote(obj["Key"]), obj["Size"], obj["LastModified"].isoformat(), obj["ETag"]]
+        )
+        data_file = s3.write_file(config, key="inventory/data.csv", body=inventory.getvalue().encode())
+        manifest = {
+            "creationTimestamp": str(int(created_at.timestamp() * 1000)),
+            "fileFormat": "CSV",
+            "fileSchema": s3.INVENTORY_DEFAULT_SCHEMA,
+            "files": [{"key": data_file.key}],
+        }
+        return s3.write_file(config, key="inventory/manifest.json", body=json.dumps(manifest).encode()).key
+
+    def test_sync_captures_from_old_inventory(self):
+        assert isinstance(self.storage_source, S3StorageSource)
+        num_captures = self.deployment.captures.count()
+        old_inventory = self.write_inventory(created_at=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc))
+        self.assertEqual(
+            s3.get_inventory_creation_time(self.storage_source.config, old_inventory),
+            datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc),
+        )
+
+        # The report is older than the last sync, the files missing from it may have been added since
+        self.deployment.sync_captures(inventory=old_inventory, delete_stale=True)
+        self.assertEqual(self.deployment.captures.count(), num_captures)
+
+        new_inventory = self.write_inventory(created_at=datetime.datetime.now(tz=datetime.timezone.utc))
+        self.deployment.sync_captures(inventory=new_inventory, delete_stale=True)
+        self.assertEqual(self.deployment.captures.count(), 1)
+
+
+class TestLocalStorage(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.config = local.LocalConfig(root=self.temp_dir.name, public_base_url="http://localhost/captures/")
+        image = PIL.Image.effect_noise((64, 48), 50).convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG")
+        self.keys = ["20230101000000-snapshot.jpg"]
+        for night in ["2023_01_01", "2023_01_02"]:
+            for i in range(3):
+                self.keys.append(f"{night}/2023010{night[-1]}22000{i}-snapshot.jpg")
+        for key in self.keys:
+            os.makedirs(os.path.dirname(local.full_path(self.config, key)), exist_ok=True)
+            with open(local.full_path(self.config, key), "wb") as f:
+                f.write(buffer.getvalue())
+        with open(local.full_path(self.config, "2023_01_01/notes.txt"), "w") as f:
+            f.write("Not an image")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_list_files(self):
+        results = list(local.list_files(self.config, max_workers=2))
+        self.assertEqual({obj["Key"] for obj, _ in results if obj}, set(self.keys))
+        _, num_files_checked = results[-1]
+        self.assertEqual(num_files_checked, len(self.keys) + 1)
+
+        subdir_keys = {obj["Key"] for obj, _ in local.list_files(self.config, subdir="2023_01_02") if obj}
+        self.assertEqual(subdir_keys, {key for key in self.keys if key.startswith("2023_01_02/")})
+
+        start_after = sorted(self.keys)[1]
+        new_keys = {obj["Key"] for obj, _ in local.list_files(self.config, start_after=start_after) if obj}
+        self.assertEqual(new_keys, set(sorted(self.keys)[2:]))
+
+    def test_list_files_start_after_with_watermark(self):
+        start_after = sorted(self.keys)[-1]
+        watermark = datetime.datetime.now(tz=datetime.timezone.utc)
+        old_mtime = (watermark - datetime.timedelta(days=30)).timestamp()
+        for key in self.keys:
+            os.utime(local.full_path(self.config, key), (old_mtime, old_mtime))
+        # A new folder copied with its original modification times, e.g. by `rsync -a`
+        os.makedirs(local.full_path(self.config, "2023_01_03"))
+        copied_key = "2023_01_03/20230103220000-snapshot.jpg"
+        shutil.copy2(local.full_path(self.config, self.keys[1]), local.full_path(self.config, copied_key))
+        os.utime(local.full_path(self.config, copied_key), (old_mtime, old_mtime))
+        # A new file directly under the root whose name sorts before the last key
+        root_key = "20230102000000-snapshot.jpg"
+        shutil.copy(local.full_path(self.config, self.keys[1]), local.full_path(self.config, root_key))
+        new_mtime = (watermark + datetime.timedelta(minutes=1)).timestamp()
+        os.utime(local.full_path(self.config, root_key), (new_mtime, new_mtime))
+
+        new_keys = {
+            obj["Key"]
+            for obj, _ in local.list_files(self.config, start_after=start_after, modified_after=watermark)
+            if obj
+        }
+        self.assertEqual(new_keys, {copied_key, root_key})
+
+    def test_count_files_by_prefix(self):
+        totals = local.count_files_by_prefix(self.config)
+        # Keyed by the full path of each subdirectory, like the full keys of the prefixes in a bucket
+        root = pathlib.PurePosixPath(self.temp_dir.name)
+        self.assertEqual(
+            {prefix: t["files"] for prefix, t in totals.items()},
+            {"": 1, f"{root / '2023_01_01'}/": 3, f"{root / '2023_01_02'}/": 3},
+        )
+
+    def test_full_path(self):
+        self.assertEqual(local.full_path(self.config, "/2023_01_01/a.jpg"), f"{self.temp_dir.name}/2023_01_01/a.jpg")
+        self.assertEqual(local.full_path(self.config, "2023_01_01/../a.jpg"), f"{self.temp_dir.name}/a.jpg")
+        # Keys can't point outside of the directory
+        for key in ["../other/a.jpg", "2023_01_01/../../a.jpg", ".."]:
+            with self.assertRaises(ValueError):
+                local.full_path(self.config, key)
+
+    def test_public_url(self):
+        self.assertEqual(local.public_url(self.config, self.keys[1]), f"http://localhost/captures/{self.keys[1]}")
+        # Files are not served without a static file server
+        self.assertIsNone(local.public_url(local.LocalConfig(root=self.temp_dir.name), self.keys[1]))
+
+    def test_read_image_header(self):
+        self.assertEqual(local.read_image_header(self.config, self.keys[1]).size, (64, 48))
+        self.assertEqual(local.read_image_header(self.config, self.keys[1], header_size=16).size, (64, 48))
+
+    def test_read_exif(self):
+        exif = PIL.Image.Exif()
+        exif[0x0132] = "2023:01:01 22:00:05"
+        image = PIL.Image.effect_noise((64, 48), 50).convert("RGB")
+        with open(local.full_path(self.config, "IMG_0001.jpg"), "wb") as f:
+            image.save(f, format="JPEG", exif=exif.tobytes())
+
+        self.assertEqual(local.read_exif(self.config, "IMG_0001.jpg")[0x0132], "2023:01:01 22:00:05")
+        # The rest of the EXIF segment is read if it doesn't fit in the header
+        self.assertEqual(local.read_exif(self.config, "IMG_0001.jpg", header_size=32)[0x0132], "2023:01:01 22:00:05")
+
+        # The segments before the EXIF segment are skipped if they are larger than the header
+        with open(local.full_path(self.config, "IMG_0001.jpg"), "rb") as f:
+            data = f.read()
+        app2 = b"\xff\xe2" + struct.pack(">H", 10_002) + bytes(10_000)
+        with open(local.full_path(self.config, "IMG_0002.jpg"), "wb") as f:
+            f.write(data[:2] + app2 + data[2:])
+        self.assertEqual(local.read_exif(self.config, "IMG_0002.jpg")[0x0132], "2023:01:01 22:00:05")
+        self.assertEqual(local.read_exif(self.config, "IMG_0002.jpg", header_size=32)[0x0132], "2023:01:01 22:00:05")
+
+        results = dict(local.read_exifs(self.config, ["IMG_0001.jpg", self.keys[1], "missing.jpg"], max_workers=2))
+        self.assertEqual(results["IMG_0001.jpg"][0x0132], "2023:01:01 22:00:05")
+        self.assertIsNone(results[self.keys[1]])
+        self.assertIsNone(results["missing.jpg"])
+
+    def test_connection(self):
+        result = local.test_connection(self.config)
+        self.assertTrue(result.connection_successful)
+        self.assertTrue(result.prefix_exists)
+        self.assertIsNotNone(result.first_file_found)
+
+        result = local.test_connection(local.LocalConfig(root=os.path.join(self.temp_dir.name, "missing")))
+        self.assertFalse(result.connection_successful)
+
+    def test_sync_captures(self):
+        project, deployment = setup_test_project(reuse=False)
+        deployment.data_source = None
+        deployment.local_data_source = LocalStorageSource.objects.create(
+            name="Test directory", path=self.temp_dir.name, public_base_url=self.config.public_base_url
+        )
+        deployment.save()
+
+        total_files = deployment.sync_captures(sharded=True, shard_workers=2)
+
+        self.assertEqual(total_files, len(self.keys))
+        self.assertEqual(set(deployment.captures.values_list("path", flat=True)), set(self.keys))
+        capture = deployment.captures.get(path=self.keys[1])
+        self.assertEqual(capture.public_url(), f"http://localhost/captures/{self.keys[1]}")
+        self.assertEqual(capture.get_dimensions(), (64, 48))
+
+    def test_set_dimensions_for_captures(self):
+        project, deployment = setup_test_project(reuse=False)
+        deployment.data_source = None
+        deployment.local_data_source = LocalStorageSource.objects.create(
+            name="Test directory", path=self.temp_dir.name, public_base_url=self.config.public_base_url
+        )
+        deployment.save()
+        deployment.sync_captures()
+        deployment.captures.update(width=None, height=None)
+
+        num_updated = set_dimensions_for_captures(deployment.captures.all(), max_workers=2)
+
+        self.assertEqual(num_updated, len(self.keys))
+        self.assertEqual(set(deployment.captures.values_list("width", "height")), {(64, 48)})
+
+    def test_single_data_source(self):
+        project, deployment = setup_test_project(reuse=False)
+        deployment.local_data_source = LocalStorageSource.objects.create(
+            name="Test directory", path=self.temp_dir.name
+        )
+        if not deployment.data_source:
+            deployment.data_source = S3StorageSource.objects.create(name="Test bucket", bucket="test")
+        with self.assertRaises(ValidationError):
+            deployment.full_clean()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            deployment.save()
@@ -1,3 +1,3 @@
-from . import dates, s3
+from . import dates, local, s3, storages
 
-__all__ = ["dates", "s3"]
+__all__ = ["dates", "local", "s3", "storages"]
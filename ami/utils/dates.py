@@ -1,9 +1,14 @@
 import datetime
 import logging
+import os
 import pathlib
 import re
+import typing
+from dataclasses import dataclass
 
 import dateutil.parser
+import numpy as np
+import PIL.Image
 
 logger = logging.getLogger(__name__)
 
@@ -56,6 +61,148 @@ def get_image_timestamp_from_filename(img_path, raise_error=False) -> datetime.d
         return date
 
 
+EXIF_DATETIME_ORIGINAL = 0x9003
+EXIF_DATETIME = 0x0132
+EXIF_IFD = 0x8769
+
+
+def get_image_timestamp_from_exif(exif: PIL.Image.Exif | None) -> datetime.datetime | None:
+    """
+    Parse the date and time a photo was taken from its EXIF data.
+
+    Uses DateTimeOriginal, or the DateTime the file was last changed if that is missing.
+
+    >>> exif = PIL.Image.Exif()
+    >>> exif[EXIF_DATETIME] = "2022:08:10 23:15:07"
+    >>> get_image_timestamp_from_exif(exif)
+    datetime.datetime(2022, 8, 10, 23, 15, 7)
+    >>> get_image_timestamp_from_exif(PIL.Image.Exif()) is None
+    True
+    """
+    if not exif:
+        return None
+    values = [exif.get_ifd(EXIF_IFD).get(EXIF_DATETIME_ORIGINAL), exif.get(EXIF_DATETIME)]
+    for value in values:
+        if not isinstance(value, str):
+            continue
+        try:
+            return datetime.datetime.strptime(value.strip("\x00 "), "%Y:%m:%d %H:%M:%S")
+        except ValueError:
+            logger.debug(f"Could not parse EXIF date '{value}'")
+    return None
+
+
+# Filename timestamp formats that can be parsed in batches, see `get_image_timestamps_from_filenames`.
+# The first one is the format that `get_image_timestamp_from_filename` tries first.
+FILENAME_TIMESTAMP_PATTERNS = {
+    "YYYYMMDDhhmmss": r"(\d{4})(\d{2})(\d{2})(\d{2})(\d{2})(\d{2})",
+    "YYYYMMDD-hhmmss": r"^(\d{4})(\d{2})(\d{2})-(\d{2})(\d{2})(\d{2})$",
+    "YYYY-MM-DDThh:mm:ss": r"^(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})$",
+}
+
+
+def _filename_stem(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def _parse_filename_timestamps(paths: typing.Sequence[str], pattern: str) -> list[datetime.datetime | None]:
+    """
+    Parse the timestamps of filenames that match one of FILENAME_TIMESTAMP_PATTERNS, None for the others.
+
+    The regex is matched for each name, the dates are then validated and built for the whole batch with NumPy.
+    """
+    regex = re.compile(FILENAME_TIMESTAMP_PATTERNS[pattern])
+    matched_indices = []
+    fields = []
+    for i, path in enumerate(paths):
+        match = regex.search(_filename_stem(path))
+        if match:
+            matched_indices.append(i)
+            fields.append(match.groups())
+
+    results: list[datetime.datetime | None] = [None] * len(paths)
+    if not fields:
+        return results
+
+    year, month, day, hour, minute, second = np.array(fields, dtype=np.int64).T
+    month_start = ((year - 1970) * 12 + month - 1).astype("datetime64[M]")
+    days_in_month = ((month_start + 1).astype("datetime64[D]") - month_start.astype("datetime64[D]")).astype(np.int64)
+    # The same dates as datetime.strptime accepts
+    valid = (
+        (year >= 1)
+        & (month >= 1)
+        & (month <= 12)
+        & (day >= 1)
+        & (day <= days_in_month)
+        & (hour < 24)
+        & (minute < 60)
+        & (second < 60)
+    )
+    seconds = (day - 1) * 86400 + hour * 3600 + minute * 60 + second
+    timestamps = (month_start.astype("datetime64[s]") + seconds.astype("timedelta64[s]")).tolist()
+    for i, timestamp, is_valid in zip(matched_indices, timestamps, valid.tolist()):
+        if is_valid:
+            results[i] = timestamp
+    return results
+
+
+def learn_filename_timestamp_pattern(paths: typing.Sequence[str], min_share: float = 0.9) -> str | None:
+    """
+    Find the filename timestamp pattern of a sample of filenames, e.g. the first files of a deployment.
+
+    Returns the name of the pattern in FILENAME_TIMESTAMP_PATTERNS that parses the most filenames,
+    if it parses at least `min_share` of them, and always in the same way as `get_image_timestamp_from_filename`.
+
+    >>> learn_filename_timestamp_pattern(["20220810231507-00-07.jpg", "20220810231607-00-07.jpg"])
+    'YYYYMMDDhhmmss'
+    >>> learn_filename_timestamp_pattern(["2022-08-10T23:15:07.jpg", "2022-08-10T23:16:07.jpg"])
+    'YYYY-MM-DDThh:mm:ss'
+    >>> learn_filename_timestamp_pattern(["IMG_0001.jpg", "IMG_0002.jpg"]) is None
+    True
+    """
+    if not paths:
+        return None
+    expected = [get_image_timestamp_from_filename(path) for path in paths]
+    best_pattern, best_count = None, 0
+    for pattern in FILENAME_TIMESTAMP_PATTERNS:
+        parsed = _parse_filename_timestamps(paths, pattern)
+        if any(
+            timestamp and timestamp != expected_timestamp for timestamp, expected_timestamp in zip(parsed, expected)
+        ):
+            continue
+        count = sum(1 for timestamp in parsed if timestamp)
+        if count > best_count:
+            best_pattern, best_count = pattern, count
+    if best_count >= min_share * len(paths):
+        return best_pattern
+    return None
+
+
+def get_image_timestamps_from_filenames(
+    paths: typing.Sequence[str], pattern: str | None = None
+) -> list[datetime.datetime | None]:
+    """
+    Parse the timestamps of many filenames at once, using the filename pattern of the deployment if known.
+
+    Filenames that don't match the pattern are parsed with `get_image_timestamp_from_filename`.
+
+    >>> get_image_timestamps_from_filenames(
+    ...     ["a/20220810231507-00-07.jpg", "a/20221310231507.jpg", "a/2022-08-10 23:15:07.jpg"], "YYYYMMDDhhmmss"
+    ... )
+    [datetime.datetime(2022, 8, 10, 23, 15, 7), None, datetime.datetime(2022, 8, 10, 23, 15, 7)]
+    """
+    if not pattern:
+        return [get_image_timestamp_from_filename(path) for path in paths]
+
+    timestamps = _parse_filename_timestamps(paths, pattern)
+    outliers = [i for i, timestamp in enumerate(timestamps) if timestamp is None]
+    for i in outliers:
+        timestamps[i] = get_image_timestamp_from_filename(paths[i])
+    if outliers:
+        logger.debug(f"{len(outliers)} of {len(paths)} filenames did not match the timestamp pattern {pattern}")
+    return timestamps
+
+
 def format_timedelta(duration: datetime.timedelta | None) -> str:
     """Format the duration for display.
     @TODO try the humanize library
@@ -136,6 +283,151 @@ def group_datetimes_by_gap(
     return groups
 
 
+@dataclass
+class TimestampGroups:
+    """
+    Groups of timestamps as index ranges into the sorted timestamps, see `group_timestamps_by_gap`.
+
+    Group `i` contains `timestamps[starts[i]:ends[i]]`.
+    """
+
+    timestamps: np.ndarray
+    starts: np.ndarray
+    ends: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def counts(self) -> np.ndarray:
+        return self.ends - self.starts
+
+    def first_timestamps(self) -> np.ndarray:
+        return self.timestamps[self.starts]
+
+    def last_timestamps(self) -> np.ndarray:
+        return self.timestamps[self.ends - 1]
+
+    def group_indices(self) -> np.ndarray:
+        """
+        The number of the group of each timestamp.
+        """
+        indices = np.zeros(len(self.timestamps), dtype=np.int64)
+        indices[self.starts[1:]] = 1
+        return np.cumsum(indices)
+
+    def ranges(self) -> typing.Iterator[tuple[datetime.datetime, datetime.datetime, int]]:
+        """
+        Yield the first and last timestamp and the number of timestamps of each group.
+        """
+        for first, last, count in zip(
+            self.first_timestamps().tolist(), self.last_timestamps().tolist(), self.counts().tolist()
+        ):
+            yield first, last, count
+
+    def to_lists(self) -> list[list[datetime.datetime]]:
+        """
+        Return the groups as lists of datetimes, like `group_datetimes_by_gap`.
+        """
+        timestamps = self.timestamps.tolist()
+        return [timestamps[start:end] for start, end in zip(self.starts.tolist(), self.ends.tolist())]
+
+    def interval_stats(self) -> dict[str, np.ndarray]:
+        """
+        Statistics of the time between timestamps in each group and of the gaps between groups.
+
+        Useful to choose the `max_time_gap`: it should be well above the usual interval between
+        captures (median_interval), but below the gaps between monitoring sessions (gap_before).
+        Groups of a single timestamp have NaT intervals, the first group has a NaT gap_before.
+
+        >>> timestamps = np.array(["2021-01-01T20:00", "2021-01-01T20:10", "2021-01-01T20:30",
+        ...                        "2021-01-02T20:00", "2021-01-03T20:00", "2021-01-03T20:05"], dtype="datetime64[m]")
+        >>> stats = group_timestamps_by_gap(timestamps).interval_stats()
+        >>> stats["median_interval"].astype("timedelta64[m]").tolist()
+        [datetime.timedelta(seconds=900), None, datetime.timedelta(seconds=300)]
+        >>> stats["max_interval"].astype("timedelta64[m]").tolist()
+        [datetime.timedelta(seconds=1200), None, datetime.timedelta(seconds=300)]
+        >>> stats["gap_before"].astype("timedelta64[m]").tolist()
+        [None, datetime.timedelta(seconds=84600), datetime.timedelta(days=1)]
+        """
+        intervals = np.diff(self.timestamps)
+        num_groups = len(self)
+        nat = np.timedelta64("NaT", "us")
+
+        # The intervals within each group, sorted by group and then by length
+        group_of_interval = self.group_indices()[1:]
+        within_group = group_of_interval == self.group_indices()[:-1]
+        intervals, group_of_interval = intervals[within_group], group_of_interval[within_group]
+        order = np.lexsort((intervals, group_of_interval))
+        intervals, group_of_interval = intervals[order], group_of_interval[order]
+        num_intervals = np.bincount(group_of_interval, minlength=num_groups)
+        first_interval = np.concatenate([[0], np.cumsum(num_intervals)[:-1]])
+        has_intervals = num_intervals > 0
+
+        median_interval = np.full(num_groups, nat, dtype="timedelta64[us]")
+        max_interval = np.full(num_groups, nat, dtype="timedelta64[us]")
+        if len(intervals):
+            intervals = intervals.astype("timedelta64[us]")
+            lower = first_interval + (num_intervals - 1) // 2
+            upper = first_interval + num_intervals // 2
+            lower, upper = lower[has_intervals], upper[has_intervals]
+            median_interval[has_intervals] = intervals[lower] + (intervals[upper] - intervals[lower]) / 2
+            max_interval[has_intervals] = intervals[first_interval[has_intervals] + num_intervals[has_intervals] - 1]
+
+        gap_before = np.full(num_groups, nat, dtype="timedelta64[us]")
+        if num_groups > 1:
+            gap_before[1:] = self.first_timestamps()[1:] - self.last_timestamps()[:-1]
+
+        return {
+            "first": self.first_timestamps(),
+            "last": self.last_timestamps(),
+            "count": self.counts(),
+            "median_interval": median_interval,
+            "max_interval": max_interval,
+            "gap_before": gap_before,
+        }
+
+
+def group_timestamps_by_gap(
+    timestamps: np.ndarray | typing.Sequence[datetime.datetime],
+    max_time_gap=datetime.timedelta(minutes=120),
+) -> TimestampGroups:
+    """
+    Divide timestamps into groups based on a maximum time gap, with vectorized NumPy operations.
+
+    Gives the same groups as `group_datetimes_by_gap`, but returns index ranges into the sorted
+    timestamps instead of nested lists, which is much faster and smaller for millions of timestamps.
+    Missing timestamps (None or NaT) are left out. No timestamps give no groups.
+
+    >>> timestamps = [
+    ...     datetime.datetime(2021, 1, 1, 0, 10, 0),
+    ...     datetime.datetime(2021, 1, 1, 0, 19, 0),
+    ...     datetime.datetime(2021, 1, 1, 1, 20, 0),
+    ...     datetime.datetime(2021, 1, 1, 1, 30, 0),
+    ...     datetime.datetime(2021, 1, 2, 0, 10, 0),
+    ...     datetime.datetime(2021, 1, 2, 1, 29, 0),]
+    >>> groups = group_timestamps_by_gap(timestamps, max_time_gap=datetime.timedelta(minutes=60))
+    >>> len(groups)
+    4
+    >>> groups.starts.tolist(), groups.ends.tolist()
+    ([0, 2, 4, 5], [2, 4, 5, 6])
+    >>> groups.to_lists() == group_datetimes_by_gap(timestamps, max_time_gap=datetime.timedelta(minutes=60))
+    True
+    >>> len(group_timestamps_by_gap([]))
+    0
+    """
+    timestamps = np.asarray(timestamps, dtype="datetime64[us]")
+    timestamps = np.sort(timestamps[~np.isnat(timestamps)])
+
+    # A new group starts after every interval that is at least the max time gap
+    boundaries = np.flatnonzero(np.diff(timestamps) >= np.timedelta64(max_time_gap)) + 1
+    if len(timestamps):
+        starts = np.concatenate([[0], boundaries])
+        ends = np.concatenate([boundaries, [len(timestamps)]])
+    else:
+        starts = ends = np.array([], dtype=np.int64)
+    return TimestampGroups(timestamps=timestamps, starts=starts, ends=ends)
+
+
 def group_datetimes_by_shifted_day(timestamps: list[datetime.datetime]) -> list[list[datetime.datetime]]:
     """
     @TODO: Needs testing
@@ -0,0 +1,330 @@
+"""
+Helpers for data sources in a local or network mounted directory, e.g. an NFS share served by a static file server.
+
+The functions mirror the ones in `ami.utils.s3` and return the same structures, so that captures
+in a directory can be synced and counted the same way as captures in a bucket.
+Keys are the paths of the files relative to the root directory, with forward slashes.
+"""
+
+import concurrent.futures
+import datetime
+import io
+import logging
+import os
+import pathlib
+import re
+import time
+import typing
+import urllib.parse
+from dataclasses import dataclass
+
+import PIL.Image
+from mypy_boto3_s3.type_defs import ObjectTypeDef
+
+from .s3 import IMAGE_HEADER_SIZE, _compile_regex_filter, _filter_single_key, _is_after_checkpoint
+from .storages import EXIF_HEADER_SIZE, IMAGE_FILE_EXTENSIONS, ConnectionTestResult, read_exif_segment
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LocalConfig:
+    root: str
+    public_base_url: str | None = None
+
+
+def full_path(config: LocalConfig, key: str = "") -> str:
+    """
+    Return the absolute path of a key in the directory.
+
+    Raises ValueError if the key points outside of the directory, e.g. with "..".
+    """
+    root = os.path.abspath(config.root)
+    path = os.path.abspath(os.path.join(root, key.lstrip("/")))
+    if path != root and not path.startswith(f"{root}{os.sep}"):
+        raise ValueError(f"The key {key} is outside of the directory {config.root}")
+    return path
+
+
+def make_full_prefix_uri(config: LocalConfig, subdir: str | None = None, regex_filter: str | None = None) -> str:
+    path = pathlib.PurePosixPath(config.root, subdir.strip("/") if subdir else "")
+    uri = f"file://{path}/"
+    if regex_filter:
+        uri = f"{uri}?regex={urllib.parse.quote_plus(regex_filter)}"
+    return uri
+
+
+def _scan_dir(
+    config: LocalConfig,
+    dir_key: str,
+    regex: re.Pattern | None = None,
+    file_extensions: list[str] = IMAGE_FILE_EXTENSIONS,
+    start_after: str | None = None,
+    modified_after: datetime.datetime | None = None,
+    root_key: str = "",
+) -> tuple[list[ObjectTypeDef], list[str], int]:
+    """
+    List and filter the files directly in one directory, and return its subdirectories. Runs in a worker thread.
+
+    Files are only stat'ed if their name passes the filters, which matters on network mounts.
+    Files are compared to the checkpoint with `_is_after_checkpoint`, relative to the directory `root_key`.
+    """
+    objects: list[ObjectTypeDef] = []
+    subdirs: list[str] = []
+    num_files_checked = 0
+    with os.scandir(full_path(config, dir_key)) as entries:
+        for entry in entries:
+            key = f"{dir_key}/{entry.name}" if dir_key else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                # Skip directories that were completely listed before, keep the one that contains the key
+                if not start_after or key > start_after or start_after.startswith(f"{key}/"):
+                    subdirs.append(key)
+            elif entry.is_file():
+                num_files_checked += 1
+                is_root_file = dir_key == root_key
+                if start_after and key <= start_after and not (modified_after and is_root_file):
+                    continue
+                # Check the name before the size, which needs a stat call
+                if not _filter_single_key(key, obj_size=1, regex=regex, file_extensions=file_extensions):
+                    continue
+                stat = entry.stat()
+                obj: ObjectTypeDef = {
+                    "Key": key,
+                    "Size": stat.st_size,
+                    "LastModified": datetime.datetime.fromtimestamp(stat.st_mtime, tz=datetime.timezone.utc),
+                }
+                root_prefix = f"{root_key}/" if root_key else ""
+                if stat.st_size > 0 and _is_after_checkpoint(obj, root_prefix, start_after, modified_after):
+                    objects.append(obj)
+    return objects, subdirs, num_files_checked
+
+
+def list_files(
+    config: LocalConfig,
+    subdir: str | None = None,
+    regex_filter: str | None = None,
+    file_extensions: list[str] = IMAGE_FILE_EXTENSIONS,
+    max_workers: int = 8,
+    start_after: str | None = None,
+    modified_after: datetime.datetime | None = None,
+) -> typing.Generator[tuple[ObjectTypeDef | None, int], typing.Any, None]:
+    """
+    Recursively list files in the directory, scanning subdirectories concurrently.
+
+    Yields the same values as `ami.utils.s3.list_files_paginated`, with the same filters, but not in key order.
+    """
+    regex = _compile_regex_filter(regex_filter)
+    logger.info(f"Scanning {make_full_prefix_uri(config, subdir, regex_filter)} with {max_workers} workers")
+
+    root_key = subdir.strip("/") if subdir else ""
+    num_files_checked = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+        def submit(dir_key: str) -> concurrent.futures.Future:
+            return executor.submit(
+                _scan_dir, config, dir_key, regex, file_extensions, start_after, modified_after, root_key
+            )
+
+        pending = {submit(root_key)}
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                objects, subdirs, dir_files_checked = future.result()
+                pending.update(submit(dir_key) for dir_key in subdirs)
+                for obj in objects:
+                    num_files_checked += 1
+                    yield obj, num_files_checked
+                num_files_checked += dir_files_checked - len(objects)
+
+    yield None, num_files_checked
+
+
+def count_files_by_prefix(
+    config: LocalConfig,
+    previous: dict[str, dict[str, typing.Any]] | None = None,
+    file_extensions: list[str] = IMAGE_FILE_EXTENSIONS,
+    max_workers: int = 8,
+) -> dict[str, dict[str, typing.Any]]:
+    """
+    Count the files and their total size under each top-level subdirectory.
+
+    Returns the same structure as `ami.utils.s3.count_files_by_prefix`: the subdirectories and last keys
+    are full paths, like the full keys in a bucket, and the files directly in the directory are counted
+    under the key "". Scanning a directory is cheap compared to listing a bucket, so everything is counted
+    again and `previous` is ignored.
+    """
+    root = pathlib.PurePosixPath(config.root)
+    results: dict[str, dict[str, typing.Any]] = {"": {"files": 0, "size": 0, "last_key": None}}
+    for obj, _ in list_files(config, file_extensions=file_extensions, max_workers=max_workers):
+        if not obj:
+            continue
+        key = obj["Key"]
+        if "/" in key:
+            prefix = f"{root / key.split('/', 1)[0]}/"
+            totals = results.setdefault(prefix, {"files": 0, "size": 0, "last_key": None})
+            totals["last_key"] = max(filter(None, [totals["last_key"], str(root / key)]))
+        else:
+            totals = results[""]
+        totals["files"] += 1
+        totals["size"] += obj["Size"]
+    return results
+
+
+def read_file(config: LocalConfig, key: str) -> bytes:
+    with open(full_path(config, key), "rb") as f:
+        return f.read()
+
+
+def read_image(config: LocalConfig, key: str) -> PIL.Image.Image:
+    """
+    Read an image from the directory and return as a PIL Image.
+    """
+    logger.info(f"Reading image {key} from {config.root}")
+    return PIL.Image.open(io.BytesIO(read_file(config, key)))
+
+
+def read_image_header(config: LocalConfig, key: str, header_size: int = IMAGE_HEADER_SIZE) -> PIL.Image.Image:
+    """
+    Read only the start of an image and return as a PIL Image, without the pixel data.
+
+    See `ami.utils.s3.read_image_header`.
+    """
+    with open(full_path(config, key), "rb") as f:
+        header = f.read(header_size)
+    try:
+        return PIL.Image.open(io.BytesIO(header))
+    except OSError:
+        if len(header) < header_size:
+            logger.error(f"Could not read image {key}")
+            raise
+    return read_image(config, key)
+
+
+def read_image_headers(
+    config: LocalConfig,
+    keys: typing.Iterable[str],
+    max_workers: int = 16,
+    header_size: int = IMAGE_HEADER_SIZE,
+) -> typing.Generator[tuple[str, PIL.Image.Image | None], typing.Any, None]:
+    """
+    Read the headers of many images concurrently with `read_image_header`.
+
+    See `ami.utils.s3.read_image_headers`.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(read_image_header, config, key, header_size): key for key in keys}
+        for future in concurrent.futures.as_completed(futures):
+            key = futures[future]
+            try:
+                yield key, future.result()
+            except Exception as e:
+                logger.error(f"Could not read header of image {key}: {e}")
+                yield key, None
+
+
+def read_exif(config: LocalConfig, key: str, header_size: int = EXIF_HEADER_SIZE) -> PIL.Image.Exif | None:
+    """
+    Read the EXIF data of an image without reading the rest of the file.
+
+    See `ami.utils.s3.read_exif`.
+    """
+    with open(full_path(config, key), "rb") as f:
+
+        def read_range(start: int, size: int) -> bytes:
+            f.seek(start)
+            return f.read(size)
+
+        header = f.read(header_size)
+        if not header.startswith(b"\xff\xd8"):
+            return read_image_header(config, key).getexif() or None
+        segment = read_exif_segment(header, read_range)
+    if not segment:
+        return None
+    exif = PIL.Image.Exif()
+    exif.load(segment)
+    return exif
+
+
+def read_exifs(
+    config: LocalConfig,
+    keys: typing.Iterable[str],
+    max_workers: int = 16,
+) -> typing.Generator[tuple[str, PIL.Image.Exif | None], typing.Any, None]:
+    """
+    Read the EXIF data of many images concurrently with `read_exif`.
+
+    See `ami.utils.s3.read_exifs`.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(read_exif, config, key): key for key in keys}
+        for future in concurrent.futures.as_completed(futures):
+            key = futures[future]
+            try:
+                yield key, future.result()
+            except Exception as e:
+                logger.error(f"Could not read EXIF data of image {key}: {e}")
+                yield key, None
+
+
+def public_url(config: LocalConfig, key: str) -> str | None:
+    """
+    Return the URL of a file on the static file server that serves the directory,
+    or None if no server is configured.
+    """
+    if not config.public_base_url:
+        return None
+    return urllib.parse.urljoin(f"{config.public_base_url.rstrip('/')}/", urllib.parse.quote(key.lstrip("/")))
+
+
+def test_connection(
+    config: LocalConfig,
+    subdir: str | None = None,
+    regex_filter: str | None = None,
+    file_extensions: list[str] = IMAGE_FILE_EXTENSIONS,
+) -> ConnectionTestResult:
+    """
+    Check that the directory can be read and return the same statistics as `ami.utils.s3.test_connection`.
+    """
+    start_time = time.time()
+    full_uri = make_full_prefix_uri(config, subdir, regex_filter)
+    error_code = None
+    error_message = None
+    first_file_found = None
+    num_files_checked = 0
+    prefix_exists = os.path.isdir(full_path(config, subdir or ""))
+    connection_successful = os.path.isdir(config.root)
+
+    if not connection_successful:
+        error_code = "DirectoryNotFound"
+        error_message = f"The directory {config.root} does not exist or is not mounted."
+    elif prefix_exists:
+        try:
+            for obj, num_files_checked in list_files(config, subdir, regex_filter, file_extensions, max_workers=1):
+                first_file_found = obj
+                break
+        except OSError as e:
+            error_code = e.__class__.__name__
+            error_message = str(e)
+            logger.error(f"Error reading {full_uri}: {e}")
+        else:
+            if not first_file_found:
+                error_code = "NoMatchingFilesFound"
+                error_message = "No files found at the specified location that match the provided regex filter."
+    else:
+        error_code = "NoFilesFound"
+        error_message = "No files found at the specified location."
+
+    total_time = time.time() - start_time
+    return ConnectionTestResult(
+        connection_successful=connection_successful,
+        prefix_exists=prefix_exists,
+        latency=total_time,
+        total_time=total_time,
+        error_message=error_message,
+        error_code=error_code,
+        files_checked=num_files_checked,
+        first_file_found=(
+            public_url(config, first_file_found["Key"]) or first_file_found["Key"] if first_file_found else None
+        ),
+        full_uri=full_uri,
+    )
@@ -1,9 +1,22 @@
+import codecs
+import collections
+import concurrent.futures
+import contextlib
+import csv
+import datetime
+import gzip
+import hashlib
 import io
+import json
 import logging
+import os
 import pathlib
 import random
 import re
+import shutil
 import string
+import tempfile
+import threading
 import time
 import typing
 import urllib.parse
@@ -18,6 +31,7 @@ import PIL
 import PIL.Image
 
 # @TODO don't use Django cache in utils if possible
+from django.conf import settings
 from django.core.cache import cache
 from mypy_boto3_s3.client import S3Client
 from mypy_boto3_s3.paginator import ListObjectsV2Paginator
@@ -25,7 +39,7 @@ from mypy_boto3_s3.service_resource import Bucket, ObjectSummary, S3ServiceResou
 from mypy_boto3_s3.type_defs import BucketTypeDef, CreateBucketOutputTypeDef, ObjectTypeDef, PaginatorConfigTypeDef
 from rich import print
 
-from .storages import IMAGE_FILE_EXTENSIONS, ConnectionTestResult
+from .storages import EXIF_HEADER_SIZE, IMAGE_FILE_EXTENSIONS, ConnectionTestResult, read_exif_segment
 
 logger = logging.getLogger(__name__)
 
@@ -98,7 +112,7 @@ def get_session(config: S3Config) -> boto3.session.Session:
     return session
 
 
-def get_s3_client(config: S3Config) -> S3Client:
+def _create_s3_client(config: S3Config, max_pool_connections: int) -> S3Client:
     session = get_session(config)
     if config.endpoint_url:
         client = session.client(
@@ -106,27 +120,95 @@ def get_s3_client(config: S3Config) -> S3Client:
             endpoint_url=config.endpoint_url,
             aws_access_key_id=config.access_key_id,
             aws_secret_access_key=config.secret_access_key,
-            config=botocore.config.Config(signature_version="s3v4"),
+            config=botocore.config.Config(signature_version="s3v4", max_pool_connections=max_pool_connections),
         )
     else:
         client = session.client(
             service_name="s3",
             aws_access_key_id=config.access_key_id,
             aws_secret_access_key=config.secret_access_key,
+            config=botocore.config.Config(max_pool_connections=max_pool_connections),
         )
     return client
 
 
-def get_resource(config: S3Config) -> S3ServiceResource:
+def _create_resource(config: S3Config, max_pool_connections: int) -> S3ServiceResource:
     session = get_session(config)
     s3 = session.resource(
         "s3",
         endpoint_url=config.endpoint_url,
         # api_version="s3v4",
+        config=botocore.config.Config(max_pool_connections=max_pool_connections),
     )
     return s3
 
 
+# Clients are thread-safe and shared by the whole process. Resources are not, so they are cached per thread.
+_client_cache: collections.OrderedDict[str, S3Client] = collections.OrderedDict()
+_client_cache_lock = threading.Lock()
+_resource_cache = threading.local()
+
+
+def _client_cache_key(config: S3Config, max_pool_connections: int) -> str:
+    """
+    The safe hash of the config, plus a digest of the credentials so that configs
+    which only differ by their credentials never share a client.
+    """
+    credentials = hashlib.sha256(f"{config.access_key_id}:{config.secret_access_key}".encode()).hexdigest()
+    return f"{config.safe_hash()}-{credentials}-{max_pool_connections}"
+
+
+def _get_or_create_cached(cache_dict: collections.OrderedDict, key: str, create: typing.Callable[[], typing.Any]):
+    """
+    Return the cached value for `key`, or create it. Drop the least recently used values above the max size.
+    """
+    if key in cache_dict:
+        cache_dict.move_to_end(key)
+        return cache_dict[key]
+    value = create()
+    cache_dict[key] = value
+    while len(cache_dict) > max(settings.S3_CLIENT_CACHE_SIZE, 1):
+        cache_dict.popitem(last=False)
+    return value
+
+
+def get_s3_client(config: S3Config, max_pool_connections: int | None = None) -> S3Client:
+    """
+    Return a client for the config, shared by all threads of the process.
+
+    Creating a client resolves credentials and endpoints and starts a new connection pool,
+    so clients are cached and reused. Up to `max_pool_connections` keep-alive connections are
+    kept open per client (`settings.S3_MAX_POOL_CONNECTIONS` by default).
+    """
+    max_pool_connections = max_pool_connections or settings.S3_MAX_POOL_CONNECTIONS
+    key = _client_cache_key(config, max_pool_connections)
+    with _client_cache_lock:
+        return _get_or_create_cached(_client_cache, key, lambda: _create_s3_client(config, max_pool_connections))
+
+
+def get_resource(config: S3Config, max_pool_connections: int | None = None) -> S3ServiceResource:
+    """
+    Return a service resource for the config. Resources are not thread-safe, so each thread has its own cache.
+    """
+    max_pool_connections = max_pool_connections or settings.S3_MAX_POOL_CONNECTIONS
+    key = _client_cache_key(config, max_pool_connections)
+    if not hasattr(_resource_cache, "resources"):
+        _resource_cache.resources = collections.OrderedDict()
+    return _get_or_create_cached(
+        _resource_cache.resources, key, lambda: _create_resource(config, max_pool_connections)
+    )
+
+
+def clear_client_cache():
+    """
+    Drop the cached clients of the process and the cached resources of the current thread.
+    """
+    with _client_cache_lock:
+        _client_cache.clear()
+    if hasattr(_resource_cache, "resources"):
+        _resource_cache.resources.clear()
+
+
 def create_bucket(config: S3Config, bucket_name: str, exists_ok: bool = True) -> CreateBucketOutputTypeDef | None:
     client = get_s3_client(config)
     try:
@@ -190,6 +272,87 @@ def count_files_paginated(config: S3Config) -> int:
     return count
 
 
+def _count_prefix(
+    client: S3Client,
+    bucket: str,
+    prefix: str,
+    file_extensions: list[str] = IMAGE_FILE_EXTENSIONS,
+) -> tuple[str, dict[str, typing.Any]]:
+    """
+    Count the files and their total size under a single prefix. Runs in a worker thread.
+    """
+    paginator: ListObjectsV2Paginator = client.get_paginator("list_objects_v2")
+    totals = {"files": 0, "size": 0, "last_key": None}
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            assert "Key" in obj and "Size" in obj, f"Key or Size is missing from object: {obj}"
+            totals["last_key"] = obj["Key"]
+            if _filter_single_key(obj["Key"], obj_size=obj["Size"], file_extensions=file_extensions):
+                totals["files"] += 1
+                totals["size"] += obj["Size"]
+    return prefix, totals
+
+
+def _prefix_has_new_keys(client: S3Client, bucket: str, prefix: str, last_key: str | None) -> bool:
+    response = client.list_objects_v2(Bucket=bucket, Prefix=prefix, StartAfter=last_key or "", MaxKeys=1)
+    return response.get("KeyCount", 0) > 0
+
+
+def count_files_by_prefix(
+    config: S3Config,
+    previous: dict[str, dict[str, typing.Any]] | None = None,
+    file_extensions: list[str] = IMAGE_FILE_EXTENSIONS,
+    max_workers: int = 8,
+) -> dict[str, dict[str, typing.Any]]:
+    """
+    Count the files and their total size under each top-level subdirectory of the prefix, concurrently.
+
+    Returns {prefix: {"files": int, "size": int, "last_key": str}}. Files directly under the prefix are
+    counted under the key "". Only files with one of the `file_extensions` are counted.
+
+    Pass the `previous` results to skip the prefixes that have no keys after the last key counted before,
+    which takes a single request per prefix. That detects new files in subdirectories whose file names
+    sort by time, like the date folders of captures, but not files that were deleted or replaced.
+    """
+    client = get_s3_client(config)
+    full_prefix = make_full_prefix(config)
+    previous = previous or {}
+
+    root_objects, prefixes = _list_one_level(client, config.bucket_name, full_prefix)
+    results: dict[str, dict[str, typing.Any]] = {"": {"files": 0, "size": 0, "last_key": None}}
+    for obj in root_objects:
+        assert "Key" in obj and "Size" in obj, f"Key or Size is missing from object: {obj}"
+        if _filter_single_key(obj["Key"], obj_size=obj["Size"], file_extensions=file_extensions):
+            results[""]["files"] += 1
+            results[""]["size"] += obj["Size"]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Check the previously counted prefixes for new keys first
+        checks = {}
+        for prefix in prefixes:
+            if prefix in previous:
+                last_key = previous[prefix].get("last_key")
+                checks[prefix] = executor.submit(_prefix_has_new_keys, client, config.bucket_name, prefix, last_key)
+        for prefix, future in checks.items():
+            if not future.result():
+                results[prefix] = previous[prefix]
+
+        to_count = [prefix for prefix in prefixes if prefix not in results]
+        logger.info(
+            f"Counting {len(to_count)} of {len(prefixes)} prefixes in {make_full_prefix_uri(config)} "
+            f"with {max_workers} workers"
+        )
+        futures = [
+            executor.submit(_count_prefix, client, config.bucket_name, prefix, file_extensions) for prefix in to_count
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            prefix, totals = future.result()
+            logger.debug(f"Counted {totals['files']} files in {prefix}")
+            results[prefix] = totals
+
+    return results
+
+
 def _compile_regex_filter(regex_filter: str | None) -> re.Pattern | None:
     regex = re.compile(str(regex_filter)) if regex_filter else None
     if regex:
@@ -225,6 +388,37 @@ def _filter_single_key(
     return True
 
 
+def _modified_after(obj: ObjectTypeDef, modified_after: datetime.datetime | None = None) -> bool:
+    """
+    Determine if an object has been modified since a watermark. Objects without a LastModified value are kept.
+    """
+    if modified_after is None or "LastModified" not in obj:
+        return True
+    return obj["LastModified"] > modified_after
+
+
+def _is_after_checkpoint(
+    obj: ObjectTypeDef,
+    full_prefix: str,
+    start_after: str | None = None,
+    modified_after: datetime.datetime | None = None,
+) -> bool:
+    """
+    Determine if an object is new since the checkpoint of an incremental sync.
+
+    Keys that sort after `start_after` are new. Files directly under the prefix (not in a subdirectory)
+    are also new if they were modified after `modified_after`, because their names don't always sort
+    after the last key. Files in subdirectories are only compared by key, so that copies which keep
+    their original modification time (e.g. `rsync -a`) are still found.
+    """
+    key = obj["Key"]
+    if not start_after or key > start_after:
+        return True
+    if modified_after is None:
+        return False
+    return "/" not in key.removeprefix(full_prefix) and _modified_after(obj, modified_after)
+
+
 def list_files(
     config: S3Config,
     limit: int | None = 100000,
@@ -266,6 +460,8 @@ def list_files_paginated(
     subdir: str | None = None,
     regex_filter: str | None = None,
     file_extensions: list[str] = IMAGE_FILE_EXTENSIONS,
+    start_after: str | None = None,
+    modified_after: datetime.datetime | None = None,
     **paginator_params: typing.Any,
 ) -> typing.Generator[tuple[ObjectTypeDef | None, int], typing.Any, None]:
     """
@@ -273,6 +469,10 @@ def list_files_paginated(
 
     Returns an ObjectTypeDef dict instead of an ObjectSummary object.
 
+    If `start_after` is a key, listing starts after that key (server-side). If `modified_after` is also set,
+    the files directly under the prefix that sort before that key are listed too if they were modified since,
+    see `_is_after_checkpoint`.
+
     @TODO Consider returning just the key instead of the full object so we
     can make list_files_paginated more consistent with list_files.
     """
@@ -288,6 +488,8 @@ def list_files_paginated(
     }
     if full_prefix:
         paginate_params["Prefix"] = full_prefix
+    if start_after:
+        paginate_params["StartAfter"] = start_after
 
     # Prepare pagination configuration
     pagination_config: PaginatorConfigTypeDef = {}
@@ -300,6 +502,20 @@ def list_files_paginated(
     regex = _compile_regex_filter(regex_filter)
 
     num_files_checked = 0
+    if start_after and modified_after:
+        # The server-side StartAfter also skips the files directly under the prefix that were changed since
+        root_objects, _ = _list_one_level(client, config.bucket_name, full_prefix)
+        for obj in root_objects:
+            assert "Key" in obj and "Size" in obj, f"Key or Size is missing from object: {obj}"
+            if obj["Key"] > start_after:
+                # Listed again below
+                continue
+            num_files_checked += 1
+            if _filter_single_key(
+                obj["Key"], obj_size=obj["Size"], regex=regex, file_extensions=file_extensions
+            ) and _is_after_checkpoint(obj, full_prefix, start_after, modified_after):
+                yield obj, num_files_checked
+
     for i, page in enumerate(page_iterator):
         if "Contents" in page:
             for obj in page["Contents"]:
@@ -315,6 +531,300 @@ def list_files_paginated(
     yield None, num_files_checked
 
 
+# Columns of an S3 inventory CSV file if there is no manifest to read them from
+INVENTORY_DEFAULT_SCHEMA = "Bucket, Key, Size, LastModifiedDate, ETag"
+
+# Parquet inventory files name their columns differently than the schema of CSV files
+INVENTORY_PARQUET_COLUMNS = {
+    "bucket": "Bucket",
+    "key": "Key",
+    "version_id": "VersionId",
+    "is_latest": "IsLatest",
+    "is_delete_marker": "IsDeleteMarker",
+    "size": "Size",
+    "last_modified_date": "LastModifiedDate",
+    "e_tag": "ETag",
+    "storage_class": "StorageClass",
+}
+
+
+def _open_inventory_file(config: S3Config, path: str, bucket: str | None = None) -> typing.BinaryIO:
+    """
+    Open a file of an S3 inventory from a file:// URI on the local disk, from an s3:// URI or from a key in the bucket.
+    """
+    if path.startswith("file://"):
+        return open(path.removeprefix("file://"), "rb")
+    if path.startswith("s3://"):
+        bucket, path = path.removeprefix("s3://").split("/", 1)
+    logger.debug(f"Reading inventory file s3://{bucket or config.bucket_name}/{path}")
+    response = get_s3_client(config).get_object(Bucket=bucket or config.bucket_name, Key=path)
+    return response["Body"]  # type: ignore
+
+
+def _read_inventory_records(
+    config: S3Config, path: str, file_format: str, file_schema: str, bucket: str | None = None
+) -> typing.Generator[dict[str, typing.Any], typing.Any, None]:
+    """
+    Stream the records of one data file of an S3 inventory as dicts of {column: value}.
+    """
+    with _open_inventory_file(config, path, bucket) as f:
+        if file_format.lower() == "parquet":
+            try:
+                import pyarrow.parquet
+            except ImportError as e:
+                raise ImportError("Reading Parquet inventory files requires the pyarrow package") from e
+            with contextlib.ExitStack() as stack:
+                if path.startswith("file://"):
+                    source: typing.BinaryIO = f
+                else:
+                    # Parquet needs random access to the file, so a download is spooled to disk first
+                    source = stack.enter_context(tempfile.TemporaryFile())
+                    shutil.copyfileobj(f, source)
+                    source.seek(0)
+                for batch in pyarrow.parquet.ParquetFile(source).iter_batches():
+                    for row in batch.to_pylist():
+                        yield {INVENTORY_PARQUET_COLUMNS.get(column, column): value for column, value in row.items()}
+        else:
+            stream = gzip.GzipFile(fileobj=f) if path.endswith(".gz") else f
+            columns = [column.strip() for column in file_schema.split(",")]
+            for row in csv.reader(codecs.getreader("utf-8")(stream)):
+                record = dict(zip(columns, row))
+                # Keys are URL-encoded in CSV inventory files
+                record["Key"] = urllib.parse.unquote_plus(record.get("Key", ""))
+                yield record
+
+
+def _inventory_record_to_object(record: dict[str, typing.Any]) -> ObjectTypeDef:
+    last_modified = record.get("LastModifiedDate")
+    if isinstance(last_modified, str):
+        last_modified = datetime.datetime.fromisoformat(last_modified.replace("Z", "+00:00"))
+    if isinstance(last_modified, datetime.datetime) and last_modified.tzinfo is None:
+        # Parquet timestamps are in UTC
+        last_modified = last_modified.replace(tzinfo=datetime.timezone.utc)
+    obj: ObjectTypeDef = {"Key": record["Key"], "Size": int(record.get("Size") or 0)}
+    if last_modified:
+        obj["LastModified"] = last_modified
+    if record.get("ETag"):
+        obj["ETag"] = record["ETag"]
+    return obj
+
+
+def get_inventory_creation_time(config: S3Config, inventory_path: str) -> datetime.datetime | None:
+    """
+    Return the time an S3 inventory report was created, from the creationTimestamp of its manifest.json.
+
+    Returns None for a single data file, or a manifest without a creation time.
+    """
+    if not inventory_path.endswith(".json"):
+        return None
+    with _open_inventory_file(config, inventory_path) as f:
+        manifest = json.load(f)
+    creation_timestamp = manifest.get("creationTimestamp")
+    if not creation_timestamp:
+        return None
+    # Milliseconds since the epoch
+    return datetime.datetime.fromtimestamp(int(creation_timestamp) / 1000, tz=datetime.timezone.utc)
+
+
+def list_files_from_inventory(
+    config: S3Config,
+    inventory_path: str,
+    subdir: str | None = None,
+    regex_filter: str | None = None,
+    file_extensions: list[str] = IMAGE_FILE_EXTENSIONS,
+    start_after: str | None = None,
+    modified_after: datetime.datetime | None = None,
+) -> typing.Generator[tuple[ObjectTypeDef | None, int], typing.Any, None]:
+    """
+    List files in a bucket from an S3 inventory report instead of listing the bucket.
+
+    `inventory_path` is the manifest.json of an inventory report, or a single CSV, CSV.gz or Parquet
+    data file (CSV files without a manifest must use the columns in `INVENTORY_DEFAULT_SCHEMA`).
+    Each may be a file:// URI of a local file, an s3:// URI or a key in the bucket. The data files listed
+    in a local manifest are read from the directory of the manifest if they were downloaded next to it,
+    otherwise from the destination bucket of the inventory.
+
+    Yields the same values as `list_files_paginated`, with the same filters.
+    """
+    if inventory_path.endswith(".json"):
+        with _open_inventory_file(config, inventory_path) as f:
+            manifest = json.load(f)
+        file_format = manifest.get("fileFormat", "CSV")
+        file_schema = manifest.get("fileSchema", INVENTORY_DEFAULT_SCHEMA)
+        destination_bucket = manifest.get("destinationBucket", "").split(":")[-1] or None
+        local_dir = (
+            os.path.dirname(inventory_path.removeprefix("file://")) if inventory_path.startswith("file://") else None
+        )
+        data_files = []
+        for data_file in manifest["files"]:
+            local_path = os.path.join(local_dir, os.path.basename(data_file["key"])) if local_dir else None
+            if local_path and os.path.exists(local_path):
+                data_files.append((f"file://{local_path}", None))
+            else:
+                data_files.append((data_file["key"], destination_bucket))
+    else:
+        file_format = "Parquet" if inventory_path.endswith(".parquet") else "CSV"
+        file_schema = INVENTORY_DEFAULT_SCHEMA
+        data_files = [(inventory_path, None)]
+
+    full_prefix = make_full_prefix(config, subdir)
+    full_uri = make_full_prefix_uri(config, subdir, regex_filter)
+    regex = _compile_regex_filter(regex_filter)
+    logger.info(f"Scanning {full_uri} from {len(data_files)} {file_format} inventory files in {inventory_path}")
+
+    num_files_checked = 0
+    for data_file_path, data_file_bucket in data_files:
+        for record in _read_inventory_records(config, data_file_path, file_format, file_schema, data_file_bucket):
+            if record.get("Bucket", config.bucket_name) != config.bucket_name:
+                continue
+            if not record["Key"].startswith(full_prefix):
+                continue
+            # Skip old versions and delete markers if the inventory includes all versions
+            if str(record.get("IsLatest", "true")).lower() != "true":
+                continue
+            if str(record.get("IsDeleteMarker", "false")).lower() == "true":
+                continue
+            num_files_checked += 1
+            obj = _inventory_record_to_object(record)
+            if not _is_after_checkpoint(obj, full_prefix, start_after, modified_after):
+                continue
+            if _filter_single_key(obj["Key"], obj_size=obj["Size"], regex=regex, file_extensions=file_extensions):
+                yield obj, num_files_checked
+
+    yield None, num_files_checked
+
+
+def _list_one_level(client: S3Client, bucket: str, prefix: str) -> tuple[list[ObjectTypeDef], list[str]]:
+    """
+    List the objects and the common prefixes (subdirectories) directly under a prefix.
+    """
+    paginator: ListObjectsV2Paginator = client.get_paginator("list_objects_v2")
+    objects: list[ObjectTypeDef] = []
+    prefixes: list[str] = []
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter="/"):
+        objects.extend(page.get("Contents", []))
+        prefixes.extend(item["Prefix"] for item in page.get("CommonPrefixes", []) if "Prefix" in item)
+    return objects, prefixes
+
+
+def _list_shard(
+    client: S3Client,
+    bucket: str,
+    prefix: str,
+    regex: re.Pattern | None = None,
+    file_extensions: list[str] = IMAGE_FILE_EXTENSIONS,
+    start_after: str | None = None,
+) -> tuple[str, list[ObjectTypeDef], int]:
+    """
+    Recursively list and filter all objects under a single prefix. Runs in a worker thread.
+    """
+    paginator: ListObjectsV2Paginator = client.get_paginator("list_objects_v2")
+    paginate_params: dict[str, typing.Any] = {"Bucket": bucket, "Prefix": prefix}
+    if start_after:
+        paginate_params["StartAfter"] = start_after
+    objects: list[ObjectTypeDef] = []
+    num_files_checked = 0
+    for page in paginator.paginate(**paginate_params):
+        for obj in page.get("Contents", []):
+            num_files_checked += 1
+            assert "Key" in obj and "Size" in obj, f"Key or Size is missing from object: {obj}"
+            if _filter_single_key(obj["Key"], obj_size=obj["Size"], regex=regex, file_extensions=file_extensions):
+                objects.append(obj)
+    return prefix, objects, num_files_checked
+
+
+def list_files_sharded(
+    config: S3Config,
+    subdir: str | None = None,
+    regex_filter: str | None = None,
+    file_extensions: list[str] = IMAGE_FILE_EXTENSIONS,
+    max_workers: int = 8,
+    on_shard_complete: typing.Callable[[str, int, int], None] | None = None,
+    start_after: str | None = None,
+    modified_after: datetime.datetime | None = None,
+) -> typing.Generator[tuple[ObjectTypeDef | None, int], typing.Any, None]:
+    """
+    List files in a bucket by splitting the listing into one shard per top-level subdirectory
+    (usually the date folders of a deployment) and listing the shards concurrently.
+
+    Yields the same values as `list_files_paginated`, but not in key order. Files that are
+    directly under the prefix are yielded first. `on_shard_complete` is called from the
+    consuming thread with (shard_prefix, shards_completed, shards_total) after the files
+    of each shard have been yielded.
+
+    If `start_after` is a key, shards that sort before the shard containing that key are skipped
+    entirely and the shard containing the key is listed starting after it. The files directly under
+    the prefix are filtered with `_is_after_checkpoint`, so `modified_after` only applies to them.
+    """
+    client = get_s3_client(config)
+    full_prefix = make_full_prefix(config, subdir)
+    full_uri = make_full_prefix_uri(config, subdir, regex_filter)
+    regex = _compile_regex_filter(regex_filter)
+
+    root_objects, shard_prefixes = _list_one_level(client, config.bucket_name, full_prefix)
+    if start_after:
+        # Prune shards that were completely listed before. Keep the shard that contains the key.
+        shard_prefixes = [
+            prefix for prefix in shard_prefixes if prefix > start_after or start_after.startswith(prefix)
+        ]
+    logger.info(f"Scanning {full_uri} in {len(shard_prefixes)} shards with {max_workers} workers")
+
+    num_files_checked = 0
+    for obj in root_objects:
+        num_files_checked += 1
+        assert "Key" in obj and "Size" in obj, f"Key or Size is missing from object: {obj}"
+        if _filter_single_key(
+            obj["Key"], obj_size=obj["Size"], regex=regex, file_extensions=file_extensions
+        ) and _is_after_checkpoint(obj, full_prefix, start_after, modified_after):
+            yield obj, num_files_checked
+
+    shards_total = len(shard_prefixes)
+    shards_completed = 0
+    pending_prefixes = iter(shard_prefixes)
+    # Only keep a bounded number of shards in flight so memory stays proportional to the number of workers
+    max_in_flight = max_workers * 2
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight: set[concurrent.futures.Future] = set()
+
+        def submit_next() -> bool:
+            prefix = next(pending_prefixes, None)
+            if prefix is None:
+                return False
+            shard_start_after = start_after if start_after and start_after.startswith(prefix) else None
+            in_flight.add(
+                executor.submit(
+                    _list_shard,
+                    client,
+                    config.bucket_name,
+                    prefix,
+                    regex,
+                    file_extensions,
+                    shard_start_after,
+                )
+            )
+            return True
+
+        while len(in_flight) < max_in_flight and submit_next():
+            pass
+
+        while in_flight:
+            done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                in_flight.remove(future)
+                prefix, objects, shard_files_checked = future.result()
+                logger.debug(f"Listed {len(objects)} of {shard_files_checked} files in shard {prefix}")
+                for obj in objects:
+                    num_files_checked += 1
+                    yield obj, num_files_checked
+                num_files_checked += shard_files_checked - len(objects)
+                shards_completed += 1
+                if on_shard_complete:
+                    on_shard_complete(prefix, shards_completed, shards_total)
+                submit_next()
+
+    yield None, num_files_checked
+
+
 def make_full_prefix(
     config: S3Config, subdir: str | None = None, with_bucket: bool = False, leading_slash: bool = False
 ) -> str:
@@ -591,6 +1101,101 @@ def read_image(config: S3Config, key: str) -> PIL.Image.Image:
     return img
 
 
+# Enough for the size, format and EXIF data of most JPEG and PNG files
+IMAGE_HEADER_SIZE = 64 * 1024
+
+
+def read_image_header(config: S3Config, key: str, header_size: int = IMAGE_HEADER_SIZE) -> PIL.Image.Image:
+    """
+    Read only the start of an image from S3 and return as a PIL Image, without the pixel data.
+
+    The size, format and EXIF data (`img.getexif()`) are available, but the pixel data
+    cannot be loaded. The whole image is downloaded instead if the header does not fit
+    in the first `header_size` bytes, e.g. when there is a large embedded color profile.
+    """
+    client = get_s3_client(config)
+    logger.debug(f"Fetching first {header_size} bytes of image {key} from S3")
+    header = client.get_object(Bucket=config.bucket_name, Key=key, Range=f"bytes=0-{header_size - 1}")["Body"].read()
+    try:
+        return PIL.Image.open(io.BytesIO(header))
+    except OSError as e:
+        if len(header) < header_size:
+            # We already have the whole file
+            logger.error(f"Could not read image {key}")
+            raise
+        logger.debug(f"Header of image {key} is larger than {header_size} bytes, fetching the whole image: {e}")
+    return read_image(config, key)
+
+
+def read_image_headers(
+    config: S3Config,
+    keys: typing.Iterable[str],
+    max_workers: int = 16,
+    header_size: int = IMAGE_HEADER_SIZE,
+) -> typing.Generator[tuple[str, PIL.Image.Image | None], typing.Any, None]:
+    """
+    Read the headers of many images concurrently with `read_image_header`.
+
+    Yields (key, image) in the order the reads complete. The image is None if it could not be read.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(read_image_header, config, key, header_size): key for key in keys}
+        for future in concurrent.futures.as_completed(futures):
+            key = futures[future]
+            try:
+                yield key, future.result()
+            except Exception as e:
+                logger.error(f"Could not read header of image {key}: {e}")
+                yield key, None
+
+
+def read_exif(config: S3Config, key: str, header_size: int = EXIF_HEADER_SIZE) -> PIL.Image.Exif | None:
+    """
+    Read the EXIF data of an image from S3 with ranged requests, without downloading the rest of the file.
+
+    The first `header_size` bytes of a JPEG file are read to find the EXIF segment. More requests are made
+    if the segments before it are larger than that, or if the EXIF segment itself is, see `read_exif_segment`.
+    The header of other image formats is read with `read_image_header`. Returns None if the image has no EXIF data.
+    """
+    client = get_s3_client(config)
+    logger.debug(f"Fetching EXIF data of image {key} from S3")
+
+    def read_range(start: int, size: int) -> bytes:
+        obj = client.get_object(Bucket=config.bucket_name, Key=key, Range=f"bytes={start}-{start + size - 1}")
+        return obj["Body"].read()
+
+    header = read_range(0, header_size)
+    if not header.startswith(b"\xff\xd8"):
+        return read_image_header(config, key).getexif() or None
+    segment = read_exif_segment(header, read_range)
+    if not segment:
+        return None
+    exif = PIL.Image.Exif()
+    exif.load(segment)
+    return exif
+
+
+def read_exifs(
+    config: S3Config,
+    keys: typing.Iterable[str],
+    max_workers: int = 16,
+) -> typing.Generator[tuple[str, PIL.Image.Exif | None], typing.Any, None]:
+    """
+    Read the EXIF data of many images concurrently with `read_exif`.
+
+    Yields (key, exif) in the order the reads complete. The EXIF data is None if it could not be read.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(read_exif, config, key): key for key in keys}
+        for future in concurrent.futures.as_completed(futures):
+            key = futures[future]
+            try:
+                yield key, future.result()
+            except Exception as e:
+                logger.error(f"Could not read EXIF data of image {key}: {e}")
+                yield key, None
+
+
 def public_url(config: S3Config, key: str):
     """
     Return public URL for a given key.
@@ -604,11 +1209,15 @@ def public_url(config: S3Config, key: str):
         return urllib.parse.urljoin(config.public_base_url, make_full_key_uri(config, key, with_protocol=False))
 
 
+def _presigned_url_cache_key(config: S3Config, key: str) -> str:
+    return f"s3_presigned_url:{config.safe_hash()}:{key}"
+
+
 def get_presigned_url(config: S3Config, key: str, expires_in: int = 60 * 60 * 24 * 7) -> str:
     """
     Generate a presigned URL for a given key.
     """
-    cache_key = f"s3_presigned_url:{config.safe_hash()}:{key}"
+    cache_key = _presigned_url_cache_key(config, key)
     url = cache.get(cache_key, default=None)
     if not url:
         logger.debug(f"Fetching new presigned URL for: {cache_key}")
@@ -624,6 +1233,33 @@ def get_presigned_url(config: S3Config, key: str, expires_in: int = 60 * 60 * 24
     return str(url)
 
 
+def get_presigned_urls(items: list[tuple[S3Config, str]], expires_in: int = 60 * 60 * 24 * 7) -> list[str]:
+    """
+    Generate presigned URLs for a list of (config, key) pairs, in the same order.
+
+    Cached URLs are fetched with a single round trip to the cache. The rest are signed
+    locally (no request is made to the object store) and cached with a single round trip.
+    """
+    cache_keys = [_presigned_url_cache_key(config, key) for config, key in items]
+    cached_urls = cache.get_many(cache_keys) if cache_keys else {}
+    new_urls = {}
+    urls = []
+    for (config, key), cache_key in zip(items, cache_keys):
+        url = cached_urls.get(cache_key) or new_urls.get(cache_key)
+        if not url:
+            url = get_s3_client(config).generate_presigned_url(
+                "get_object",
+                Params={"Bucket": config.bucket_name, "Key": key},
+                ExpiresIn=expires_in,
+            )
+            new_urls[cache_key] = url
+        urls.append(str(url))
+    if new_urls:
+        logger.debug(f"Generated {len(new_urls)} new presigned URLs, {len(cached_urls)} were cached")
+        cache.set_many(new_urls, timeout=expires_in)
+    return urls
+
+
 # Methods to resize all images under a prefix
 def resize_images(config: S3Config, prefix: str, width: int, height: int):
     bucket = get_bucket(config)
@@ -1,9 +1,94 @@
+import struct
+import typing
 from dataclasses import dataclass
 
 from storages.backends.s3boto3 import S3Boto3Storage
 
 IMAGE_FILE_EXTENSIONS = ["jpg", "jpeg", "png", "gif", "webp", "svg", "bmp", "ico", "tiff", "tif"]
 
+# Enough to find the EXIF segment of a JPEG file, which comes right after the start of the file
+EXIF_HEADER_SIZE = 4 * 1024
+
+# How many times to read further into a JPEG file when the segments before the EXIF data are larger than the header
+EXIF_MAX_EXTRA_READS = 8
+
+
+def find_exif_segment(header: bytes, header_offset: int = 0) -> tuple[int, int] | int | None:
+    """
+    Find the EXIF data (the APP1 segment) in the first bytes of a JPEG file.
+
+    `header` holds the bytes of the file from `header_offset`, which is either the start of the file
+    or the start of a segment returned by a previous call.
+
+    Returns the start and end offsets of the segment data in the file. The end can be past
+    the end of `header` if the segment is longer. If the segments before it go past the end of `header`,
+    returns the offset of the next segment instead, so that the rest can be read from there.
+    Returns None if the file is not a JPEG or if it has no EXIF data.
+
+    >>> find_exif_segment(b"\\xff\\xd8\\xff\\xe0\\x00\\x04ab\\xff\\xe1\\x00\\x10Exif\\x00\\x00abcd")
+    (12, 26)
+    >>> find_exif_segment(b"\\xff\\xd8\\xff\\xe0\\x01\\x00ab")
+    260
+    >>> find_exif_segment(b"\\xff\\xe1\\x00\\x10Exif\\x00\\x00abcd", header_offset=260)
+    (264, 278)
+    >>> find_exif_segment(b"\\x89PNG\\r\\n") is None
+    True
+    """
+    if header_offset:
+        offset = 0
+    elif header.startswith(b"\xff\xd8"):
+        offset = 2
+    else:
+        return None
+    while True:
+        if offset + 4 > len(header) or (header[offset + 1] == 0xE1 and offset + 10 > len(header)):
+            # The next segment does not fit in the header
+            return header_offset + offset if offset else None
+        if header[offset] != 0xFF:
+            return None
+        marker = header[offset + 1]
+        if marker == 0xFF:
+            # Fill byte
+            offset += 1
+            continue
+        if marker in (0xD9, 0xDA):
+            # End of image or start of the image data, there are no more metadata segments
+            return None
+        (length,) = struct.unpack_from(">H", header, offset + 2)
+        if marker == 0xE1 and header.startswith(b"Exif\x00\x00", offset + 4):
+            return header_offset + offset + 4, header_offset + offset + 2 + length
+        offset += 2 + length
+
+
+def read_exif_segment(header: bytes, read_range: typing.Callable[[int, int], bytes]) -> bytes | None:
+    """
+    Return the EXIF segment of a JPEG file from its first bytes, reading more of the file if needed.
+
+    `read_range(start, size)` returns up to `size` bytes of the file from offset `start`. If the segments
+    before the EXIF data go past the end of `header`, the next `len(header)` bytes are read from the next
+    segment, up to `EXIF_MAX_EXTRA_READS` times. The rest of the EXIF segment is read if it is longer.
+    Returns None if the file has no EXIF data.
+
+    >>> data = b"\\xff\\xd8\\xff\\xe0\\x01\\x00" + bytes(254) + b"\\xff\\xe1\\x00\\x10Exif\\x00\\x00abcdefgh"
+    >>> read_exif_segment(data[:16], lambda start, size: data[start : start + size])
+    b'Exif\\x00\\x00abcdefgh'
+    """
+    header_size = len(header)
+    header_offset = 0
+    segment = find_exif_segment(header)
+    for _ in range(EXIF_MAX_EXTRA_READS):
+        if not isinstance(segment, int):
+            break
+        header_offset = segment
+        header = read_range(header_offset, header_size)
+        segment = find_exif_segment(header, header_offset)
+    if not isinstance(segment, tuple):
+        return None
+    start, end = segment
+    if end > header_offset + len(header):
+        header += read_range(header_offset + len(header), end - header_offset - len(header))
+    return header[start - header_offset : end - header_offset]  # noqa: E203
+
 
 class StaticRootS3Boto3Storage(S3Boto3Storage):
     location = "static"
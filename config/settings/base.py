@@ -370,8 +370,32 @@ SPECTACULAR_SETTINGS = {
 # ------------------------------------------------------------------------------
 
 DEFAULT_CONFIDENCE_THRESHOLD = env.float("DEFAULT_CONFIDENCE_THRESHOLD", default=0.6)  # type: ignore[no-untyped-call]
+# Group captures into events with window functions in the database instead of in Python,
+# see ami.main.models.group_images_into_events
+EVENTS_GROUP_IN_DATABASE = env.bool("EVENTS_GROUP_IN_DATABASE", default=False)  # type: ignore[no-untyped-call]
+# Seconds to wait before recalculating the cached counts of objects marked as out of date,
+# so that the writes in that time are recalculated together, see ami.main.models.mark_for_recalculation
+PENDING_RECALCULATION_DELAY = env.int("PENDING_RECALCULATION_DELAY", default=10)  # type: ignore[no-untyped-call]
+# Seconds a maintenance task of a deployment waits before trying again if another one is running,
+# see ami.tasks.regroup_events
+DEPLOYMENT_TASK_RETRY_DELAY = env.int("DEPLOYMENT_TASK_RETRY_DELAY", default=30)  # type: ignore[no-untyped-call]
+# Seconds to wait for a batch of images to be processed by an ML backend, and how many times
+# to retry a failed batch, waiting up to ML_REQUEST_RETRY_BACKOFF seconds and twice as long after each retry
+ML_REQUEST_TIMEOUT = env.int("ML_REQUEST_TIMEOUT", default=5 * 60)  # type: ignore[no-untyped-call]
+ML_REQUEST_CONNECT_TIMEOUT = env.int("ML_REQUEST_CONNECT_TIMEOUT", default=10)  # type: ignore[no-untyped-call]
+ML_REQUEST_RETRIES = env.int("ML_REQUEST_RETRIES", default=3)  # type: ignore[no-untyped-call]
+ML_REQUEST_RETRY_BACKOFF = env.float("ML_REQUEST_RETRY_BACKOFF", default=2.0)  # type: ignore[no-untyped-call]
+# Keep-alive connections kept open per ML backend, see ami.ml.client.get_endpoint_client
+ML_REQUEST_POOL_SIZE = env.int("ML_REQUEST_POOL_SIZE", default=10)  # type: ignore[no-untyped-call]
+# Compress request bodies of at least this many bytes with gzip, if the ML backends support it
+ML_REQUEST_COMPRESS_MIN_SIZE = env.int("ML_REQUEST_COMPRESS_MIN_SIZE", default=None)  # type: ignore[no-untyped-call]
 
 S3_TEST_ENDPOINT = env("MINIO_ENDPOINT", default="http://minio:9000")  # type: ignore[no-untyped-call]
 S3_TEST_KEY = env("MINIO_ROOT_USER", default=None)  # type: ignore[no-untyped-call]
 S3_TEST_SECRET = env("MINIO_ROOT_PASSWORD", default=None)  # type: ignore[no-untyped-call]
 S3_TEST_BUCKET = env("MINIO_TEST_BUCKET", default="ami-test")  # type: ignore[no-untyped-call]
+
+# Number of boto3 clients cached per process (one per storage source config), see ami.utils.s3.get_s3_client
+S3_CLIENT_CACHE_SIZE = env.int("S3_CLIENT_CACHE_SIZE", default=32)  # type: ignore[no-untyped-call]
+# Keep-alive connections per client. Should be at least the number of threads that share a client.
+S3_MAX_POOL_CONNECTIONS = env.int("S3_MAX_POOL_CONNECTIONS", default=50)  # type: ignore[no-untyped-call]